@@ -0,0 +1,275 @@
+"""
+MCP Load Benchmark
+==================
+Drives the bridge with concurrent MCP clients and reports throughput, latency
+percentiles and peak memory per tool.
+
+The bridge runs as a streamable-HTTP server in a subprocess, pointed at the
+local fake Gemini endpoint from ``tests/fake_gemini.py``, so the numbers
+measure the bridge itself -- transport, caching, coalescing, concurrency
+limits and retries -- against an upstream with known latency and error rate.
+
+Each tool is benchmarked in turn: ``--clients`` MCP sessions share
+``--requests`` calls. ``--repeat`` is the fraction of calls that reuse an
+earlier prompt, which exercises the response cache and request coalescing.
+Peak RSS is the largest resident set size of the bridge process sampled while
+the tool's calls were running (Linux only).
+
+Run with: python benchmarks/load_benchmark.py [--clients 16] [--requests 200]
+          [--latency 0.2] [--error-rate 0.02] [--tools gemini_analyze_text,...]
+          [--json results.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PLUGIN_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PLUGIN_DIR / "tests"))
+
+from fake_gemini import FakeGemini  # noqa: E402
+from mcp import ClientSession  # noqa: E402
+from mcp.client.streamable_http import streamable_http_client  # noqa: E402
+
+CODEBASE = "\n\n".join(
+    f'<file path="src/module_{i}.py">\n'
+    + "".join(f"def f{i}_{j}(x):\n    return x + {j}\n" for j in range(50))
+    + "</file>"
+    for i in range(20)
+)
+
+
+def _arguments(tool: str, prompt: str) -> dict:
+    """Arguments for one call of tool; prompt makes the call unique."""
+    if tool == "gemini_analyze_text":
+        return {"prompt": prompt}
+    if tool == "gemini_compare_approaches":
+        return {"problem": prompt, "approach_a": "use a lock", "approach_b": "use a queue"}
+    if tool == "gemini_analyze_codebase":
+        return {"code_content": f"# {prompt}\n{CODEBASE}", "task": "Find bugs"}
+    if tool == "gemini_batch_analyze":
+        return {"template": "Classify: {input}", "inputs": [f"{prompt} item {i}" for i in range(5)]}
+    if tool == "gemini_status":
+        return {}
+    raise ValueError(f"No benchmark arguments for {tool}")
+
+
+DEFAULT_TOOLS = (
+    "gemini_analyze_text",
+    "gemini_compare_approaches",
+    "gemini_analyze_codebase",
+    "gemini_batch_analyze",
+    "gemini_status",
+)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port: int, proc: subprocess.Popen, timeout: float = 15.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"bridge exited early with code {proc.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"bridge did not listen on port {port}")
+
+
+def _rss_bytes(pid: int) -> int | None:
+    """Current resident set size of a process, or None where /proc is unavailable."""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile of values (0 < q <= 100)."""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+async def _sample_rss(pid: int, peak: list[int], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        rss = _rss_bytes(pid)
+        if rss is not None:
+            peak[0] = max(peak[0], rss)
+        try:
+            await asyncio.wait_for(stop.wait(), 0.05)
+        except TimeoutError:
+            pass
+
+
+async def _client(url: str, tool: str, prompts: list[str], latencies: list, errors: list):
+    async with streamable_http_client(url) as (read, write, _):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            for prompt in prompts:
+                start = time.perf_counter()
+                try:
+                    result = await session.call_tool(tool, _arguments(tool, prompt))
+                    failed = result.isError
+                except Exception:
+                    failed = True
+                latencies.append(time.perf_counter() - start)
+                errors.append(failed)
+
+
+async def bench_tool(
+    url: str, pid: int, tool: str, *, clients: int, requests: int, repeat: float, seed: int
+) -> dict:
+    rng = random.Random(seed)
+    prompts: list[str] = []
+    for i in range(requests):
+        reuse = prompts and rng.random() < repeat
+        prompts.append(rng.choice(prompts) if reuse else f"{tool} request {seed}-{i}")
+    assignments = [prompts[i::clients] for i in range(clients)]
+
+    latencies: list[float] = []
+    errors: list[bool] = []
+    peak = [_rss_bytes(pid) or 0]
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(_sample_rss(pid, peak, stop))
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(_client(url, tool, batch, latencies, errors) for batch in assignments if batch)
+    )
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await sampler
+    return {
+        "tool": tool,
+        "calls": len(latencies),
+        "errors": sum(errors),
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "peak_rss_mb": round(peak[0] / 1e6, 1) if peak[0] else None,
+    }
+
+
+async def run(args: argparse.Namespace) -> list[dict]:
+    fake = FakeGemini(
+        latency_s=args.latency,
+        latency_jitter_s=args.jitter,
+        error_rate=args.error_rate,
+        response_chars=args.response_chars,
+        seed=args.seed,
+    )
+    with fake, tempfile.TemporaryDirectory() as tmp:
+        port = _free_port()
+        env = {
+            **os.environ,
+            "GEMINI_API_KEY": "benchmark",
+            "GEMINI_BASE_URL": fake.base_url,
+            "GEMINI_CACHE_DIR": tmp,
+            "GEMINI_RETRY_BASE_DELAY": str(args.retry_delay),
+            "PYTHONPATH": str(PLUGIN_DIR),
+        }
+        command = [sys.executable, "-m", "gemini_bridge.server"]
+        command += ["--transport", "streamable-http", "--port", str(port)]
+        with open(Path(tmp) / "bridge.log", "wb") as log:
+            proc = subprocess.Popen(command, cwd=PLUGIN_DIR, env=env, stdout=log, stderr=log)
+        try:
+            _wait_for_port(port, proc)
+            url = f"http://127.0.0.1:{port}/mcp"
+            results = []
+            for tool in args.tools:
+                result = await bench_tool(
+                    url,
+                    proc.pid,
+                    tool,
+                    clients=args.clients,
+                    requests=args.requests,
+                    repeat=args.repeat,
+                    seed=args.seed,
+                )
+                results.append(result)
+                print(_format_row(result), flush=True)
+            print(
+                f"Upstream: {fake.total_requests()} requests, {fake.errors} injected errors, "
+                f"{len(fake.connections)} connections"
+            )
+            return results
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+
+
+HEADER = (
+    f"{'tool':<28} {'calls':>6} {'errors':>6} {'req/s':>8} "
+    f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'peak RSS':>9}"
+)
+
+
+def _format_row(result: dict) -> str:
+    rss = f"{result['peak_rss_mb']:.0f} MB" if result["peak_rss_mb"] else "n/a"
+    return (
+        f"{result['tool']:<28} {result['calls']:>6} {result['errors']:>6} "
+        f"{result['throughput_rps']:>8.1f} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} "
+        f"{result['p99_ms']:>8.1f} {rss:>9}"
+    )
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--clients", type=int, default=16, help="Concurrent MCP sessions")
+    parser.add_argument("--requests", type=int, default=200, help="Calls per tool")
+    parser.add_argument("--repeat", type=float, default=0.0, help="Fraction of repeated prompts")
+    parser.add_argument("--latency", type=float, default=0.2, help="Upstream seconds per call")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Extra random upstream seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of upstream 503s")
+    parser.add_argument("--response-chars", type=int, default=2000, help="Answer size")
+    parser.add_argument("--retry-delay", type=float, default=0.05, help="GEMINI_RETRY_BASE_DELAY")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--tools",
+        type=lambda value: [t.strip() for t in value.split(",") if t.strip()],
+        default=list(DEFAULT_TOOLS),
+        help="Comma-separated tools to benchmark",
+    )
+    parser.add_argument("--json", type=Path, help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+    for tool in args.tools:
+        _arguments(tool, "")
+
+    print(
+        f"{args.clients} clients, {args.requests} calls per tool, upstream "
+        f"{args.latency * 1000:.0f}+{args.jitter * 1000:.0f} ms, "
+        f"{args.error_rate:.0%} errors, {args.repeat:.0%} repeated prompts"
+    )
+    print(HEADER)
+    results = asyncio.run(run(args))
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+Response Cache
+==============
+Content-addressed cache for Gemini responses. Keys are SHA-256 hashes of the
+model, the assembled prompt and the generation config, so an agent that retries
+or re-plans with identical inputs gets the previous answer without another
+round-trip.
+
+Entries live in a small in-memory LRU in front of an on-disk SQLite store
+(default: ``$XDG_CACHE_HOME/gemini-bridge/responses.sqlite3``). Both tiers
+honour a TTL; the disk tier is additionally trimmed to a maximum size by
+evicting the least recently used entries.
+
+The disk tier is best-effort. Several stdio bridge processes may share one
+database (it runs in WAL mode with a busy timeout), and a locked or full
+database, or an unwritable cache directory, only logs a warning: the cache then
+behaves as a miss or keeps the entry in memory, so a response Gemini has already
+returned is never lost to a cache error.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024  # 100 MB
+DEFAULT_MAX_MEMORY_ENTRIES = 256
+# Seconds a writer waits for another process's lock before giving up.
+BUSY_TIMEOUT_SECONDS = 5.0
+
+logger = logging.getLogger(__name__)
+
+
+def default_cache_dir() -> Path:
+    """Return the bridge's cache directory, honouring GEMINI_CACHE_DIR and XDG_CACHE_HOME."""
+    if override := os.environ.get("GEMINI_CACHE_DIR"):
+        return Path(override).expanduser()
+    xdg = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(xdg).expanduser() / "gemini-bridge"
+
+
+class ResponseCache:
+    """Two-tier (memory LRU + SQLite) cache mapping request hashes to response text.
+
+    Thread-safe, so the async server can run disk lookups via ``asyncio.to_thread``.
+    Pass ``path=None`` for a memory-only cache; if the database cannot be opened
+    the cache is memory-only as well.
+    """
+
+    def __init__(
+        self,
+        path: Path | None,
+        *,
+        ttl: float = DEFAULT_TTL_SECONDS,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_memory_entries: int = DEFAULT_MAX_MEMORY_ENTRIES,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_memory_entries = max_memory_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+        if path is not None:
+            try:
+                self._db = self._open(path)
+            except (sqlite3.Error, OSError) as e:
+                logger.warning("Response cache at %s unavailable, using memory only: %s", path, e)
+
+    @staticmethod
+    def _open(path: Path) -> sqlite3.Connection:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(str(path), timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False)
+        try:
+            # WAL lets readers in other bridge processes proceed while one writes.
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            db.commit()
+        except sqlite3.Error:
+            db.close()
+            raise
+        return db
+
+    @staticmethod
+    def make_key(model: str, contents: str, config: dict) -> str:
+        """Hash the request inputs into a stable cache key."""
+        payload = json.dumps(
+            {"model": model, "contents": contents, "config": config},
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        """Return the cached response for key, or None on a miss or expired entry."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._memory[key]
+
+            if self._db is not None:
+                try:
+                    value = self._get_from_disk(key, now)
+                except sqlite3.Error as e:
+                    self._db.rollback()
+                    logger.warning("Response cache lookup failed, treating as a miss: %s", e)
+                    value = None
+                if value is not None:
+                    self.hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def _get_from_disk(self, key: str, now: float) -> str | None:
+        row = self._db.execute(
+            "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at > now:
+            self._remember(key, value, expires_at)
+            self._db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            return value
+        self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+        self._db.commit()
+        return None
+
+    def put(self, key: str, value: str) -> None:
+        """Store a response in both tiers and evict expired or excess entries."""
+        now = time.time()
+        expires_at = now + self.ttl
+        with self._lock:
+            self._remember(key, value, expires_at)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                        (key, value, len(value.encode("utf-8")), expires_at, now),
+                    )
+                    self._evict(now)
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    self._db.rollback()
+                    logger.warning("Response cache write failed, kept in memory only: %s", e)
+
+    def clear(self) -> None:
+        """Drop all entries from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def close(self) -> None:
+        """Close the SQLite connection; the memory tier keeps working."""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and current entry counts."""
+        with self._lock:
+            disk_entries = 0
+            if self._db is not None:
+                try:
+                    disk_entries = self._db.execute(
+                        "SELECT COUNT(*) FROM responses"
+                    ).fetchone()[0]
+                except sqlite3.Error as e:
+                    logger.warning("Could not count response cache entries: %s", e)
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+                "disk_entries": disk_entries,
+            }
+
+    def _remember(self, key: str, value: str, expires_at: float) -> None:
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self, now: float) -> None:
+        self._db.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._db.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at ASC"
+        ).fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._memory.pop(key, None)
+            total -= size
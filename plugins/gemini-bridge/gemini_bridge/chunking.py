@@ -0,0 +1,100 @@
+"""
+Chunking
+========
+Splits codebase blobs that exceed the model's context window into shards for
+map-reduce analysis.
+
+Content is split on file boundaries (``<file path="...">`` blocks as produced
+by ``ingest.format_files``, falling back to line boundaries for unmarked
+content) and packed into shards of at most ``max_tokens`` estimated tokens.
+Shard boundaries are chosen from a hash of each file's *path*, not its
+position or size, so editing one file normally changes only the shard that
+contains it and every other shard's prompt -- and cached result -- stays the
+same.
+"""
+
+import hashlib
+import re
+
+from gemini_bridge.tokens import CHARS_PER_TOKEN, estimate_tokens
+
+_FILE_BLOCK = re.compile(r'<file path="(?P<path>[^"]*)">\n.*?\n</file>', re.DOTALL)
+
+
+def split_files(code_content: str) -> list[tuple[str, str]]:
+    """Split a blob into (path, text) segments on ``<file path=...>`` boundaries.
+
+    Text outside file blocks is kept as its own segment so nothing is lost.
+    Unmarked content yields a single segment with an empty path.
+    """
+    segments = []
+    pos = 0
+    for match in _FILE_BLOCK.finditer(code_content):
+        between = code_content[pos : match.start()].strip()
+        if between:
+            segments.append(("", between))
+        segments.append((match.group("path"), match.group(0)))
+        pos = match.end()
+    rest = code_content[pos:].strip()
+    if rest:
+        segments.append(("", rest))
+    return segments
+
+
+def _split_lines(text: str, max_tokens: int) -> list[str]:
+    """Split an oversized segment on line boundaries into pieces under max_tokens."""
+    max_chars = int(max_tokens * CHARS_PER_TOKEN)
+    pieces, current, size = [], [], 0
+    for line in text.splitlines(keepends=True):
+        while len(line) > max_chars:
+            if current:
+                pieces.append("".join(current))
+                current, size = [], 0
+            pieces.append(line[:max_chars])
+            line = line[max_chars:]
+        if size + len(line) > max_chars and current:
+            pieces.append("".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line)
+    if current:
+        pieces.append("".join(current))
+    return pieces
+
+
+def _is_anchor(path: str, every: int) -> bool:
+    digest = hashlib.sha256(path.encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "big") % every == 0
+
+
+def make_shards(code_content: str, max_tokens: int) -> list[str]:
+    """Pack a codebase blob into shards of at most max_tokens estimated tokens."""
+    if estimate_tokens(code_content) <= max_tokens:
+        return [code_content]
+
+    segments = []
+    for path, text in split_files(code_content):
+        if estimate_tokens(text) > max_tokens:
+            segments.extend((path, piece) for piece in _split_lines(text, max_tokens))
+        else:
+            segments.append((path, text))
+
+    # Aim for shards about half full so a growing file rarely forces a split;
+    # "every" is coarse enough that small edits do not change it.
+    avg_tokens = max(1, estimate_tokens(code_content) // max(1, len(segments)))
+    every = max(1, (max_tokens // 2) // avg_tokens)
+
+    shards, current, size = [], [], 0
+    for path, text in segments:
+        tokens = estimate_tokens(text)
+        if current and size + tokens > max_tokens:
+            shards.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(text)
+        size += tokens
+        if path and _is_anchor(path, every):
+            shards.append("\n\n".join(current))
+            current, size = [], 0
+    if current:
+        shards.append("\n\n".join(current))
+    return shards
@@ -0,0 +1,249 @@
+"""
+Payload Compaction
+==================
+Removes redundancy from codebase blobs before they are sent to Gemini.
+
+Pasted or collected codebases often carry content that costs tokens without
+helping the analysis. ``compact_codebase`` works on the ``<file path="...">`` blocks
+produced by ``ingest.format_files`` and:
+
+- drops lock files, minified bundles, source maps and other generated files
+  (matched by pattern, plus a line-length heuristic for minified code) and
+  lists them by path in an ``<omitted_files>`` block;
+- replaces files whose content is identical to an earlier file with a
+  ``<file path="..." duplicate_of="..." />`` reference;
+- removes leading license / copyright comment headers, trailing whitespace
+  and runs of blank lines;
+- with ``strip_comments``, also removes full-line comments and all blank
+  lines, using the comment syntax of each file's extension (or of the
+  language hint for unmarked content).
+
+Compaction is lossy. Lines are processed without parsing the language, so
+whitespace normalization also applies inside multi-line strings, and comment
+stripping also removes lines of docstrings and multi-line strings that start
+with a comment marker. A comment after code on the same line is kept. Content
+outside file blocks is only whitespace-normalized unless a language hint gives
+its comment syntax. CSS has no line comments, so it is only whitespace-normalized.
+"""
+
+import fnmatch
+import hashlib
+import re
+from dataclasses import dataclass, field
+from pathlib import PurePosixPath
+
+from gemini_bridge.chunking import split_files
+
+# Matched against the full path and the file name.
+DEFAULT_DROP_PATTERNS = (
+    "package-lock.json",
+    "npm-shrinkwrap.json",
+    "yarn.lock",
+    "pnpm-lock.yaml",
+    "bun.lockb",
+    "poetry.lock",
+    "Pipfile.lock",
+    "uv.lock",
+    "pdm.lock",
+    "Cargo.lock",
+    "Gemfile.lock",
+    "composer.lock",
+    "go.sum",
+    "mix.lock",
+    "*.min.js",
+    "*.min.css",
+    "*.map",
+    "*_pb2.py",
+    "*_pb2_grpc.py",
+    "*.pb.go",
+    "*.generated.*",
+    "*.g.dart",
+)
+# A file whose longest line exceeds this and whose lines average more than
+# MINIFIED_AVG_LINE is treated as minified.
+MINIFIED_MAX_LINE = 1000
+MINIFIED_AVG_LINE = 300
+
+_HASH = ("#",)
+_SLASH = ("//",)
+_DASH = ("--",)
+_COMMENT_STYLES = {
+    **dict.fromkeys(
+        ["py", "pyi", "sh", "bash", "zsh", "rb", "pl", "r", "yaml", "yml", "toml", "cfg",
+         "conf", "tf", "cmake", "mk", "dockerfile", "makefile", "ps1", "nim", "jl"],
+        _HASH,
+    ),
+    **dict.fromkeys(
+        ["c", "h", "cc", "cpp", "cxx", "hpp", "hh", "m", "mm", "java", "js", "jsx", "mjs",
+         "cjs", "ts", "tsx", "go", "rs", "swift", "kt", "kts", "scala", "cs", "php", "dart",
+         "proto", "groovy", "gradle", "zig", "scss", "less", "sol"],
+        _SLASH,
+    ),
+    **dict.fromkeys(["sql", "lua", "hs", "elm", "ada"], _DASH),
+}
+# Language hints (lower-case) for unmarked content.
+_LANGUAGE_EXTENSIONS = {
+    "python": "py",
+    "shell": "sh",
+    "bash": "sh",
+    "ruby": "rb",
+    "perl": "pl",
+    "yaml": "yaml",
+    "toml": "toml",
+    "terraform": "tf",
+    "c": "c",
+    "c++": "cpp",
+    "cpp": "cpp",
+    "objective-c": "m",
+    "java": "java",
+    "javascript": "js",
+    "typescript": "ts",
+    "go": "go",
+    "golang": "go",
+    "rust": "rs",
+    "swift": "swift",
+    "kotlin": "kt",
+    "scala": "scala",
+    "c#": "cs",
+    "csharp": "cs",
+    "php": "php",
+    "dart": "dart",
+    "css": "css",
+    "sql": "sql",
+    "lua": "lua",
+    "haskell": "hs",
+}
+# Languages whose block comments (/* ... */) are removed when they span whole lines.
+_BLOCK_COMMENTS = {ext for ext, style in _COMMENT_STYLES.items() if style is _SLASH}
+
+_FILE_BODY = re.compile(r'<file path="(?P<path>[^"]*)">\n(?P<body>.*)\n</file>', re.DOTALL)
+_LICENSE = re.compile(r"copyright|licen[cs]e|spdx-license-identifier", re.IGNORECASE)
+
+
+@dataclass
+class CompactionReport:
+    files: int = 0
+    dropped: list[str] = field(default_factory=list)
+    duplicates: int = 0
+    bytes_before: int = 0
+    bytes_after: int = 0
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.bytes_before - self.bytes_after
+
+
+def _extension(path: str) -> str:
+    name = PurePosixPath(path).name.lower()
+    if name in ("dockerfile", "makefile"):
+        return name
+    return name.rsplit(".", 1)[-1] if "." in name else ""
+
+
+def should_drop(path: str, body: str, patterns: tuple[str, ...] = DEFAULT_DROP_PATTERNS) -> bool:
+    """True for lock files, generated files and minified code."""
+    name = PurePosixPath(path).name
+    if any(fnmatch.fnmatch(path, p) or fnmatch.fnmatch(name, p) for p in patterns):
+        return True
+    lines = body.splitlines() or [""]
+    longest = max(len(line) for line in lines)
+    return longest > MINIFIED_MAX_LINE and len(body) / len(lines) > MINIFIED_AVG_LINE
+
+
+def _strip_license_header(lines: list[str], markers: tuple[str, ...], block: bool) -> list[str]:
+    """Remove a leading comment block that mentions a copyright or license."""
+    start = 1 if lines and lines[0].startswith("#!") else 0
+    end = start
+    while end < len(lines) and not lines[end].strip():
+        end += 1
+    if block and end < len(lines) and lines[end].lstrip().startswith("/*"):
+        close = next((i for i in range(end, len(lines)) if "*/" in lines[i]), None)
+        if close is None or lines[close].split("*/", 1)[1].strip():
+            return lines
+        end = close + 1
+    else:
+        while end < len(lines) and lines[end].lstrip().startswith(markers):
+            end += 1
+    if end == start or not _LICENSE.search("\n".join(lines[start:end])):
+        return lines
+    return lines[:start] + lines[end:]
+
+
+def _strip_comment_lines(lines: list[str], markers: tuple[str, ...], block: bool) -> list[str]:
+    kept = []
+    in_block = False
+    for line in lines:
+        stripped = line.lstrip()
+        if in_block:
+            if "*/" in line:
+                in_block = False
+            continue
+        if block and stripped.startswith("/*"):
+            if "*/" not in stripped:
+                in_block = True
+                continue
+            if not stripped.split("*/", 1)[1].strip():
+                continue
+        if stripped.startswith(markers) and not stripped.startswith("#!"):
+            continue
+        kept.append(line)
+    return kept
+
+
+def compact_text(text: str, extension: str = "", *, strip_comments: bool = False) -> str:
+    """Compact one file's text; extension selects the comment syntax."""
+    lines = [line.rstrip() for line in text.splitlines()]
+    markers = _COMMENT_STYLES.get(extension)
+    block = extension in _BLOCK_COMMENTS
+    if markers:
+        lines = _strip_license_header(lines, markers, block)
+        if strip_comments:
+            lines = _strip_comment_lines(lines, markers, block)
+    if strip_comments:
+        lines = [line for line in lines if line]
+    else:
+        lines = [
+            line for i, line in enumerate(lines) if line or (i > 0 and lines[i - 1])
+        ]
+    return "\n".join(lines).strip("\n")
+
+
+def compact_codebase(
+    code_content: str,
+    *,
+    strip_comments: bool = False,
+    language: str | None = None,
+    drop_patterns: tuple[str, ...] = DEFAULT_DROP_PATTERNS,
+) -> tuple[str, CompactionReport]:
+    """Return the compacted blob and a report of what was removed."""
+    report = CompactionReport(bytes_before=len(code_content.encode("utf-8")))
+    hint = _LANGUAGE_EXTENSIONS.get((language or "").strip().lower(), "")
+    seen: dict[str, str] = {}
+    parts = []
+    for path, segment in split_files(code_content):
+        match = _FILE_BODY.fullmatch(segment) if path else None
+        if match is None:
+            parts.append(compact_text(segment, hint, strip_comments=strip_comments))
+            continue
+        report.files += 1
+        body = match.group("body")
+        if should_drop(path, body, drop_patterns):
+            report.dropped.append(path)
+            continue
+        digest = hashlib.sha256(body.encode("utf-8")).hexdigest()
+        if digest in seen:
+            report.duplicates += 1
+            parts.append(f'<file path="{path}" duplicate_of="{seen[digest]}" />')
+            continue
+        seen[digest] = path
+        text = compact_text(body, _extension(path) or hint, strip_comments=strip_comments)
+        parts.append(f'<file path="{path}">\n{text}\n</file>')
+    if report.dropped:
+        parts.append(
+            '<omitted_files reason="lock, generated or minified files">\n'
+            + "\n".join(report.dropped)
+            + "\n</omitted_files>"
+        )
+    result = "\n\n".join(part for part in parts if part)
+    report.bytes_after = len(result.encode("utf-8"))
+    return result, report
@@ -0,0 +1,122 @@
+"""
+Context Cache Registry
+======================
+Tracks Gemini cached-content objects created for large, repeatedly analyzed
+inputs (typically a codebase blob passed to ``gemini_analyze_codebase``).
+
+The blob is uploaded once via ``client.aio.caches.create`` and later requests
+reference it by name instead of resending up to 1M tokens. Entries are keyed
+by a hash of model, system instruction and content, expire slightly before
+their server-side TTL, and the least recently used entry is deleted upstream
+once ``max_entries`` is exceeded.
+
+The registry does not talk to Gemini itself: callers pass ``create`` and
+``delete`` coroutines, which keeps it independent of the SDK and easy to test.
+"""
+
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+
+from gemini_bridge.singleflight import KeyedLock
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = 3600
+DEFAULT_MAX_ENTRIES = 8
+# Gemini rejects cached contents below a model-specific minimum (a few thousand
+# tokens); skip the round-trip for blobs that are clearly too small.
+MIN_CACHEABLE_CHARS = 16_000
+# Stop handing out a cache this many seconds before it expires upstream.
+EXPIRY_MARGIN_SECONDS = 30
+
+CreateFn = Callable[[int], Awaitable[str]]
+DeleteFn = Callable[[str], Awaitable[None]]
+
+
+@dataclass
+class _Entry:
+    name: str
+    expires_at: float
+
+
+class ContextCacheRegistry:
+    """LRU + TTL registry mapping content hashes to Gemini cached-content names."""
+
+    def __init__(
+        self,
+        *,
+        ttl_seconds: int = DEFAULT_TTL_SECONDS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.created = 0
+        self.reused = 0
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._locks = KeyedLock()
+
+    @staticmethod
+    def make_key(model: str, content: str, system_instruction: str = "") -> str:
+        """Hash the cached inputs into a registry key."""
+        digest = hashlib.sha256()
+        for part in (model, system_instruction, content):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    async def get_or_create(self, key: str, create: CreateFn, delete: DeleteFn) -> str:
+        """Return the cached-content name for key, creating it upstream if needed.
+
+        Concurrent callers for the same key share a single ``create`` call.
+        """
+        async with self._locks.hold(key):
+            await self._evict_expired(delete)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.reused += 1
+                return entry.name
+
+            name = await create(self.ttl_seconds)
+            self._entries[key] = _Entry(
+                name=name,
+                expires_at=time.monotonic() + self.ttl_seconds - EXPIRY_MARGIN_SECONDS,
+            )
+            self.created += 1
+            while len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                await _safe_delete(delete, evicted.name)
+            return name
+
+    async def invalidate(self, key: str, delete: DeleteFn) -> None:
+        """Forget key and delete its cached content upstream (best effort)."""
+        async with self._locks.hold(key):
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                await _safe_delete(delete, entry.name)
+
+    async def clear(self, delete: DeleteFn) -> None:
+        """Delete every tracked cached content upstream."""
+        while self._entries:
+            _, entry = self._entries.popitem(last=False)
+            await _safe_delete(delete, entry.name)
+
+    def stats(self) -> dict:
+        return {"active": len(self._entries), "created": self.created, "reused": self.reused}
+
+    async def _evict_expired(self, delete: DeleteFn) -> None:
+        now = time.monotonic()
+        for key in [k for k, e in self._entries.items() if e.expires_at <= now]:
+            await _safe_delete(delete, self._entries.pop(key).name)
+
+
+async def _safe_delete(delete: DeleteFn, name: str) -> None:
+    try:
+        await delete(name)
+    except Exception as e:
+        # Upstream TTL cleans up anyway; a failed delete must not fail the tool call.
+        logger.warning("Failed to delete cached content %s: %s", name, e)
@@ -0,0 +1,72 @@
+"""
+Image Pre-processing
+====================
+Downscales raster images before they are sent to Gemini.
+
+Gemini bills images by 768x768 tile and rarely needs more than a couple of
+tiles to read a screenshot, so a 4K PNG mostly costs upload time. Images whose
+longest edge exceeds ``max_edge`` are resized (keeping the aspect ratio) and
+re-encoded in their original format: PNG stays lossless, so text in
+screenshots keeps sharp edges, and JPEG / WebP are written at ``quality``.
+Images that need no resizing are sent byte for byte.
+
+Pillow is optional: without it images are sent unchanged.
+"""
+
+import io
+import logging
+
+from gemini_bridge.lazy import is_installed
+
+logger = logging.getLogger(__name__)
+
+# Formats Pillow can safely re-encode; GIFs may be animated and PDFs are not images.
+RASTER_MIME_TYPES = {"image/png", "image/jpeg", "image/webp"}
+_PILLOW_FORMATS = {"image/png": "PNG", "image/jpeg": "JPEG", "image/webp": "WEBP"}
+DEFAULT_MAX_EDGE = 1536
+DEFAULT_QUALITY = 85
+
+
+def pillow_available() -> bool:
+    return is_installed("PIL")
+
+
+def prepare_image(
+    data: bytes,
+    mime_type: str,
+    *,
+    max_edge: int = DEFAULT_MAX_EDGE,
+    quality: int = DEFAULT_QUALITY,
+) -> tuple[bytes, str]:
+    """Return (bytes, mime type) of the image to send, downscaled if needed.
+
+    The original is returned unchanged when Pillow is missing, the format is
+    not a re-encodable raster format, max_edge is 0, the image is no larger
+    than max_edge, or it cannot be decoded. The mime type never changes.
+    """
+    if max_edge <= 0 or mime_type not in RASTER_MIME_TYPES or not pillow_available():
+        return data, mime_type
+
+    from PIL import Image, ImageOps
+
+    try:
+        with Image.open(io.BytesIO(data)) as opened:
+            if max(opened.size) <= max_edge:
+                return data, mime_type
+            image = ImageOps.exif_transpose(opened)
+            image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+            return _encode(image, _PILLOW_FORMATS[mime_type], quality), mime_type
+    except Exception as e:
+        logger.warning("Could not pre-process image, sending it unchanged: %s", e)
+        return data, mime_type
+
+
+def _encode(image, image_format: str, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    if image_format == "PNG":
+        image.save(buffer, format="PNG", optimize=True)
+    elif image_format == "JPEG":
+        image.convert("RGB").save(buffer, format="JPEG", quality=quality, optimize=True)
+    else:
+        image.save(buffer, format=image_format, quality=quality)
+    return buffer.getvalue()
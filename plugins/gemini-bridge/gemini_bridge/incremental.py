@@ -0,0 +1,124 @@
+"""
+Incremental Analysis
+====================
+Per-root file hashes and summaries that let a follow-up codebase analysis send
+only what changed.
+
+After an analysis of a root and a set of path patterns, ``AnalysisStore``
+records each file's content hash and a short summary of the file. The next
+analysis of the same root and patterns is planned with ``plan_analysis``: new and
+changed files are sent in full, unchanged files as their stored summary, and
+removed files are listed by path. Files without a stored summary count as
+changed, so a failed summary only costs sending that file again.
+
+State is one JSON file per root and pattern set, replaced atomically; with
+``directory=None`` it is kept in memory only.
+"""
+
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from gemini_bridge.ingest import SourceFile
+
+STATE_VERSION = 1
+
+
+def digest_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class Plan:
+    changed: list[SourceFile] = field(default_factory=list)
+    unchanged: list[tuple[str, str]] = field(default_factory=list)  # (path, summary)
+    removed: list[str] = field(default_factory=list)
+
+
+class AnalysisStore:
+    """Hashes and summaries of the files of previously analyzed roots."""
+
+    def __init__(self, directory: Path | None):
+        self.directory = directory
+        self._memory: dict[str, dict] = {}
+
+    @staticmethod
+    def _key(root: Path, patterns: list[str]) -> str:
+        identity = json.dumps([str(root), sorted(patterns)]).encode("utf-8")
+        return hashlib.sha256(identity).hexdigest()[:16]
+
+    def load(self, root: Path, patterns: list[str]) -> dict[str, dict] | None:
+        """Return {path: {"sha256", "summary"}} from the last analysis, or None."""
+        key = self._key(root, patterns)
+        if self.directory is None:
+            state = self._memory.get(key)
+        else:
+            try:
+                state = json.loads((self.directory / f"{key}.json").read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                return None
+        if state is None:
+            return None
+        if state.get("version") != STATE_VERSION or state.get("root") != str(root):
+            return None
+        return state["files"]
+
+    def save(
+        self, root: Path, patterns: list[str], files: list[SourceFile], summaries: dict[str, str]
+    ) -> int:
+        """Record the analyzed files that have a summary; return how many were recorded."""
+        records = {
+            file.path: {"sha256": digest_text(file.content), "summary": summaries[file.path]}
+            for file in files
+            if summaries.get(file.path)
+        }
+        state = {
+            "version": STATE_VERSION,
+            "root": str(root),
+            "patterns": sorted(patterns),
+            "files": dict(sorted(records.items())),
+        }
+        key = self._key(root, patterns)
+        if self.directory is None:
+            self._memory[key] = state
+            return len(records)
+        path = self.directory / f"{key}.json"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(state), encoding="utf-8")
+        os.replace(tmp, path)
+        return len(records)
+
+
+def plan_analysis(files: list[SourceFile], previous: dict[str, dict]) -> Plan:
+    """Split files into changed ones and unchanged ones with a stored summary."""
+    result = Plan()
+    for file in files:
+        record = previous.get(file.path)
+        if record and record["sha256"] == digest_text(file.content):
+            result.unchanged.append((file.path, record["summary"]))
+        else:
+            result.changed.append(file)
+    current = {file.path for file in files}
+    result.removed = sorted(path for path in previous if path not in current)
+    return result
+
+
+def format_plan(plan: Plan) -> str:
+    """Render a plan as a code blob: full files, then summaries and removals."""
+    parts = [
+        "<note>This is a follow-up analysis. Files in <file> blocks are new or changed "
+        "since the previous analysis and are shown in full. Unchanged files are shown "
+        "only as <file_summary> blocks written during the previous analysis; if an "
+        "answer depends on details a summary does not give, say so.</note>"
+    ]
+    parts += [f'<file path="{f.path}">\n{f.content}\n</file>' for f in plan.changed]
+    parts += [
+        f'<file_summary path="{path}">\n{summary}\n</file_summary>'
+        for path, summary in plan.unchanged
+    ]
+    if plan.removed:
+        parts.append("<removed_files>\n" + "\n".join(plan.removed) + "\n</removed_files>")
+    return "\n\n".join(parts)
@@ -0,0 +1,344 @@
+"""
+Repository Index
+================
+Local embedding index for retrieval-augmented questions about a repository.
+
+Files under the root are split into line-based chunks, embedded, and stored as
+unit-length float32 vectors in ``vectors.npy`` (opened memory-mapped, so a
+large index is not read into memory) next to a ``meta.json`` sidecar with the
+chunk locations and each file's mtime, size and content hash. A query is one
+matrix-vector product over the memory map followed by a partial sort, and only
+the top-k chunks are sent to Gemini.
+
+Re-indexing is incremental: files whose mtime and size are unchanged are not
+read, files whose content hash is unchanged are not re-embedded, and their
+vectors are copied over from the previous index. Both files are replaced
+atomically, so a concurrent reader sees either the old or the new index. In
+memory, the chunk list and its vectors form one immutable ``_Snapshot`` that an
+update swaps in a single assignment, so ``search`` (which runs in a worker
+thread, outside the update lock) never pairs new rows with old chunks.
+
+Like ``UploadCache`` the index does not talk to Gemini itself: callers pass an
+``embed`` coroutine. NumPy is optional (``pip install 'gemini-bridge[index]'``).
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from gemini_bridge.ingest import collect_files, read_text_file
+from gemini_bridge.lazy import is_installed
+
+logger = logging.getLogger(__name__)
+
+CHUNK_LINES = 60
+CHUNK_CHARS = 3000
+EMBED_BATCH = 100
+# Bump when the chunking or file layout changes; older indexes are rebuilt.
+INDEX_VERSION = 1
+
+EmbedFn = Callable[[list[str]], Awaitable[list[list[float]]]]
+
+
+def numpy_available() -> bool:
+    return is_installed("numpy")
+
+
+@dataclass(frozen=True)
+class Chunk:
+    """Lines start_line..end_line (1-based, inclusive) of a root-relative file."""
+
+    path: str
+    start_line: int
+    end_line: int
+
+
+@dataclass(frozen=True)
+class _Snapshot:
+    """The indexed chunks and their unit vectors; row i belongs to chunks[i]."""
+
+    chunks: list[Chunk]
+    vectors: Any = None  # memory-mapped (len(chunks), dim) float32 array, or None
+
+
+def chunk_text(
+    text: str, *, max_lines: int = CHUNK_LINES, max_chars: int = CHUNK_CHARS
+) -> list[tuple[int, int, str]]:
+    """Split text into (start_line, end_line, text) chunks on line boundaries.
+
+    A chunk ends after max_lines lines or before it would exceed max_chars;
+    blank chunks are dropped. A single line longer than max_chars is a chunk
+    of its own.
+    """
+    chunks = []
+    lines = text.splitlines(keepends=True)
+    start, size = 0, 0
+    for i, line in enumerate(lines):
+        if i > start and (i - start >= max_lines or size + len(line) > max_chars):
+            chunks.append((start, i))
+            start, size = i, 0
+        size += len(line)
+    if start < len(lines):
+        chunks.append((start, len(lines)))
+    return [
+        (first + 1, end, body)
+        for first, end in chunks
+        if (body := "".join(lines[first:end])).strip()
+    ]
+
+
+def read_lines(path: Path, start_line: int, end_line: int) -> str | None:
+    """Return lines start_line..end_line of a text file, or None if unreadable."""
+    text = read_text_file(path)
+    if text is None:
+        return None
+    return "".join(text.splitlines(keepends=True)[start_line - 1 : end_line])
+
+
+def _normalize(vectors):
+    import numpy as np
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class RepoIndex:
+    """Embedding index of the text files under root, stored in directory."""
+
+    def __init__(self, directory: Path, root: Path, *, model: str, dim: int):
+        self.directory = directory
+        self.root = root.resolve()
+        self.model = model
+        self.dim = dim
+        self.patterns: list[str] = ["."]
+        self._files: dict[str, dict] = {}
+        self._snapshot = _Snapshot([])
+        self._lock = asyncio.Lock()
+        self._loaded = False
+
+    @property
+    def vectors_path(self) -> Path:
+        return self.directory / "vectors.npy"
+
+    @property
+    def meta_path(self) -> Path:
+        return self.directory / "meta.json"
+
+    def load(self) -> bool:
+        """Open the stored index; return False if there is none usable for this model."""
+        import numpy as np
+
+        self._loaded = True
+        try:
+            meta = json.loads(self.meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return False
+        if (meta.get("version"), meta.get("model"), meta.get("dim")) != (
+            INDEX_VERSION,
+            self.model,
+            self.dim,
+        ):
+            logger.info("Ignoring index at %s built with different settings", self.directory)
+            return False
+        chunks = [Chunk(*row) for row in meta["chunks"]]
+        vectors = np.load(self.vectors_path, mmap_mode="r") if chunks else None
+        if vectors is not None and vectors.shape != (len(chunks), self.dim):
+            logger.warning("Index at %s is inconsistent; it will be rebuilt", self.directory)
+            return False
+        self.patterns = meta.get("patterns", ["."])
+        self._files = meta["files"]
+        self._snapshot = _Snapshot(chunks, vectors)
+        return True
+
+    def exists(self) -> bool:
+        if not self._loaded:
+            self.load()
+        return bool(self._files)
+
+    async def update(self, embed: EmbedFn, patterns: list[str] | None = None) -> dict:
+        """Bring the index up to date with the files matching patterns.
+
+        Only new or changed files are chunked and embedded, and nothing is
+        written if no file changed. When refreshing with the stored patterns
+        (patterns=None), a pattern that no longer matches anything -- say, an
+        indexed directory that was deleted -- just drops its files. Returns
+        statistics about the update.
+        """
+        async with self._lock:
+            if not self._loaded:
+                await asyncio.to_thread(self.load)
+            start = time.perf_counter()
+            refresh = not patterns
+            patterns = patterns or self.patterns
+            scan = await asyncio.to_thread(self._scan, patterns, refresh)
+            texts = [
+                f"{chunk.path}:{chunk.start_line}-{chunk.end_line}\n{body}"
+                for chunk, body in scan["new_chunks"]
+            ]
+            batches = [texts[i : i + EMBED_BATCH] for i in range(0, len(texts), EMBED_BATCH)]
+            embedded = await asyncio.gather(*(embed(batch) for batch in batches))
+            new_vectors = [vector for batch in embedded for vector in batch]
+            if len(new_vectors) != len(texts):
+                raise RuntimeError(
+                    f"Embedding returned {len(new_vectors)} vectors for {len(texts)} chunks."
+                )
+            if any(len(vector) != self.dim for vector in new_vectors):
+                raise RuntimeError(
+                    f"Embedding returned vectors that are not {self.dim}-dimensional."
+                )
+            if scan["files"] != self._files or patterns != self.patterns:
+                await asyncio.to_thread(self._write, patterns, scan, new_vectors)
+            return {
+                "files": len(self._files),
+                "chunks": len(self._snapshot.chunks),
+                "embedded_chunks": len(texts),
+                "reused_files": scan["reused"],
+                "changed_files": scan["changed"],
+                "removed_files": scan["removed"],
+                "skipped_files": scan["skipped"],
+                "seconds": round(time.perf_counter() - start, 3),
+            }
+
+    def _scan(self, patterns: list[str], missing_ok: bool = False) -> dict:
+        """Classify files as reused or changed; chunk the changed ones."""
+        files: dict[str, dict] = {}
+        reused: list[str] = []
+        new_chunks: list[tuple[Chunk, str]] = []
+        skipped = 0
+        for path in collect_files(patterns, self.root, missing_ok=missing_ok):
+            rel = path.relative_to(self.root).as_posix()
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            old = self._files.get(rel)
+            if old and (old["mtime_ns"], old["size"]) == (stat.st_mtime_ns, stat.st_size):
+                files[rel] = old
+                reused.append(rel)
+                continue
+            text = read_text_file(path)
+            if text is None:
+                skipped += 1
+                continue
+            digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+            entry = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": digest}
+            if old and old["sha256"] == digest:
+                files[rel] = {**old, **entry}
+                reused.append(rel)
+                continue
+            pieces = chunk_text(text)
+            files[rel] = {**entry, "chunks": len(pieces)}
+            new_chunks += [(Chunk(rel, first, last), body) for first, last, body in pieces]
+        return {
+            "files": files,
+            "reused_files": reused,
+            "new_chunks": new_chunks,
+            "reused": len(reused),
+            "changed": len(files) - len(reused),
+            "removed": len(set(self._files) - set(files)),
+            "skipped": skipped,
+        }
+
+    def _write(self, patterns: list[str], scan: dict, new_vectors: list[list[float]]) -> None:
+        """Write the new vectors and sidecar, copying reused files' rows from the old index."""
+        import numpy as np
+
+        old = self._snapshot
+        files = scan["files"]
+        reused = set(scan["reused_files"])
+        old_rows: dict[str, int] = {}
+        row = 0
+        for rel, entry in self._files.items():
+            old_rows[rel] = row
+            row += entry["chunks"]
+
+        chunks: list[Chunk] = []
+        sources = []  # (old row or None, count); None takes the next new vectors
+        new_by_path: dict[str, list[Chunk]] = {}
+        for chunk, _ in scan["new_chunks"]:
+            new_by_path.setdefault(chunk.path, []).append(chunk)
+        for rel in sorted(files):
+            count = files[rel]["chunks"]
+            if rel in reused:
+                start = old_rows[rel]
+                chunks += old.chunks[start : start + count]
+                sources.append((start, count))
+            else:
+                chunks += new_by_path.get(rel, [])
+                sources.append((None, count))
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_vectors = self.vectors_path.with_suffix(".tmp.npy")
+        if chunks:
+            out = np.lib.format.open_memmap(
+                tmp_vectors, mode="w+", dtype=np.float32, shape=(len(chunks), self.dim)
+            )
+            fresh = (
+                _normalize(np.asarray(new_vectors, dtype=np.float32))
+                if new_vectors
+                else np.empty((0, self.dim), dtype=np.float32)
+            )
+            row = new_row = 0
+            for start, count in sources:
+                if start is None:
+                    out[row : row + count] = fresh[new_row : new_row + count]
+                    new_row += count
+                else:
+                    out[row : row + count] = old.vectors[start : start + count]
+                row += count
+            out.flush()
+            del out
+        meta = {
+            "version": INDEX_VERSION,
+            "model": self.model,
+            "dim": self.dim,
+            "root": str(self.root),
+            "patterns": patterns,
+            "files": {rel: files[rel] for rel in sorted(files)},
+            "chunks": [[c.path, c.start_line, c.end_line] for c in chunks],
+        }
+        tmp_meta = self.meta_path.with_suffix(".tmp")
+        tmp_meta.write_text(json.dumps(meta), encoding="utf-8")
+
+        # A search still holding the old snapshot keeps reading the replaced
+        # file through its existing memory map.
+        if chunks:
+            os.replace(tmp_vectors, self.vectors_path)
+        else:
+            self.vectors_path.unlink(missing_ok=True)
+        os.replace(tmp_meta, self.meta_path)
+        vectors = np.load(self.vectors_path, mmap_mode="r") if chunks else None
+        self.patterns = patterns
+        self._files = meta["files"]
+        self._snapshot = _Snapshot(chunks, vectors)
+
+    def search(self, query: list[float], k: int) -> list[tuple[float, Chunk]]:
+        """Return the k chunks most similar to query (cosine), best first."""
+        import numpy as np
+
+        snapshot = self._snapshot  # One read: an update may swap it while we score.
+        if snapshot.vectors is None or k <= 0:
+            return []
+        q = np.asarray(query, dtype=np.float32)
+        q = q / (np.linalg.norm(q) or 1.0)
+        scores = snapshot.vectors @ q
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), snapshot.chunks[i]) for i in top]
+
+    def stats(self) -> dict:
+        return {
+            "files": len(self._files),
+            "chunks": len(self._snapshot.chunks),
+            "dim": self.dim,
+            "bytes": len(self._snapshot.chunks) * self.dim * 4,
+        }
@@ -0,0 +1,270 @@
+"""
+Codebase Ingestion
+==================
+Reads source files from disk on the bridge side, so a caller only sends a list
+of paths or glob patterns across the MCP boundary instead of megabytes of
+pasted code.
+
+Collection honours ``.gitignore`` files (root and nested), always skips the
+``.git`` directory, drops binary and oversized files, and refuses any path that
+resolves outside the allowed root. Symlinks found while walking a directory are
+followed only if their target is inside the root; others are skipped. Files are
+read concurrently with a bounded thread pool.
+"""
+
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+MAX_FILE_BYTES = 1024 * 1024  # 1 MB per file
+BINARY_SNIFF_BYTES = 8192
+ALWAYS_SKIP_DIRS = {".git"}
+
+
+@dataclass(frozen=True)
+class SourceFile:
+    """A text file read for analysis, with its path relative to the root."""
+
+    path: str
+    content: str
+
+
+class GitIgnore:
+    """Minimal ``.gitignore`` matcher supporting the commonly used syntax.
+
+    Handles comments, negation (``!``), directory-only rules (trailing ``/``),
+    anchored rules (leading or embedded ``/``), ``*``, ``?``, ``[...]`` and ``**``.
+    Rules from nested ``.gitignore`` files apply relative to their directory.
+    """
+
+    def __init__(self):
+        self._rules: list[tuple[re.Pattern, bool, bool]] = []
+
+    def add_file(self, gitignore: Path, base: str) -> None:
+        """Load rules from a .gitignore file located at root-relative directory base."""
+        try:
+            lines = gitignore.read_text(encoding="utf-8", errors="replace").splitlines()
+        except OSError:
+            return
+        for line in lines:
+            self.add_rule(line, base)
+
+    def add_rule(self, line: str, base: str = "") -> None:
+        line = line.rstrip()
+        if not line or line.startswith("#"):
+            return
+        negate = line.startswith("!")
+        if negate:
+            line = line[1:]
+        line = line.replace("\\#", "#").replace("\\!", "!")
+        dir_only = line.endswith("/")
+        line = line.strip("/") if dir_only else line
+        anchored = "/" in line
+        line = line.lstrip("/")
+        if not line:
+            return
+        prefix = re.escape(base + "/") if base else ""
+        body = _glob_to_regex(line)
+        regex = f"^{prefix}{body}$" if anchored else f"^{prefix}(?:.*/)?{body}$"
+        self._rules.append((re.compile(regex), negate, dir_only))
+
+    def is_ignored(self, rel_path: str, is_dir: bool) -> bool:
+        """Return True if the root-relative POSIX path is ignored (last match wins)."""
+        ignored = False
+        for regex, negate, dir_only in self._rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel_path):
+                ignored = not negate
+        return ignored
+
+
+def _glob_to_regex(pattern: str) -> str:
+    out = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("/**", i) and i + 3 == len(pattern):
+            out.append("/.*")
+            i += 3
+        elif pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif c == "*":
+            out.append("[^/]*")
+            i += 1
+        elif c == "?":
+            out.append("[^/]")
+            i += 1
+        elif c == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                out.append(re.escape(c))
+                i += 1
+            else:
+                cls = pattern[i + 1 : end]
+                if cls.startswith("!"):
+                    cls = "^" + cls[1:]
+                out.append(f"[{cls}]")
+                i = end + 1
+        else:
+            out.append(re.escape(c))
+            i += 1
+    return "".join(out)
+
+
+def is_within(path: Path, root: Path) -> bool:
+    """True if path, with symlinks resolved, is inside the (resolved) root."""
+    try:
+        return path.resolve().is_relative_to(root)
+    except (OSError, RuntimeError):  # Unreadable link or symlink loop.
+        return False
+
+
+def collect_files(patterns: list[str], root: Path, *, missing_ok: bool = False) -> list[Path]:
+    """Expand directories and glob patterns under root into a sorted list of files.
+
+    With missing_ok, a pattern that matches nothing contributes no files.
+
+    Raises:
+        PermissionError: if a pattern or matched file resolves outside root
+        FileNotFoundError: if a pattern matches nothing (unless missing_ok)
+    """
+    root = root.resolve()
+    ignore = GitIgnore()
+    ignore.add_file(root / ".gitignore", "")
+    loaded = {root}
+    found: set[Path] = set()
+
+    for pattern in patterns:
+        candidate = Path(pattern)
+        if candidate.is_absolute():
+            if not candidate.resolve().is_relative_to(root):
+                raise PermissionError(
+                    f"Access denied: path must be within the working directory ({root})."
+                )
+            candidate = candidate.resolve().relative_to(root)
+        if ".." in candidate.parts:
+            raise PermissionError(
+                f"Access denied: path must be within the working directory ({root})."
+            )
+
+        target = root / candidate
+        if target.exists():
+            matches = [target]
+        else:
+            matches = sorted(root.glob(candidate.as_posix()))
+        if not matches:
+            if missing_ok:
+                continue
+            raise FileNotFoundError(f"No files match '{pattern}'")
+
+        for match in matches:
+            resolved = match.resolve()
+            if not resolved.is_relative_to(root):
+                raise PermissionError(
+                    f"Access denied: '{match}' resolves outside the working directory ({root})."
+                )
+            if resolved.is_dir():
+                found.update(_walk(resolved, root, ignore, loaded))
+            elif resolved.is_file() and not _ignored(resolved, root, ignore, loaded):
+                found.add(resolved)
+
+    return sorted(found)
+
+
+def _ignored(path: Path, root: Path, ignore: GitIgnore, loaded: set[Path]) -> bool:
+    """Check path and each of its parent directories against the ignore rules."""
+    rel = path.relative_to(root)
+    for depth in range(1, len(rel.parts) + 1):
+        parent = root.joinpath(*rel.parts[: depth - 1])
+        _load_gitignore(parent, root, ignore, loaded)
+        part_path = "/".join(rel.parts[:depth])
+        is_dir = depth < len(rel.parts) or path.is_dir()
+        if rel.parts[depth - 1] in ALWAYS_SKIP_DIRS or ignore.is_ignored(part_path, is_dir):
+            return True
+    return False
+
+
+def _load_gitignore(directory: Path, root: Path, ignore: GitIgnore, loaded: set[Path]) -> None:
+    if directory in loaded:
+        return
+    loaded.add(directory)
+    base = directory.relative_to(root).as_posix()
+    ignore.add_file(directory / ".gitignore", "" if base == "." else base)
+
+
+def _walk(directory: Path, root: Path, ignore: GitIgnore, loaded: set[Path]) -> list[Path]:
+    if directory != root and _ignored(directory, root, ignore, loaded):
+        return []
+    files = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        current = Path(dirpath)
+        _load_gitignore(current, root, ignore, loaded)
+        rel_dir = current.relative_to(root).as_posix()
+        rel_dir = "" if rel_dir == "." else rel_dir + "/"
+        dirnames[:] = sorted(
+            d
+            for d in dirnames
+            if d not in ALWAYS_SKIP_DIRS and not ignore.is_ignored(rel_dir + d, is_dir=True)
+        )
+        for name in filenames:
+            path = current / name
+            if not ignore.is_ignored(rel_dir + name, is_dir=False) and is_within(path, root):
+                files.append(path)
+    return files
+
+
+def read_text_file(path: Path, max_bytes: int = MAX_FILE_BYTES) -> str | None:
+    """Return the file's text, or None if it is binary, too large or unreadable."""
+    try:
+        if path.stat().st_size > max_bytes:
+            return None
+        data = path.read_bytes()
+    except OSError:
+        return None
+    if b"\0" in data[:BINARY_SNIFF_BYTES]:
+        return None
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+
+def read_files(
+    paths: list[Path],
+    root: Path,
+    *,
+    max_workers: int = 8,
+    max_file_bytes: int = MAX_FILE_BYTES,
+) -> tuple[list[SourceFile], list[str]]:
+    """Read paths concurrently and return (text files, skipped root-relative paths).
+
+    Paths that resolve outside root are skipped rather than read.
+    """
+    root = root.resolve()
+
+    def read(path: Path) -> str | None:
+        return read_text_file(path, max_file_bytes) if is_within(path, root) else None
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        contents = list(pool.map(read, paths))
+
+    files, skipped = [], []
+    for path, content in zip(paths, contents, strict=True):
+        rel = path.relative_to(root).as_posix()
+        if content is None:
+            skipped.append(rel)
+        else:
+            files.append(SourceFile(path=rel, content=content))
+    return files, skipped
+
+
+def format_files(files: list[SourceFile]) -> str:
+    """Concatenate files into a single code blob with per-file path markers."""
+    return "\n\n".join(f'<file path="{f.path}">\n{f.content}\n</file>' for f in files)
@@ -0,0 +1,43 @@
+"""
+Lazy Imports
+============
+Defers importing heavy dependencies until they are first used.
+
+``google.genai`` takes longer to import than the rest of the bridge together,
+yet a process that only answers the MCP handshake or reports a missing API key
+never needs it. ``LazyModule`` stands in for the module and imports it on the
+first attribute access; afterwards lookups go through ``sys.modules``.
+"""
+
+import importlib
+import importlib.util
+from types import ModuleType
+
+
+class LazyModule:
+    """Proxy for a module that is imported on first attribute access."""
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def __getattr__(self, attr: str):
+        return getattr(self.load(), attr)
+
+    def load(self) -> ModuleType:
+        return importlib.import_module(self._name)
+
+    def __repr__(self) -> str:
+        return f"<lazy module {self._name!r}>"
+
+
+def is_installed(name: str) -> bool:
+    """True if module name can be imported, without importing it.
+
+    Importing a dotted name's parent packages is unavoidable, so pass the
+    top-level distribution module where possible (e.g. "google.genai" only
+    imports the "google" namespace package).
+    """
+    try:
+        return importlib.util.find_spec(name) is not None
+    except ModuleNotFoundError:
+        return False
@@ -0,0 +1,127 @@
+"""
+Generation Limits
+=================
+Per-tool output-token and thinking budgets.
+
+Gemini 2.5 models think before answering, and thinking tokens count against
+``max_output_tokens``. Left at the model default, a short comparison can spend
+most of its latency (and sometimes its whole output allowance) thinking. Each
+tool therefore has default limits; callers may override them per call, and
+operators per tool with a JSON object (inline or a file path), e.g.::
+
+    {"gemini_compare_approaches": {"thinking_budget": 1024},
+     "gemini_analyze_codebase": {"max_output_tokens": 16384}}
+
+A ``thinking_budget`` of None leaves thinking at the model default; 0 disables
+it (Flash models only) and -1 lets the model decide.
+"""
+
+import json
+from dataclasses import dataclass
+from pathlib import Path
+
+LIMIT_KEYS = ("max_output_tokens", "thinking_budget")
+
+# Tools not listed use the global defaults (GEMINI_MAX_OUTPUT_TOKENS /
+# GEMINI_THINKING_BUDGET). Codebase analysis keeps the model's own budget.
+DEFAULT_TOOL_LIMITS = {
+    "gemini_analyze_text": {"thinking_budget": 2048},
+    "gemini_batch_analyze": {"thinking_budget": 1024},
+    "gemini_analyze_image": {"thinking_budget": 1024},
+    "gemini_analyze_images": {"thinking_budget": 2048},
+    "gemini_compare_approaches": {"thinking_budget": 4096},
+    "gemini_rank_approaches": {"thinking_budget": 2048},
+}
+
+
+@dataclass(frozen=True)
+class GenerationLimits:
+    max_output_tokens: int
+    thinking_budget: int | None = None
+
+    def expanded(self, thoughts_tokens: int, cap: int) -> "GenerationLimits | None":
+        """Limits for a retry after thinking consumed the output allowance.
+
+        Leaves room for the thinking already observed plus the original
+        allowance (at least doubling it), up to cap. Returns None if the
+        allowance cannot grow.
+        """
+        grown = min(
+            cap, max(2 * self.max_output_tokens, thoughts_tokens + self.max_output_tokens)
+        )
+        if grown <= self.max_output_tokens:
+            return None
+        return GenerationLimits(grown, self.thinking_budget)
+
+
+class LimitsTable:
+    """Resolves limits: per-call override, then per-tool setting, then global default."""
+
+    def __init__(
+        self,
+        tools: dict[str, dict] | None = None,
+        *,
+        max_output_tokens: int,
+        thinking_budget: int | None = None,
+    ):
+        self.tools = dict(DEFAULT_TOOL_LIMITS if tools is None else tools)
+        self.defaults = {"max_output_tokens": max_output_tokens, "thinking_budget": thinking_budget}
+
+    def resolve(
+        self,
+        tool: str | None,
+        *,
+        max_output_tokens: int | None = None,
+        thinking_budget: int | None = None,
+    ) -> GenerationLimits:
+        """Return the limits for one call.
+
+        Raises:
+            ValueError: if an override is out of range
+        """
+        settings = {**self.defaults, **self.tools.get(tool or "", {})}
+        if max_output_tokens is not None:
+            settings["max_output_tokens"] = max_output_tokens
+        if thinking_budget is not None:
+            settings["thinking_budget"] = thinking_budget
+        _validate(settings, "Generation limits")
+        return GenerationLimits(**settings)
+
+
+def load_limits(config: str) -> dict[str, dict]:
+    """Parse per-tool limits from inline JSON or a path to a JSON file.
+
+    The result is merged over DEFAULT_TOOL_LIMITS, tool by tool.
+
+    Raises:
+        ValueError: if the config is not an object of valid per-tool limits
+    """
+    text = config.strip()
+    if not text.startswith("{"):
+        text = Path(config).expanduser().read_text(encoding="utf-8")
+    try:
+        items = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Tool limits are not valid JSON: {e}") from e
+    if not isinstance(items, dict):
+        raise ValueError("Tool limits must be a JSON object keyed by tool name.")
+
+    tools = {tool: dict(limits) for tool, limits in DEFAULT_TOOL_LIMITS.items()}
+    for tool, limits in items.items():
+        if not isinstance(limits, dict):
+            raise ValueError(f"Limits for {tool} must be an object.")
+        unknown = set(limits) - set(LIMIT_KEYS)
+        if unknown:
+            raise ValueError(f"Limits for {tool} have unknown keys: {', '.join(sorted(unknown))}")
+        _validate(limits, f"Limits for {tool}")
+        tools[tool] = {**tools.get(tool, {}), **limits}
+    return tools
+
+
+def _validate(limits: dict, what: str) -> None:
+    max_output = limits.get("max_output_tokens", 1)
+    if not isinstance(max_output, int) or max_output < 1:
+        raise ValueError(f"{what}: max_output_tokens must be a positive integer.")
+    budget = limits.get("thinking_budget")
+    if budget is not None and (not isinstance(budget, int) or budget < -1):
+        raise ValueError(f"{what}: thinking_budget must be -1, 0 or a positive integer.")
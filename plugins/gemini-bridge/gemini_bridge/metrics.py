@@ -0,0 +1,275 @@
+"""
+Metrics
+=======
+Per-tool accounting of Gemini usage: call counts, errors, prompt / cached /
+output / thinking token counts and wall latency.
+
+A tool call may issue several upstream requests (e.g. chunked analysis), so
+usage is collected in a ``CallUsage`` bound to the current task through a
+context variable. ``_generate`` adds each response's ``usage_metadata`` to it,
+and the tool wrapper folds the finished call into the process-wide ``Metrics``.
+
+``Metrics`` also keeps a rolling window of the most recent calls that reached
+Gemini (or failed), for p50/p95 latency and error rate in health checks, and
+per-model upstream request latency broken down by the routing rule that chose
+the model.
+
+Latencies are also kept per tool in fixed-bucket ``Histogram``s (tool wall
+time, upstream request time, queue wait), which aggregate across processes and
+export directly to Prometheus.
+"""
+
+import bisect
+import math
+import time
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+
+
+@dataclass
+class CallUsage:
+    """Token usage accumulated over the upstream requests of one tool call."""
+
+    requests: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    output_tokens: int = 0
+    thinking_tokens: int = 0
+    time_to_first_token_s: float | None = None
+
+    def mark_first_token(self, seconds: float) -> None:
+        """Record time to first streamed token (only the first stream of a call counts)."""
+        if self.time_to_first_token_s is None:
+            self.time_to_first_token_s = seconds
+
+    def add(self, usage_metadata) -> None:
+        """Add a response's ``usage_metadata`` (missing fields count as zero)."""
+        self.requests += 1
+        if usage_metadata is None:
+            return
+        self.prompt_tokens += _count(usage_metadata, "prompt_token_count")
+        self.cached_tokens += _count(usage_metadata, "cached_content_token_count")
+        self.output_tokens += _count(usage_metadata, "candidates_token_count")
+        self.thinking_tokens += _count(usage_metadata, "thoughts_token_count")
+
+
+def _count(usage_metadata, name: str) -> int:
+    value = getattr(usage_metadata, name, None)
+    return value if isinstance(value, int) else 0
+
+
+# Number of recent calls kept for rolling latency percentiles and error rate.
+ROLLING_WINDOW = 200
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of values (0.0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implicit.
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+@dataclass
+class Histogram:
+    """Prometheus-style histogram: per-bucket counts, sum and count."""
+
+    bounds: tuple[float, ...] = LATENCY_BUCKETS
+    counts: list[int] = field(default_factory=list)
+    total: float = 0.0
+    count: int = 0
+
+    def __post_init__(self):
+        if not self.counts:
+            self.counts = [0] * (len(self.bounds) + 1)
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        """(upper bound, observations <= bound) pairs, ending with "+Inf"."""
+        pairs, running = [], 0
+        for bound, count in zip([*map(str, self.bounds), "+Inf"], self.counts):
+            running += count
+            pairs.append((bound, running))
+        return pairs
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (the largest bound if beyond)."""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(q * self.count))
+        for i, (_, running) in enumerate(self.cumulative()):
+            if running >= rank:
+                return self.bounds[min(i, len(self.bounds) - 1)]
+        return self.bounds[-1]
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.total, 4),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            # Only buckets that gained observations, to keep the JSON short.
+            "buckets": {
+                bound: running
+                for (bound, running), count in zip(self.cumulative(), self.counts)
+                if count
+            },
+        }
+
+
+@dataclass
+class ToolStats:
+    calls: int = 0
+    errors: int = 0
+    requests: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    output_tokens: int = 0
+    thinking_tokens: int = 0
+    latency_total_s: float = 0.0
+    latency_max_s: float = 0.0
+    streamed_calls: int = 0
+    ttft_total_s: float = 0.0
+    ttft_max_s: float = 0.0
+    extra: dict = field(default_factory=dict)
+    histograms: dict[str, Histogram] = field(default_factory=dict)
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data.update(data.pop("extra"))
+        data["histograms"] = {
+            name: histogram.to_dict() for name, histogram in sorted(self.histograms.items())
+        }
+        data["latency_total_s"] = round(self.latency_total_s, 4)
+        data["latency_max_s"] = round(self.latency_max_s, 4)
+        data["latency_avg_s"] = round(self.latency_total_s / self.calls, 4) if self.calls else 0.0
+        data["ttft_total_s"] = round(self.ttft_total_s, 4)
+        data["ttft_max_s"] = round(self.ttft_max_s, 4)
+        data["ttft_avg_s"] = (
+            round(self.ttft_total_s / self.streamed_calls, 4) if self.streamed_calls else 0.0
+        )
+        return data
+
+
+@dataclass
+class ModelStats:
+    requests: int = 0
+    errors: int = 0
+    latency_total_s: float = 0.0
+    latency_max_s: float = 0.0
+    routes: dict = field(default_factory=dict)
+    recent: deque = field(default_factory=lambda: deque(maxlen=ROLLING_WINDOW))
+
+    def to_dict(self) -> dict:
+        latencies = list(self.recent)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "latency_avg_s": (
+                round(self.latency_total_s / self.requests, 4) if self.requests else 0.0
+            ),
+            "latency_max_s": round(self.latency_max_s, 4),
+            "p50_latency_s": round(percentile(latencies, 50), 4),
+            "p95_latency_s": round(percentile(latencies, 95), 4),
+            "routes": dict(sorted(self.routes.items())),
+        }
+
+
+class Metrics:
+    """Process-wide per-tool usage and latency counters."""
+
+    def __init__(self, window: int = ROLLING_WINDOW):
+        self.started_at = time.time()
+        self._tools: dict[str, ToolStats] = {}
+        self._recent: deque[tuple[float, bool]] = deque(maxlen=window)
+        self._models: dict[str, ModelStats] = {}
+
+    def record(self, tool: str, usage: CallUsage, latency_s: float, error: bool = False) -> None:
+        stats = self._tools.setdefault(tool, ToolStats())
+        stats.calls += 1
+        stats.errors += int(error)
+        stats.requests += usage.requests
+        stats.prompt_tokens += usage.prompt_tokens
+        stats.cached_tokens += usage.cached_tokens
+        stats.output_tokens += usage.output_tokens
+        stats.thinking_tokens += usage.thinking_tokens
+        stats.latency_total_s += latency_s
+        stats.latency_max_s = max(stats.latency_max_s, latency_s)
+        stats.histograms.setdefault("latency_seconds", Histogram()).observe(latency_s)
+        if usage.time_to_first_token_s is not None:
+            stats.streamed_calls += 1
+            stats.ttft_total_s += usage.time_to_first_token_s
+            stats.ttft_max_s = max(stats.ttft_max_s, usage.time_to_first_token_s)
+        # Calls answered locally (cache hits, cached health checks) would skew
+        # the percentiles towards zero.
+        if usage.requests or error:
+            self._recent.append((latency_s, error))
+
+    def record_request(self, model: str, rule: str, latency_s: float, error: bool = False) -> None:
+        """Record one upstream request: the routed model, the rule that chose it, its outcome."""
+        stats = self._models.setdefault(model, ModelStats())
+        stats.requests += 1
+        stats.errors += int(error)
+        stats.latency_total_s += latency_s
+        stats.latency_max_s = max(stats.latency_max_s, latency_s)
+        stats.routes[rule] = stats.routes.get(rule, 0) + 1
+        stats.recent.append(latency_s)
+
+    def increment(self, tool: str, name: str, amount: float = 1) -> None:
+        """Bump a free-form per-tool counter (e.g. "auto_sharded")."""
+        extra = self._tools.setdefault(tool, ToolStats()).extra
+        extra[name] = extra.get(name, 0) + amount
+
+    def observe(self, tool: str, name: str, value: float) -> None:
+        """Add an observation to a per-tool histogram (e.g. "queue_wait_seconds")."""
+        histograms = self._tools.setdefault(tool, ToolStats()).histograms
+        histograms.setdefault(name, Histogram()).observe(value)
+
+    def tools(self) -> dict[str, ToolStats]:
+        return dict(sorted(self._tools.items()))
+
+    def models(self) -> dict[str, ModelStats]:
+        return dict(sorted(self._models.items()))
+
+    def rolling(self) -> dict:
+        """p50/p95 latency and error rate over the most recent upstream calls."""
+        latencies = [latency for latency, _ in self._recent]
+        errors = sum(error for _, error in self._recent)
+        return {
+            "window": len(self._recent),
+            "p50_latency_s": round(percentile(latencies, 50), 4),
+            "p95_latency_s": round(percentile(latencies, 95), 4),
+            "error_rate": round(errors / len(self._recent), 4) if self._recent else 0.0,
+        }
+
+    def snapshot(self) -> dict:
+        tools = {name: stats.to_dict() for name, stats in sorted(self._tools.items())}
+        totals = CallUsage()
+        for stats in self._tools.values():
+            totals.requests += stats.requests
+            totals.prompt_tokens += stats.prompt_tokens
+            totals.cached_tokens += stats.cached_tokens
+            totals.output_tokens += stats.output_tokens
+            totals.thinking_tokens += stats.thinking_tokens
+        return {
+            "uptime_s": round(time.time() - self.started_at, 1),
+            "totals": asdict(totals),
+            "rolling": self.rolling(),
+            "tools": tools,
+            "models": {name: stats.to_dict() for name, stats in sorted(self._models.items())},
+        }
+
+
+current_usage: ContextVar[CallUsage | None] = ContextVar("current_usage", default=None)
+current_tool: ContextVar[str | None] = ContextVar("current_tool", default=None)
@@ -0,0 +1,172 @@
+"""
+Observability
+=============
+Prometheus exposition of the bridge's metrics and structured log lines.
+
+``render_prometheus`` turns ``Metrics`` (plus gauges such as cache sizes) into
+the Prometheus text format. The server serves it at ``/metrics`` on the HTTP
+transports and can write it periodically to a file for node_exporter's
+textfile collector (``write_textfile`` replaces the file atomically, so the
+collector never reads a partial file). Over stdio every Claude session runs its
+own bridge process, so each process writes its own file (``process_textfile``)
+with a ``pid`` label on every sample; otherwise the processes would overwrite
+each other's counters.
+
+Every tool call gets a request id in ``current_request_id``.
+``RequestContextFilter`` copies it and the tool name onto each log record, and
+``JsonFormatter`` emits one JSON object per line with those fields and any
+``extra`` passed to the logger.
+"""
+
+import json
+import logging
+import os
+import re
+import time
+from contextvars import ContextVar
+from pathlib import Path
+
+from gemini_bridge.metrics import Metrics
+
+PREFIX = "gemini_bridge"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+current_request_id: ContextVar[str | None] = ContextVar("current_request_id", default=None)
+
+_TOKEN_KINDS = ("prompt", "cached", "output", "thinking")
+# Attributes every LogRecord has; anything else was passed via extra=.
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(**labels: str) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items()) + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Family:
+    def __init__(self, name: str, kind: str, help_text: str, constant: dict[str, str]):
+        self.name = f"{PREFIX}_{name}"
+        self.kind = kind
+        self.help = help_text
+        self.constant = constant
+        self.samples: list[str] = []
+
+    def add(self, value: float, suffix: str = "", **labels: str) -> None:
+        labels = {**self.constant, **labels}
+        self.samples.append(f"{self.name}{suffix}{_labels(**labels)} {_number(value)}")
+
+    def render(self) -> list[str]:
+        if not self.samples:
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self.samples]
+
+
+def render_prometheus(
+    metrics: Metrics,
+    gauges: dict[str, float] | None = None,
+    labels: dict[str, str] | None = None,
+) -> str:
+    """Render metrics in the Prometheus text exposition format.
+
+    Per-tool free-form counters (retries, cache hits, bytes in/out, ...) are
+    exported as ``gemini_bridge_tool_events_total{tool, event}``; gauges are
+    exported as ``gemini_bridge_<name>``. labels are added to every sample.
+    """
+    constant = dict(labels or {})
+
+    def family(name: str, kind: str, help_text: str) -> _Family:
+        return _Family(name, kind, help_text, constant)
+
+    calls = family("tool_calls_total", "counter", "Tool calls")
+    errors = family("tool_errors_total", "counter", "Tool calls that failed")
+    requests = family("tool_requests_total", "counter", "Upstream Gemini requests by tool")
+    tokens = family("tool_tokens_total", "counter", "Gemini tokens by tool and kind")
+    events = family("tool_events_total", "counter", "Per-tool event counters")
+    histograms: dict[str, _Family] = {}
+    model_requests = family("model_requests_total", "counter", "Upstream requests by model")
+    model_errors = family("model_errors_total", "counter", "Failed upstream requests by model")
+
+    for tool, stats in metrics.tools().items():
+        calls.add(stats.calls, tool=tool)
+        errors.add(stats.errors, tool=tool)
+        requests.add(stats.requests, tool=tool)
+        for kind in _TOKEN_KINDS:
+            tokens.add(getattr(stats, f"{kind}_tokens"), tool=tool, kind=kind)
+        for event, value in sorted(stats.extra.items()):
+            events.add(value, tool=tool, event=event)
+        for name, histogram in sorted(stats.histograms.items()):
+            buckets = histograms.setdefault(
+                name, family(f"tool_{name}", "histogram", f"Tool {name.replace('_', ' ')}")
+            )
+            for bound, count in histogram.cumulative():
+                buckets.add(count, "_bucket", tool=tool, le=bound)
+            buckets.add(histogram.total, "_sum", tool=tool)
+            buckets.add(histogram.count, "_count", tool=tool)
+    for model, stats in metrics.models().items():
+        model_requests.add(stats.requests, model=model)
+        model_errors.add(stats.errors, model=model)
+
+    uptime = family("uptime_seconds", "gauge", "Seconds since the bridge started")
+    uptime.add(round(time.time() - metrics.started_at, 3))
+    families = [calls, errors, requests, tokens, events, *histograms.values()]
+    families += [model_requests, model_errors, uptime]
+    for name, value in sorted((gauges or {}).items()):
+        gauge = family(re.sub(r"[^a-zA-Z0-9_]", "_", name), "gauge", name.replace("_", " "))
+        gauge.add(value)
+        families.append(gauge)
+    return "\n".join(line for family in families for line in family.render()) + "\n"
+
+
+def process_textfile(path: Path, pid: int) -> Path:
+    """The per-process file for path: gemini_bridge.prom -> gemini_bridge.<pid>.prom."""
+    return path.with_name(f"{path.stem}.{pid}{path.suffix or '.prom'}")
+
+
+def write_textfile(path: Path, text: str) -> None:
+    """Write text to path atomically (for the node_exporter textfile collector)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+class RequestContextFilter(logging.Filter):
+    """Attach the current request id and tool name to every log record."""
+
+    def __init__(self, tool_var: ContextVar[str | None]):
+        super().__init__()
+        self.tool_var = tool_var
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "request_id"):
+            record.request_id = current_request_id.get()
+        if not hasattr(record, "tool"):
+            record.tool = self.tool_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and context fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
@@ -0,0 +1,124 @@
+"""
+Approach Ranking
+================
+Aggregates pairwise comparisons into a ranking for gemini_rank_approaches.
+
+A tournament over N approaches compares every pair once. Each comparison is an
+``Outcome`` (the two approaches and the winner, or None for a tie);
+``rank`` turns the outcomes into ``Standing`` objects ordered best first,
+scored either by win count (a tie is half a win) or by a Bradley-Terry model.
+
+Bradley-Terry assigns each approach a strength p_i such that approach i beats
+j with probability p_i / (p_i + p_j), fitted with Hunter's MM iteration. Each
+approach gets a small prior (a virtual tie against an average opponent) so an
+approach that won or lost every comparison still has a finite strength, and
+comparisons that failed simply leave their pair out of the fit. Scores are
+normalized to sum to 1.
+
+``pair_order`` puts a pair in a canonical order that depends only on the two
+texts, so a comparison's prompt -- and therefore its response cache entry -- is
+the same no matter where the approaches appear in the list. Re-ranking after
+adding one approach to N costs only the N new comparisons.
+"""
+
+import hashlib
+import itertools
+from dataclasses import dataclass
+
+RANKING_METHODS = ("bradley_terry", "wins")
+
+
+@dataclass(frozen=True)
+class Outcome:
+    a: int
+    b: int
+    winner: int | None  # a, b, or None for a tie
+
+
+@dataclass
+class Standing:
+    index: int
+    score: float = 0.0
+    wins: int = 0
+    losses: int = 0
+    ties: int = 0
+
+
+def pair_order(approaches: list[str], i: int, j: int) -> tuple[int, int]:
+    """Return (i, j) or (j, i), ordered by the content of the two approaches."""
+    digest = {k: hashlib.sha256(approaches[k].encode("utf-8")).hexdigest() for k in (i, j)}
+    return (i, j) if (digest[i], i) <= (digest[j], j) else (j, i)
+
+
+def all_pairs(approaches: list[str]) -> list[tuple[int, int]]:
+    """Every pair of approaches once, each in canonical order."""
+    indexes = range(len(approaches))
+    return [pair_order(approaches, i, j) for i, j in itertools.combinations(indexes, 2)]
+
+
+def _wins(n: int, outcomes: list[Outcome]) -> list[float]:
+    wins = [0.0] * n
+    for outcome in outcomes:
+        if outcome.winner is None:
+            wins[outcome.a] += 0.5
+            wins[outcome.b] += 0.5
+        else:
+            wins[outcome.winner] += 1
+    return wins
+
+
+def bradley_terry(
+    n: int,
+    outcomes: list[Outcome],
+    *,
+    prior: float = 0.5,
+    iterations: int = 500,
+    tolerance: float = 1e-10,
+) -> list[float]:
+    """Fit Bradley-Terry strengths for n approaches; returns scores summing to 1."""
+    if n == 0:
+        return []
+    # The prior is a tie (half a win each way) against a virtual opponent of strength 1.
+    wins = [w + prior for w in _wins(n, outcomes)]
+    strengths = [1.0] * n
+    for _ in range(iterations):
+        denominators = [2 * prior / (s + 1.0) for s in strengths]
+        for outcome in outcomes:
+            pair = 1.0 / (strengths[outcome.a] + strengths[outcome.b])
+            denominators[outcome.a] += pair
+            denominators[outcome.b] += pair
+        updated = [w / d for w, d in zip(wins, denominators, strict=True)]
+        # Renormalize to a geometric mean of 1 so the virtual opponent stays "average".
+        scale = 1.0
+        for s in updated:
+            scale *= s ** (1 / n)
+        updated = [s / scale for s in updated]
+        change = max(abs(u - s) for u, s in zip(updated, strengths, strict=True))
+        strengths = updated
+        if change < tolerance:
+            break
+    total = sum(strengths)
+    return [s / total for s in strengths]
+
+
+def rank(n: int, outcomes: list[Outcome], method: str = "bradley_terry") -> list[Standing]:
+    """Standings for n approaches, best first (ties broken by wins, then input order).
+
+    Raises:
+        ValueError: for an unknown method
+    """
+    if method not in RANKING_METHODS:
+        raise ValueError(f"Unknown ranking method {method!r}; use one of {RANKING_METHODS}.")
+    standings = [Standing(i) for i in range(n)]
+    for outcome in outcomes:
+        if outcome.winner is None:
+            standings[outcome.a].ties += 1
+            standings[outcome.b].ties += 1
+        else:
+            loser = outcome.b if outcome.winner == outcome.a else outcome.a
+            standings[outcome.winner].wins += 1
+            standings[loser].losses += 1
+    scores = bradley_terry(n, outcomes) if method == "bradley_terry" else _wins(n, outcomes)
+    for standing, score in zip(standings, scores, strict=True):
+        standing.score = round(score, 6)
+    return sorted(standings, key=lambda s: (-s.score, -s.wins, s.index))
@@ -0,0 +1,215 @@
+"""
+Resilience
+==========
+Client-side protection for upstream Gemini calls:
+
+- ``RateLimiter``: token buckets for requests/min and tokens/min, so the bridge
+  smooths bursts instead of running into 429s.
+- ``call_with_retries``: exponential backoff with full jitter for transient
+  errors (429, 5xx, connection failures), honouring server retry hints.
+- ``hedged``: starts a duplicate request when the first is slower than a
+  threshold and returns whichever finishes first.
+
+Errors are classified by duck typing (``code`` / ``status_code`` attributes) so
+this module does not depend on the google-genai SDK.
+"""
+
+import asyncio
+import logging
+import random
+import re
+import time
+from collections.abc import Awaitable, Callable
+from typing import TypeVar
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+T = TypeVar("T")
+
+
+class TokenBucket:
+    """Async token bucket refilled continuously at ``per_minute`` units per minute.
+
+    Waiters are served in FIFO order. Requests larger than the bucket are
+    clamped to its capacity so they can eventually proceed.
+    """
+
+    def __init__(self, per_minute: float, *, clock: Callable[[], float] = time.monotonic):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self._clock = clock
+        self._level = self.capacity
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """Take amount units, waiting as needed; return the seconds spent waiting."""
+        amount = min(float(amount), self.capacity)
+        waited = 0.0
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._level >= amount:
+                    self._level -= amount
+                    return waited
+                delay = (amount - self._level) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits; 0 disables a limit."""
+
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0):
+        self._requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.waited_s = 0.0
+
+    async def acquire(self, tokens: int = 0) -> float:
+        """Wait for one request slot and tokens; return the seconds spent waiting."""
+        waited = 0.0
+        if self._requests is not None:
+            waited += await self._requests.acquire(1)
+        if self._tokens is not None and tokens > 0:
+            waited += await self._tokens.acquire(tokens)
+        self.waited_s += waited
+        return waited
+
+
+def status_code(exc: BaseException) -> int | None:
+    """Return the HTTP status carried by an SDK or httpx error, if any."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code
+    for attr in ("code", "status_code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """True for rate limiting, server-side errors, timeouts and connection failures."""
+    if isinstance(exc, (ConnectionError, TimeoutError, httpx.TransportError)):
+        return True
+    return status_code(exc) in RETRYABLE_STATUS_CODES
+
+
+def retry_after(exc: BaseException) -> float | None:
+    """Extract a server retry hint in seconds from an error, if present.
+
+    Checks the HTTP ``Retry-After`` header and Gemini's ``RetryInfo`` detail
+    (``"retryDelay": "12s"``).
+    """
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is not None:
+        try:
+            value = headers.get("retry-after")
+        except Exception:
+            value = None
+        if value is not None:
+            try:
+                return max(0.0, float(value))
+            except (TypeError, ValueError):
+                pass
+
+    details = getattr(exc, "details", None)
+    if isinstance(details, dict):
+        for item in details.get("error", {}).get("details", []) or []:
+            if isinstance(item, dict) and "retryDelay" in item:
+                match = re.fullmatch(r"\s*([\d.]+)s\s*", str(item["retryDelay"]))
+                if match:
+                    return float(match.group(1))
+    return None
+
+
+def backoff_delay(
+    attempt: int,
+    *,
+    base_delay: float,
+    max_delay: float,
+    hint: float | None = None,
+) -> float:
+    """Delay before retry number attempt (1-based): full jitter, or the server hint."""
+    if hint is not None:
+        return hint + random.uniform(0, base_delay)
+    return random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+
+
+async def call_with_retries(
+    fn: Callable[[], Awaitable[T]],
+    *,
+    max_attempts: int,
+    base_delay: float,
+    max_delay: float,
+    on_retry: Callable[[int, float, BaseException], None] | None = None,
+    retry_if: Callable[[BaseException], bool] | None = None,
+) -> T:
+    """Call fn, retrying transient failures with exponential backoff and jitter.
+
+    Non-retryable errors, the final failure, errors rejected by retry_if, and
+    errors whose retry hint exceeds max_delay are raised unchanged.
+    """
+    attempt = 1
+    while True:
+        try:
+            return await fn()
+        except Exception as e:
+            if attempt >= max_attempts or not is_retryable(e):
+                raise
+            if retry_if is not None and not retry_if(e):
+                raise
+            hint = retry_after(e)
+            if hint is not None and hint > max_delay:
+                raise
+            delay = backoff_delay(attempt, base_delay=base_delay, max_delay=max_delay, hint=hint)
+            if on_retry is not None:
+                on_retry(attempt, delay, e)
+            logger.warning("Gemini request failed (%s); retry %d in %.2fs", e, attempt, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+async def hedged(
+    fn: Callable[[], Awaitable[T]],
+    delay: float,
+    *,
+    on_hedge: Callable[[], None] | None = None,
+) -> T:
+    """Run fn; if it has not finished after delay seconds, race a second call.
+
+    Returns the first successful result and cancels the other call (both, if
+    the caller is cancelled), waiting for cancelled calls to unwind. Raises the
+    last error only if both calls fail.
+    """
+    tasks = [asyncio.ensure_future(fn())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            if on_hedge is not None:
+                on_hedge()
+            tasks.append(asyncio.ensure_future(fn()))
+        pending = set(tasks)
+        error: BaseException | None = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        abandoned = [task for task in tasks if not task.done()]
+        for task in abandoned:
+            task.cancel()
+        if abandoned:
+            await asyncio.wait(abandoned)
@@ -0,0 +1,156 @@
+"""
+Model Routing
+=============
+Chooses the Gemini model for each upstream request.
+
+Short, simple prompts are answered several times faster by a Flash model than
+by Pro, while long-context analysis and comparisons benefit from Pro. A
+``Router`` evaluates an ordered list of ``Rule`` objects against a
+``RouteRequest`` (calling tool, estimated prompt tokens, the caller's quality
+hint and requested thinking budget); the first matching rule picks the model,
+and requests no rule matches go to the pro model.
+
+Rules can be replaced with a JSON list (inline or a file path), e.g.::
+
+    [{"name": "tiny", "model": "fast", "max_prompt_tokens": 500},
+     {"name": "vision", "model": "pro", "tools": ["gemini_analyze_image*"]}]
+
+``model`` is "fast", "pro" or a literal model name.
+"""
+
+import json
+from dataclasses import dataclass, fields
+from fnmatch import fnmatchcase
+from pathlib import Path
+
+QUALITY_LEVELS = ("auto", "fast", "best")
+
+
+@dataclass(frozen=True)
+class RouteRequest:
+    tool: str | None
+    prompt_tokens: int
+    quality: str = "auto"
+    thinking_budget: int | None = None
+
+
+@dataclass(frozen=True)
+class Decision:
+    model: str
+    rule: str
+
+
+@dataclass(frozen=True)
+class Rule:
+    """Route to model when every condition that is set holds.
+
+    tools are fnmatch patterns (empty = any tool). The thinking conditions
+    only constrain requests that ask for an explicit thinking budget.
+    """
+
+    name: str
+    model: str
+    tools: tuple[str, ...] = ()
+    quality: str | None = None
+    min_prompt_tokens: int | None = None
+    max_prompt_tokens: int | None = None
+    min_thinking_budget: int | None = None
+    max_thinking_budget: int | None = None
+
+    def matches(self, request: RouteRequest) -> bool:
+        if self.tools and not any(fnmatchcase(request.tool or "", p) for p in self.tools):
+            return False
+        if self.quality is not None and request.quality != self.quality:
+            return False
+        if self.min_prompt_tokens is not None and request.prompt_tokens < self.min_prompt_tokens:
+            return False
+        if self.max_prompt_tokens is not None and request.prompt_tokens > self.max_prompt_tokens:
+            return False
+        budget = request.thinking_budget
+        if self.min_thinking_budget is not None and (
+            budget is None or budget < self.min_thinking_budget
+        ):
+            return False
+        if (
+            self.max_thinking_budget is not None
+            and budget is not None
+            and budget > self.max_thinking_budget
+        ):
+            return False
+        return True
+
+
+DEFAULT_RULES = (
+    Rule("quality-best", "pro", quality="best"),
+    Rule("quality-fast", "fast", quality="fast"),
+    Rule(
+        "deep-analysis",
+        "pro",
+        tools=(
+            "gemini_analyze_codebase",
+            "gemini_analyze_paths",
+            "gemini_compare_approaches",
+            "gemini_rank_approaches",
+        ),
+    ),
+    Rule("heavy-thinking", "pro", min_thinking_budget=8192),
+    Rule(
+        "short-text",
+        "fast",
+        tools=("gemini_analyze_text", "gemini_batch_analyze"),
+        max_prompt_tokens=2000,
+    ),
+)
+
+
+class Router:
+    """First-match rule evaluation with "fast" / "pro" model aliases."""
+
+    def __init__(self, rules, *, pro_model: str, fast_model: str):
+        self.rules = tuple(rules)
+        self.pro_model = pro_model
+        self.fast_model = fast_model
+
+    def route(self, request: RouteRequest) -> Decision:
+        if request.quality not in QUALITY_LEVELS:
+            raise ValueError(
+                f"quality must be one of {', '.join(QUALITY_LEVELS)}, not {request.quality!r}."
+            )
+        for rule in self.rules:
+            if rule.matches(request):
+                return Decision(self._resolve(rule.model), rule.name)
+        return Decision(self.pro_model, "default")
+
+    def _resolve(self, model: str) -> str:
+        return {"pro": self.pro_model, "fast": self.fast_model}.get(model, model)
+
+
+def load_rules(config: str) -> tuple[Rule, ...]:
+    """Parse rules from inline JSON or a path to a JSON file.
+
+    Raises:
+        ValueError: if the config is not a list of valid rule objects
+    """
+    text = config.strip()
+    if not text.startswith("["):
+        text = Path(config).expanduser().read_text(encoding="utf-8")
+    try:
+        items = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Routing rules are not valid JSON: {e}") from e
+    if not isinstance(items, list):
+        raise ValueError("Routing rules must be a JSON list of rule objects.")
+
+    known = {f.name for f in fields(Rule)}
+    rules = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or "model" not in item:
+            raise ValueError(f'Routing rule {index} must be an object with a "model".')
+        unknown = set(item) - known
+        if unknown:
+            raise ValueError(f"Routing rule {index} has unknown keys: {', '.join(sorted(unknown))}")
+        item = {"name": f"rule-{index}", **item}
+        if "tools" in item:
+            item["tools"] = tuple(item["tools"])
+        rules.append(Rule(**item))
+    return tuple(rules)
@@ -0,0 +1,216 @@
+"""
+Structured Output Schemas
+=========================
+Response schemas for JSON mode and validation of the returned JSON.
+
+With a schema, Gemini is asked for ``application/json`` output constrained by
+``response_schema``, so callers get structure they can use directly instead of
+parsing markdown. Schemas use the OpenAPI subset Gemini accepts (type,
+properties, required, items, enum, nullable, description, propertyOrdering);
+``validate`` checks a parsed response against the same subset.
+
+Built-in schemas: "comparison" (gemini_compare_approaches) and "findings"
+(codebase analysis).
+"""
+
+import json
+
+_STRINGS = {"type": "array", "items": {"type": "string"}}
+
+COMPARISON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "approach_a": {
+            "type": "object",
+            "properties": {"strengths": _STRINGS, "weaknesses": _STRINGS},
+            "required": ["strengths", "weaknesses"],
+        },
+        "approach_b": {
+            "type": "object",
+            "properties": {"strengths": _STRINGS, "weaknesses": _STRINGS},
+            "required": ["strengths", "weaknesses"],
+        },
+        "performance": {"type": "string"},
+        "maintainability": {"type": "string"},
+        "recommendation": {"type": "string", "enum": ["approach_a", "approach_b", "hybrid"]},
+        "rationale": {"type": "string"},
+        "hybrid": {"type": "string", "nullable": True},
+    },
+    "required": ["approach_a", "approach_b", "recommendation", "rationale"],
+    "propertyOrdering": [
+        "approach_a",
+        "approach_b",
+        "performance",
+        "maintainability",
+        "recommendation",
+        "rationale",
+        "hybrid",
+    ],
+}
+
+FINDINGS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string"},
+        "findings": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "title": {"type": "string"},
+                    "severity": {
+                        "type": "string",
+                        "enum": ["critical", "high", "medium", "low", "info"],
+                    },
+                    "file": {"type": "string", "nullable": True},
+                    "line": {"type": "integer", "nullable": True},
+                    "description": {"type": "string"},
+                    "recommendation": {"type": "string"},
+                },
+                "required": ["title", "severity", "description"],
+                "propertyOrdering": [
+                    "title",
+                    "severity",
+                    "file",
+                    "line",
+                    "description",
+                    "recommendation",
+                ],
+            },
+        },
+    },
+    "required": ["summary", "findings"],
+    "propertyOrdering": ["summary", "findings"],
+}
+
+# Used internally by incremental analysis; not offered to callers.
+FILE_SUMMARIES_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "files": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"path": {"type": "string"}, "summary": {"type": "string"}},
+                "required": ["path", "summary"],
+            },
+        },
+    },
+    "required": ["files"],
+}
+
+# Used internally by gemini_rank_approaches; not offered to callers.
+PAIRWISE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "rationale": {"type": "string"},
+        "winner": {"type": "string", "enum": ["approach_a", "approach_b", "tie"]},
+    },
+    "required": ["rationale", "winner"],
+    "propertyOrdering": ["rationale", "winner"],
+}
+
+RANKING_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "ranking": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "approach": {"type": "integer"},
+                    "rationale": {"type": "string"},
+                },
+                "required": ["approach", "rationale"],
+            },
+        },
+        "recommendation": {"type": "string"},
+    },
+    "required": ["ranking", "recommendation"],
+    "propertyOrdering": ["ranking", "recommendation"],
+}
+
+BUILTIN_SCHEMAS = {"comparison": COMPARISON_SCHEMA, "findings": FINDINGS_SCHEMA}
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+}
+
+
+def resolve_schema(
+    response_schema: str | dict | None, json_mode: bool, default: str
+) -> dict | None:
+    """Return the schema to request, or None for free-form text.
+
+    response_schema is a built-in schema name, a schema object or its JSON
+    text; json_mode without a schema selects the tool's default built-in.
+
+    Raises:
+        ValueError: for unknown names, invalid JSON or non-object schemas
+    """
+    if response_schema is None:
+        return BUILTIN_SCHEMAS[default] if json_mode else None
+    if isinstance(response_schema, str):
+        if response_schema in BUILTIN_SCHEMAS:
+            return BUILTIN_SCHEMAS[response_schema]
+        if not response_schema.lstrip().startswith("{"):
+            raise ValueError(
+                f"Unknown schema {response_schema!r}; built-in schemas: "
+                f"{', '.join(BUILTIN_SCHEMAS)} (or pass a JSON schema object)."
+            )
+        try:
+            response_schema = json.loads(response_schema)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"response_schema is not valid JSON: {e}") from e
+    if not isinstance(response_schema, dict) or "type" not in response_schema:
+        raise ValueError('response_schema must be a schema object with a "type".')
+    return response_schema
+
+
+def validate(value, schema: dict, path: str = "$") -> list[str]:
+    """Return the ways value violates schema (empty if it conforms)."""
+    if value is None:
+        return [] if schema.get("nullable") else [f"{path}: must not be null"]
+    expected = _TYPES.get(str(schema.get("type", "")).lower())
+    # bool is an int subclass but not a JSON integer or number.
+    if expected is not None and (
+        not isinstance(value, expected) or (isinstance(value, bool) and expected is not bool)
+    ):
+        return [f"{path}: expected {schema['type']}, got {type(value).__name__}"]
+    if "enum" in schema and value not in schema["enum"]:
+        return [f"{path}: {value!r} is not one of {schema['enum']}"]
+
+    errors = []
+    if isinstance(value, dict):
+        properties = schema.get("properties", {})
+        for key in schema.get("required", []):
+            if key not in value:
+                errors.append(f"{path}: missing required property {key!r}")
+        for key, item in value.items():
+            if key in properties:
+                errors += validate(item, properties[key], f"{path}.{key}")
+    elif isinstance(value, list) and "items" in schema:
+        for index, item in enumerate(value):
+            errors += validate(item, schema["items"], f"{path}[{index}]")
+    return errors
+
+
+def parse_response(text: str, schema: dict) -> dict | list:
+    """Parse and validate a JSON response.
+
+    Raises:
+        ValueError: if text is not JSON or does not match schema
+    """
+    try:
+        value = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Gemini returned invalid JSON: {e}") from e
+    errors = validate(value, schema)
+    if errors:
+        raise ValueError(f"Gemini's JSON does not match the schema: {'; '.join(errors[:5])}")
+    return value
@@ -0,0 +1,110 @@
+"""
+Singleflight
+============
+Coalesces concurrent identical requests into one upstream call.
+
+When several sub-agents fire the same question at once, the first caller for a
+key (the leader) starts the call and later callers for that key wait on the
+same result instead of sending their own request. The call runs in its own
+task, so a caller that is cancelled does not cancel it for the others; it is
+only cancelled once every caller waiting on it has gone away, and the last
+caller's cancellation returns after the call has unwound.
+
+Only calls that overlap in time are coalesced. Once a call finishes, the next
+caller for the key starts a fresh one -- persisting results is the response
+cache's job.
+
+``KeyedLock`` serializes work per key for callers that must also see each
+other's side effects (creating a context cache or an upload once). A key's
+lock exists only while someone holds or waits for it, so a long-running
+server does not accumulate one lock per key it has ever seen.
+"""
+
+import asyncio
+import contextlib
+from collections.abc import AsyncIterator, Awaitable, Callable
+from typing import Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class _Flight(Generic[T]):
+    def __init__(self, task: asyncio.Task[T]):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Per-key deduplication of concurrent async calls."""
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._flights: dict[str, _Flight] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> tuple[T, bool]:
+        """Return (result of fn, shared).
+
+        shared is True when the result came from a call started by another
+        caller. Errors from fn propagate to every caller of that flight.
+        """
+        self.calls += 1
+        flight = self._flights.get(key)
+        shared = flight is not None
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(fn()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task), shared
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                flight.task.cancel()
+                await asyncio.wait([flight.task])
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": self.in_flight()}
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+
+class _KeyLock:
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class KeyedLock:
+    """Per-key asyncio locks, dropped once no caller holds or awaits them."""
+
+    def __init__(self):
+        self._locks: dict[str, _KeyLock] = {}
+
+    @contextlib.asynccontextmanager
+    async def hold(self, key: str) -> AsyncIterator[None]:
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = _KeyLock()
+        entry.users += 1
+        try:
+            async with entry.lock:
+                yield
+        finally:
+            entry.users -= 1
+            if not entry.users:
+                del self._locks[key]
+
+    def __len__(self) -> int:
+        return len(self._locks)
@@ -0,0 +1,66 @@
+"""
+Token Estimation
+================
+Cheap local token estimates used for pre-flight size checks and sharding.
+
+The default is a fixed characters-per-token ratio. ``TokenEstimator`` refines
+it per model by counting one sample with Gemini's ``count_tokens`` endpoint;
+the measured ratio is memoized so calibration costs a single request per model
+for the lifetime of the process.
+"""
+
+import logging
+import math
+from collections.abc import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+# Rough average for source code and English prose with Gemini's tokenizer.
+CHARS_PER_TOKEN = 4.0
+# Calibrating on tiny samples is noisy and not worth a request.
+CALIBRATION_MIN_CHARS = 4_000
+CALIBRATION_SAMPLE_CHARS = 32_000
+
+CountFn = Callable[[str], Awaitable[int]]
+
+
+def estimate_tokens(text: str, chars_per_token: float = CHARS_PER_TOKEN) -> int:
+    """Estimate the token count of text without a network round-trip."""
+    return math.ceil(len(text) / chars_per_token)
+
+
+class TokenEstimator:
+    """Per-model token estimator with memoized ``count_tokens`` calibration."""
+
+    def __init__(self, default_ratio: float = CHARS_PER_TOKEN):
+        self.default_ratio = default_ratio
+        self._ratios: dict[str, float] = {}
+        self._attempted: set[str] = set()
+
+    def ratio(self, model: str) -> float:
+        """Return the characters-per-token ratio for model."""
+        return self._ratios.get(model, self.default_ratio)
+
+    def is_calibrated(self, model: str) -> bool:
+        return model in self._ratios
+
+    def estimate(self, model: str, text: str) -> int:
+        return estimate_tokens(text, self.ratio(model))
+
+    async def calibrate(self, model: str, text: str, count: CountFn) -> None:
+        """Measure the ratio for model on a sample of text, at most once per model.
+
+        Failures are logged and remembered; the default ratio is used instead.
+        """
+        if model in self._attempted or len(text) < CALIBRATION_MIN_CHARS:
+            return
+        self._attempted.add(model)
+        sample = text[:CALIBRATION_SAMPLE_CHARS]
+        try:
+            tokens = await count(sample)
+        except Exception as e:
+            logger.warning("Token calibration for %s failed, using default ratio: %s", model, e)
+            return
+        if isinstance(tokens, int) and tokens > 0:
+            self._ratios[model] = len(sample) / tokens
+            logger.info("Calibrated %s at %.2f chars/token", model, self._ratios[model])
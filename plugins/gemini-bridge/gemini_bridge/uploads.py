@@ -0,0 +1,107 @@
+"""
+Upload Cache
+============
+Tracks media files uploaded through the Gemini Files API, keyed by a hash of
+their content.
+
+Large PDFs and images are uploaded once and later requests reference the
+uploaded file by URI instead of sending megabytes of inline data. Gemini keeps
+uploads for 48 hours, so entries expire a little earlier (``ttl_seconds``).
+
+Like ``ContextCacheRegistry`` the cache does not talk to Gemini itself:
+callers pass ``upload`` and ``delete`` coroutines.
+"""
+
+import hashlib
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from pathlib import Path
+
+from gemini_bridge.singleflight import KeyedLock
+
+logger = logging.getLogger(__name__)
+
+# The Files API deletes uploads after 48 hours.
+DEFAULT_UPLOAD_TTL = 47 * 3600
+_HASH_BLOCK = 1024 * 1024
+
+
+@dataclass(frozen=True)
+class UploadedFile:
+    name: str
+    uri: str
+    mime_type: str
+
+
+@dataclass
+class _Entry:
+    file: UploadedFile
+    expires_at: float
+
+
+UploadFn = Callable[[], Awaitable[UploadedFile]]
+DeleteFn = Callable[[str], Awaitable[None]]
+
+
+def digest_bytes(data: bytes, mime_type: str) -> str:
+    """Content key for in-memory media."""
+    return hashlib.sha256(mime_type.encode("utf-8") + b"\0" + data).hexdigest()
+
+
+def digest_file(path: Path, mime_type: str) -> str:
+    """Content key for a file, hashed in blocks so it is never fully in memory.
+
+    Equal to ``digest_bytes`` of the file's content.
+    """
+    digest = hashlib.sha256(mime_type.encode("utf-8") + b"\0")
+    with open(path, "rb") as f:
+        while block := f.read(_HASH_BLOCK):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class UploadCache:
+    """TTL map from content hashes to files uploaded through the Files API."""
+
+    def __init__(self, *, ttl_seconds: float = DEFAULT_UPLOAD_TTL):
+        self.ttl_seconds = ttl_seconds
+        self.uploaded = 0
+        self.reused = 0
+        self._entries: dict[str, _Entry] = {}
+        self._locks = KeyedLock()
+
+    async def get_or_upload(self, key: str, upload: UploadFn) -> UploadedFile:
+        """Return the uploaded file for key, uploading it if needed.
+
+        Concurrent callers for the same key share a single upload.
+        """
+        async with self._locks.hold(key):
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > time.monotonic():
+                self.reused += 1
+                return entry.file
+            file = await upload()
+            self._entries[key] = _Entry(file, time.monotonic() + self.ttl_seconds)
+            self.uploaded += 1
+            return file
+
+    def invalidate(self, key: str) -> None:
+        """Forget key, e.g. after Gemini rejected the uploaded file."""
+        self._entries.pop(key, None)
+
+    async def clear(self, delete: DeleteFn) -> None:
+        """Delete every tracked upload (best effort)."""
+        while self._entries:
+            _, entry = self._entries.popitem()
+            try:
+                await delete(entry.file.name)
+            except Exception as e:
+                # Gemini deletes uploads after 48 hours anyway.
+                logger.warning("Failed to delete uploaded file %s: %s", entry.file.name, e)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        active = sum(1 for e in self._entries.values() if e.expires_at > now)
+        return {"active": active, "uploaded": self.uploaded, "reused": self.reused}
@@ -0,0 +1,216 @@
+"""
+Fake Gemini API server for load tests and benchmarks.
+
+Speaks just enough of the Gemini REST API (``models.get``, ``generateContent``,
+``streamGenerateContent``, ``countTokens``) for the google-genai SDK to talk to
+it via ``GEMINI_BASE_URL``. Answers echo the prompt after a configurable delay,
+and the server counts requests and distinct client connections so tests can
+check that the bridge reuses its connection pool.
+
+For benchmarks, latency can vary (``latency_jitter_s``, uniform on top of
+``latency_s``), a fraction of generation requests fails with 503
+(``error_rate``), and answers can be padded to ``response_chars``. Random
+choices use a seeded generator, so runs are repeatable.
+
+Run standalone with: python tests/fake_gemini.py --port 8765 --latency 0.2
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_MODEL_PATH = re.compile(r"^/v1beta/models/(?P<model>[^:/?]+)(?::(?P<method>\w+))?")
+
+
+class FakeGemini:
+    """Threaded fake Gemini endpoint; use as a context manager."""
+
+    def __init__(
+        self,
+        *,
+        latency_s: float = 0.0,
+        latency_jitter_s: float = 0.0,
+        error_rate: float = 0.0,
+        response_chars: int = 0,
+        seed: int = 0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.latency_s = latency_s
+        self.latency_jitter_s = latency_jitter_s
+        self.error_rate = error_rate
+        self.response_chars = response_chars
+        self.requests: dict[str, int] = {}
+        self.prompts: list[str] = []  # Text of every generation request
+        self.errors = 0
+        self.connections: set[tuple[str, int]] = set()
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def total_requests(self, method: str | None = None) -> int:
+        with self._lock:
+            if method is not None:
+                return self.requests.get(method, 0)
+            return sum(self.requests.values())
+
+    def __enter__(self) -> "FakeGemini":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _record(self, method: str, client_address) -> None:
+        with self._lock:
+            self.requests[method] = self.requests.get(method, 0) + 1
+            self.connections.add(tuple(client_address[:2]))
+
+    def _draw(self) -> tuple[float, bool]:
+        """Return (delay, fail) for one generation request."""
+        with self._lock:
+            delay = self.latency_s + self._random.uniform(0, self.latency_jitter_s)
+            fail = self._random.random() < self.error_rate
+            self.errors += int(fail)
+        return delay, fail
+
+    def _answer(self, prompt: str) -> str:
+        answer = f"echo: {prompt[:200]}"
+        if len(answer) < self.response_chars:
+            filler = " lorem ipsum dolor sit amet"
+            answer += (filler * (self.response_chars // len(filler) + 1))[
+                : self.response_chars - len(answer)
+            ]
+        return answer
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                match = _MODEL_PATH.match(self.path)
+                if not match:
+                    return self._send(404, {"error": {"code": 404, "message": "not found"}})
+                fake._record("get", self.client_address)
+                self._send(
+                    200,
+                    {
+                        "name": f"models/{match.group('model')}",
+                        "displayName": "Fake Gemini",
+                        "inputTokenLimit": 1048576,
+                        "outputTokenLimit": 65536,
+                    },
+                )
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                match = _MODEL_PATH.match(self.path)
+                method = match.group("method") if match else None
+                if method not in ("generateContent", "streamGenerateContent", "countTokens"):
+                    return self._send(404, {"error": {"code": 404, "message": "not found"}})
+                fake._record(method, self.client_address)
+                prompt = _prompt_text(body)
+                if method == "countTokens":
+                    return self._send(200, {"totalTokens": max(1, len(prompt) // 4)})
+
+                with fake._lock:
+                    fake.prompts.append(prompt)
+                delay, fail = fake._draw()
+                time.sleep(delay)
+                if fail:
+                    return self._send(
+                        503,
+                        {"error": {"code": 503, "message": "overloaded", "status": "UNAVAILABLE"}},
+                    )
+                answer = fake._answer(prompt)
+                if method == "generateContent":
+                    return self._send(200, _response(answer, prompt))
+                self._send_stream([answer[: len(answer) // 2], answer[len(answer) // 2 :]], prompt)
+
+            def _send(self, status: int, payload: dict) -> None:
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, chunks: list[str], prompt: str) -> None:
+                events = b"".join(
+                    b"data: " + json.dumps(_response(chunk, prompt)).encode("utf-8") + b"\r\n\r\n"
+                    for chunk in chunks
+                )
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Content-Length", str(len(events)))
+                self.end_headers()
+                self.wfile.write(events)
+
+        return Handler
+
+
+def _prompt_text(body: dict) -> str:
+    texts = []
+    for content in body.get("contents", []):
+        for part in content.get("parts", []):
+            if "text" in part:
+                texts.append(part["text"])
+    return "\n".join(texts)
+
+
+def _response(text: str, prompt: str) -> dict:
+    return {
+        "candidates": [
+            {"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}
+        ],
+        "usageMetadata": {
+            "promptTokenCount": max(1, len(prompt) // 4),
+            "candidatesTokenCount": max(1, len(text) // 4),
+            "totalTokenCount": max(1, len(prompt) // 4) + max(1, len(text) // 4),
+        },
+        "modelVersion": "fake",
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Fake Gemini API server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds per generation")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--response-chars", type=int, default=0)
+    args = parser.parse_args(argv)
+    fake = FakeGemini(
+        latency_s=args.latency,
+        latency_jitter_s=args.jitter,
+        error_rate=args.error_rate,
+        response_chars=args.response_chars,
+        port=args.port,
+    )
+    with fake:
+        print(f"Fake Gemini listening on {fake.base_url} (set GEMINI_BASE_URL)")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Tests for the Gemini Bridge response cache
+Run with: pytest tests/ -v
+"""
+
+import sqlite3
+import time
+
+import pytest
+
+from gemini_bridge import cache as cache_module
+from gemini_bridge.cache import ResponseCache, default_cache_dir
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return tmp_path / "responses.sqlite3"
+
+
+class TestMakeKey:
+    def test_key_is_stable(self):
+        a = ResponseCache.make_key("m", "prompt", {"temperature": 0.2, "max_output_tokens": 1})
+        b = ResponseCache.make_key("m", "prompt", {"max_output_tokens": 1, "temperature": 0.2})
+        assert a == b
+
+    def test_key_depends_on_all_inputs(self):
+        base = ResponseCache.make_key("m", "prompt", {"temperature": 0.2})
+        assert base != ResponseCache.make_key("other", "prompt", {"temperature": 0.2})
+        assert base != ResponseCache.make_key("m", "prompt!", {"temperature": 0.2})
+        assert base != ResponseCache.make_key("m", "prompt", {"temperature": 0.3})
+
+
+class TestResponseCache:
+    def test_miss_then_hit(self, cache_path):
+        cache = ResponseCache(cache_path)
+        assert cache.get("k") is None
+        cache.put("k", "value")
+        assert cache.get("k") == "value"
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_persists_across_instances(self, cache_path):
+        ResponseCache(cache_path).put("k", "value")
+        fresh = ResponseCache(cache_path)
+        assert fresh.get("k") == "value"
+        assert fresh.stats()["memory_entries"] == 1
+
+    def test_expired_entries_are_dropped(self, cache_path):
+        cache = ResponseCache(cache_path, ttl=0.05)
+        cache.put("k", "value")
+        time.sleep(0.1)
+        assert cache.get("k") is None
+        assert cache.stats()["disk_entries"] == 0
+
+    def test_memory_lru_bounded(self):
+        cache = ResponseCache(None, max_memory_entries=2)
+        cache.put("a", "1")
+        cache.put("b", "2")
+        cache.get("a")
+        cache.put("c", "3")
+        assert cache.get("b") is None
+        assert cache.get("a") == "1"
+        assert cache.get("c") == "3"
+
+    def test_disk_size_eviction_drops_least_recently_used(self, cache_path):
+        cache = ResponseCache(cache_path, max_bytes=25)
+        cache.put("old", "x" * 10)
+        time.sleep(0.01)
+        cache.put("mid", "y" * 10)
+        time.sleep(0.01)
+        cache.put("new", "z" * 10)
+        fresh = ResponseCache(cache_path)
+        assert fresh.get("old") is None
+        assert fresh.get("mid") == "y" * 10
+        assert fresh.get("new") == "z" * 10
+
+    def test_clear(self, cache_path):
+        cache = ResponseCache(cache_path)
+        cache.put("k", "value")
+        cache.clear()
+        assert cache.get("k") is None
+        assert cache.stats()["disk_entries"] == 0
+
+    def test_unwritable_directory_falls_back_to_memory(self, tmp_path):
+        (tmp_path / "not-a-dir").write_text("")
+        cache = ResponseCache(tmp_path / "not-a-dir" / "responses.sqlite3")
+        cache.put("k", "value")
+        assert cache.get("k") == "value"
+        assert cache.stats()["disk_entries"] == 0
+
+    def test_locked_database_does_not_raise(self, cache_path, monkeypatch):
+        monkeypatch.setattr(cache_module, "BUSY_TIMEOUT_SECONDS", 0.05)
+        cache = ResponseCache(cache_path)
+        other = sqlite3.connect(str(cache_path))
+        other.execute("BEGIN EXCLUSIVE")
+        try:
+            cache.put("k", "value")
+            assert cache.get("k") == "value"
+            assert cache.get("missing") is None
+            cache.stats()
+        finally:
+            other.rollback()
+            other.close()
+        cache.put("k2", "value2")
+        assert ResponseCache(cache_path).get("k2") == "value2"
+
+    def test_uses_write_ahead_log(self, cache_path):
+        ResponseCache(cache_path)
+        mode = sqlite3.connect(str(cache_path)).execute("PRAGMA journal_mode").fetchone()[0]
+        assert mode == "wal"
+
+
+class TestDefaultCacheDir:
+    def test_explicit_override(self, monkeypatch, tmp_path):
+        monkeypatch.setenv("GEMINI_CACHE_DIR", str(tmp_path))
+        assert default_cache_dir() == tmp_path
+
+    def test_xdg_cache_home(self, monkeypatch, tmp_path):
+        monkeypatch.delenv("GEMINI_CACHE_DIR", raising=False)
+        monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+        assert default_cache_dir() == tmp_path / "gemini-bridge"
@@ -0,0 +1,65 @@
+"""
+Tests for Gemini Bridge map-reduce chunking
+Run with: pytest tests/ -v
+"""
+
+from gemini_bridge.chunking import make_shards, split_files
+from gemini_bridge.ingest import SourceFile, format_files
+from gemini_bridge.tokens import estimate_tokens
+
+
+def _blob(n_files=40, lines=50, edit=None):
+    files = []
+    for i in range(n_files):
+        body = "".join(f"def f{i}_{j}(): return {j}\n" for j in range(lines))
+        if edit == i:
+            body += "# edited\n"
+        files.append(SourceFile(path=f"src/mod_{i:03d}.py", content=body))
+    return format_files(files)
+
+
+class TestSplitFiles:
+    def test_splits_on_file_blocks(self):
+        blob = _blob(n_files=3, lines=1)
+        segments = split_files(blob)
+        assert [path for path, _ in segments] == [
+            "src/mod_000.py",
+            "src/mod_001.py",
+            "src/mod_002.py",
+        ]
+        assert all(text.startswith("<file ") for _, text in segments)
+
+    def test_unmarked_content_is_single_segment(self):
+        assert split_files("x = 1\ny = 2") == [("", "x = 1\ny = 2")]
+
+
+class TestMakeShards:
+    def test_small_content_is_single_shard(self):
+        blob = _blob(n_files=2, lines=2)
+        assert make_shards(blob, max_tokens=100_000) == [blob]
+
+    def test_shards_respect_limit_and_keep_all_files(self):
+        blob = _blob()
+        shards = make_shards(blob, max_tokens=2_000)
+        assert len(shards) > 1
+        assert all(estimate_tokens(s) <= 2_000 for s in shards)
+        for i in range(40):
+            assert sum(f'path="src/mod_{i:03d}.py"' in s for s in shards) == 1
+
+    def test_file_boundaries_are_preserved(self):
+        for shard in make_shards(_blob(), max_tokens=2_000):
+            assert shard.count("<file ") == shard.count("</file>")
+
+    def test_oversized_unmarked_content_split_on_lines(self):
+        text = "".join(f"line {i}\n" for i in range(1000))
+        shards = make_shards(text, max_tokens=200)
+        assert len(shards) > 1
+        assert all(estimate_tokens(s) <= 200 for s in shards)
+        assert "".join(s if s.endswith("\n") else s + "\n" for s in shards).count("line") == 1000
+
+    def test_single_file_edit_changes_few_shards(self):
+        before = make_shards(_blob(), max_tokens=2_000)
+        after = make_shards(_blob(edit=17), max_tokens=2_000)
+        changed = set(after) - set(before)
+        assert len(changed) == 1
+        assert "# edited" in changed.pop()
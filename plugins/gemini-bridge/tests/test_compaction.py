@@ -0,0 +1,123 @@
+"""
+Tests for codebase payload compaction
+Run with: pytest tests/test_compaction.py -v
+"""
+
+from gemini_bridge.compaction import compact_codebase, compact_text, should_drop
+
+
+def _blob(**files: str) -> str:
+    return "\n\n".join(f'<file path="{path}">\n{text}\n</file>' for path, text in files.items())
+
+
+PY_MODULE = """#!/usr/bin/env python
+# Copyright 2024 Example Corp.
+# Licensed under the Apache License, Version 2.0
+
+import os
+
+
+# Resolve the home directory.
+def home():
+    return os.environ["HOME"]  # not os.path.expanduser
+"""
+
+
+class TestShouldDrop:
+    def test_lock_and_generated_files(self):
+        for path in ("package-lock.json", "web/yarn.lock", "poetry.lock", "api_pb2.py"):
+            assert should_drop(path, "{}")
+        assert should_drop("static/app.min.js", "var a=1;")
+
+    def test_minified_by_line_length(self):
+        assert should_drop("static/bundle.js", "x" * 5000)
+        assert not should_drop("src/long.py", "x" * 5000 + "\n" + "y = 1\n" * 100)
+
+    def test_regular_source_is_kept(self):
+        assert not should_drop("src/app.py", "def main():\n    pass\n")
+
+    def test_custom_patterns(self):
+        assert should_drop("vendor/lib.js", "", ("vendor/*",))
+        assert not should_drop("package-lock.json", "{}", ("vendor/*",))
+
+
+class TestCompactText:
+    def test_license_header_and_whitespace(self):
+        text = compact_text(PY_MODULE, "py")
+        assert "Copyright" not in text and "Licensed" not in text
+        assert text.startswith("#!/usr/bin/env python\n")
+        assert "import os\n\n# Resolve" in text
+        assert "\n\n\n" not in text
+
+    def test_strip_comments_keeps_inline_comments(self):
+        text = compact_text(PY_MODULE, "py", strip_comments=True)
+        assert "# Resolve" not in text
+        assert "# not os.path.expanduser" in text
+        assert "\n\n" not in text
+
+    def test_block_comments(self):
+        source = (
+            "/*\n * SPDX-License-Identifier: MIT\n */\n"
+            "/** Docs. */\nconst a = '//not a comment';\n/* multi\n   line */\nexport { a };\n"
+        )
+        assert compact_text(source, "ts").startswith("/** Docs. */")
+        assert compact_text(source, "ts", strip_comments=True) == (
+            "const a = '//not a comment';\nexport { a };"
+        )
+
+    def test_strip_comments_is_lossy_inside_strings(self):
+        source = 'USAGE = """\nRun it:\n# gemini-bridge --transport stdio\n"""\n'
+        text = compact_text(source, "py", strip_comments=True)
+        assert "# gemini-bridge" not in text
+        assert "Run it:" in text
+
+    def test_css_has_no_line_comments(self):
+        source = "a {\n  color: red;\n}\n// not a CSS comment\n"
+        assert "// not a CSS comment" in compact_text(source, "css", strip_comments=True)
+
+    def test_header_without_license_is_kept(self):
+        assert compact_text("# Helpers for parsing.\nx = 1\n", "py") == (
+            "# Helpers for parsing.\nx = 1"
+        )
+
+    def test_unknown_extension_only_normalizes_whitespace(self):
+        text = "# Title   \n\n\n\nSome text.\n"
+        assert compact_text(text, "md", strip_comments=True) == "# Title\nSome text."
+
+
+class TestCompactCodebase:
+    def test_duplicates_become_references(self):
+        blob = _blob(**{"src/util.py": "x = 1", "vendor/util.py": "x = 1", "b.py": "y = 2"})
+        result, report = compact_codebase(blob)
+        assert '<file path="vendor/util.py" duplicate_of="src/util.py" />' in result
+        assert '<file path="b.py">\ny = 2\n</file>' in result
+        assert report.duplicates == 1
+        assert report.files == 3
+
+    def test_dropped_files_are_listed(self):
+        blob = _blob(**{"app.py": "print()", "package-lock.json": '{"lockfileVersion": 3}'})
+        result, report = compact_codebase(blob)
+        assert "lockfileVersion" not in result
+        assert "<omitted_files" in result and "package-lock.json" in result
+        assert report.dropped == ["package-lock.json"]
+
+    def test_report_counts_bytes(self):
+        blob = _blob(**{"a.py": PY_MODULE, "b.py": PY_MODULE})
+        result, report = compact_codebase(blob, strip_comments=True)
+        assert report.bytes_before == len(blob.encode())
+        assert report.bytes_after == len(result.encode())
+        assert report.bytes_saved > len(PY_MODULE)
+
+    def test_unmarked_content_uses_language_hint(self):
+        result, report = compact_codebase(
+            "// note\nint x;\n\n\n", language="C", strip_comments=True
+        )
+        assert result == "int x;"
+        assert report.files == 0
+
+    def test_output_keeps_file_blocks_splittable(self):
+        from gemini_bridge.chunking import split_files
+
+        blob = _blob(**{"a.py": PY_MODULE, "b.py": "y = 2"})
+        result, _ = compact_codebase(blob)
+        assert [path for path, _ in split_files(result)] == ["a.py", "b.py"]
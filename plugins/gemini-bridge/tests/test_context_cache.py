@@ -0,0 +1,108 @@
+"""
+Tests for the Gemini Bridge context cache registry
+Run with: pytest tests/ -v
+"""
+
+import asyncio
+from unittest.mock import AsyncMock
+
+from gemini_bridge.context_cache import ContextCacheRegistry
+
+
+def _fake_upstream():
+    """Return (create, delete) coroutines that hand out sequential cache names."""
+    counter = {"n": 0}
+
+    async def create(ttl_seconds):
+        counter["n"] += 1
+        await asyncio.sleep(0)
+        return f"cachedContents/{counter['n']}"
+
+    return AsyncMock(side_effect=create), AsyncMock()
+
+
+class TestContextCacheRegistry:
+    async def test_reuses_entry_for_same_key(self):
+        registry = ContextCacheRegistry()
+        create, delete = _fake_upstream()
+        first = await registry.get_or_create("k", create, delete)
+        second = await registry.get_or_create("k", create, delete)
+        assert first == second
+        assert create.await_count == 1
+        assert registry.stats() == {"active": 1, "created": 1, "reused": 1}
+
+    async def test_concurrent_callers_share_one_create(self):
+        registry = ContextCacheRegistry()
+        create, delete = _fake_upstream()
+        names = await asyncio.gather(
+            *(registry.get_or_create("k", create, delete) for _ in range(5))
+        )
+        assert len(set(names)) == 1
+        assert create.await_count == 1
+
+    async def test_passes_ttl_to_create(self):
+        registry = ContextCacheRegistry(ttl_seconds=600)
+        create, delete = _fake_upstream()
+        await registry.get_or_create("k", create, delete)
+        create.assert_awaited_once_with(600)
+
+    async def test_lru_eviction_deletes_upstream(self):
+        registry = ContextCacheRegistry(max_entries=2)
+        create, delete = _fake_upstream()
+        await registry.get_or_create("a", create, delete)
+        await registry.get_or_create("b", create, delete)
+        await registry.get_or_create("a", create, delete)
+        await registry.get_or_create("c", create, delete)
+        delete.assert_awaited_once_with("cachedContents/2")
+        assert registry.stats()["active"] == 2
+
+    async def test_expired_entries_are_recreated(self):
+        # A TTL below the expiry margin makes every entry immediately stale.
+        registry = ContextCacheRegistry(ttl_seconds=1)
+        create, delete = _fake_upstream()
+        await registry.get_or_create("k", create, delete)
+        await registry.get_or_create("k", create, delete)
+        assert create.await_count == 2
+        delete.assert_awaited_once_with("cachedContents/1")
+
+    async def test_delete_failure_is_swallowed(self):
+        registry = ContextCacheRegistry()
+        create, _ = _fake_upstream()
+        delete = AsyncMock(side_effect=RuntimeError("gone"))
+        await registry.get_or_create("k", create, delete)
+        await registry.invalidate("k", delete)
+        assert registry.stats()["active"] == 0
+
+    async def test_locks_do_not_accumulate(self):
+        registry = ContextCacheRegistry(max_entries=2)
+        create, delete = _fake_upstream()
+        for key in ("a", "b", "c", "d"):
+            await registry.get_or_create(key, create, delete)
+        await registry.invalidate("d", delete)
+        assert len(registry._locks) == 0
+
+    async def test_invalidate_waits_for_create_in_progress(self):
+        registry = ContextCacheRegistry()
+        created = asyncio.Event()
+        release = asyncio.Event()
+
+        async def slow_create(ttl_seconds):
+            created.set()
+            await release.wait()
+            return "cachedContents/1"
+
+        delete = AsyncMock()
+        task = asyncio.create_task(registry.get_or_create("k", slow_create, delete))
+        await created.wait()
+        invalidation = asyncio.create_task(registry.invalidate("k", delete))
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(task, invalidation)
+        delete.assert_awaited_once_with("cachedContents/1")
+        assert registry.stats()["active"] == 0
+
+    def test_key_depends_on_model_and_content(self):
+        base = ContextCacheRegistry.make_key("m", "code", "sys")
+        assert base == ContextCacheRegistry.make_key("m", "code", "sys")
+        assert base != ContextCacheRegistry.make_key("other", "code", "sys")
+        assert base != ContextCacheRegistry.make_key("m", "code2", "sys")
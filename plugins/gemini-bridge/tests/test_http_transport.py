@@ -0,0 +1,229 @@
+"""
+Load test for the shared HTTP transport
+Run with: pytest tests/test_http_transport.py -v
+
+Starts the bridge as a streamable-HTTP server in a subprocess, pointed at a
+local fake Gemini endpoint, and drives it with many concurrent MCP sessions.
+"""
+
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+import pytest
+from fake_gemini import FakeGemini
+from mcp import ClientSession, types
+from mcp.client.streamable_http import streamable_http_client
+
+PLUGIN_DIR = Path(__file__).resolve().parent.parent
+SESSIONS = 12
+CALLS_PER_SESSION = 5
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port: int, proc: subprocess.Popen, timeout: float = 15.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"bridge exited early with code {proc.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"bridge did not listen on port {port}")
+
+
+@pytest.fixture
+def fake_gemini():
+    with FakeGemini(latency_s=0.05) as fake:
+        yield fake
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    """The bridge's working directory; client roots must lie within it."""
+    path = tmp_path / "workspace"
+    path.mkdir()
+    return path
+
+
+@pytest.fixture
+def bridge(fake_gemini, tmp_path, workspace):
+    port = _free_port()
+    env = {
+        **os.environ,
+        "GEMINI_API_KEY": "test-key",
+        "GEMINI_BASE_URL": fake_gemini.base_url,
+        "GEMINI_CACHE_DIR": str(tmp_path),
+        "PYTHONPATH": str(PLUGIN_DIR),
+    }
+    command = [sys.executable, "-m", "gemini_bridge.server"]
+    command += ["--transport", "streamable-http", "--port", str(port)]
+    log_path = tmp_path / "bridge.log"
+    with open(log_path, "wb") as log:
+        proc = subprocess.Popen(command, cwd=workspace, env=env, stdout=log, stderr=log)
+    try:
+        _wait_for_port(port, proc)
+        yield proc, f"http://127.0.0.1:{port}/mcp", log_path
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+
+async def _call(url: str, tool: str, arguments: dict) -> str:
+    async with streamable_http_client(url) as (read, write, _):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            result = await session.call_tool(tool, arguments)
+            assert not result.isError, result.content[0].text
+            return result.content[0].text
+
+
+async def _session(url: str, index: int) -> list[str]:
+    async with streamable_http_client(url) as (read, write, _):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            results = []
+            for call in range(CALLS_PER_SESSION):
+                # Every session also asks one question all sessions share.
+                prompt = "shared question" if call == 0 else f"session {index} call {call}"
+                result = await session.call_tool("gemini_analyze_text", {"prompt": prompt})
+                assert not result.isError, result.content[0].text
+                results.append(result.content[0].text)
+            return results
+
+
+async def _analyze_in_root(url: str, root_uri: str) -> types.CallToolResult:
+    """Call gemini_analyze_paths from a session whose client declares root_uri."""
+
+    async def list_roots(context) -> types.ListRootsResult:
+        return types.ListRootsResult(roots=[types.Root(uri=root_uri)])
+
+    async with streamable_http_client(url) as (read, write, _):
+        async with ClientSession(read, write, list_roots_callback=list_roots) as session:
+            await session.initialize()
+            return await session.call_tool(
+                "gemini_analyze_paths", {"paths": ["app.py"], "task": "review"}
+            )
+
+
+class TestSharedHttpBridge:
+    async def test_many_sessions_share_one_bridge(self, bridge, fake_gemini):
+        _, url, _ = bridge
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(_session(url, i) for i in range(SESSIONS)))
+        elapsed = time.perf_counter() - start
+
+        assert all(r[0] == "echo: shared question" for r in results)
+        assert results[3][2] == "echo: session 3 call 2"
+        # The shared question reached Gemini once: one response cache and one
+        # coalescing layer serve every session.
+        unique_prompts = 1 + SESSIONS * (CALLS_PER_SESSION - 1)
+        assert fake_gemini.total_requests("generateContent") == unique_prompts
+        # One client, one connection pool: connections are bounded by the
+        # bridge's concurrency cap, not by the number of sessions or calls.
+        assert len(fake_gemini.connections) <= 8
+        # Sessions run concurrently rather than one after another.
+        assert elapsed < unique_prompts * fake_gemini.latency_s
+
+        metrics = json.loads(await _call(url, "gemini_metrics", {}))
+        assert metrics["tools"]["gemini_analyze_text"]["calls"] == SESSIONS * CALLS_PER_SESSION
+
+    async def test_sessions_use_their_own_roots(self, bridge, fake_gemini, workspace):
+        _, url, _ = bridge
+
+        async def analyze(project: Path) -> None:
+            result = await _analyze_in_root(url, project.as_uri())
+            assert not result.isError, result.content[0].text
+
+        for name in ("alpha", "beta"):
+            (workspace / name).mkdir()
+            (workspace / name / "app.py").write_text(f"PROJECT = '{name}'\n")
+        await asyncio.gather(analyze(workspace / "alpha"), analyze(workspace / "beta"))
+        # One request per analysis: incremental summaries are opt-in.
+        prompts = sorted(fake_gemini.prompts, key=lambda p: "beta" in p)
+        assert len(prompts) == 2
+        assert "PROJECT = 'alpha'" in prompts[0] and "beta" not in prompts[0]
+        assert "PROJECT = 'beta'" in prompts[1] and "alpha" not in prompts[1]
+
+    async def test_root_outside_working_directory_is_refused(self, bridge, fake_gemini):
+        _, url, _ = bridge
+        result = await _analyze_in_root(url, "file:///")
+        assert result.isError
+        assert "Access denied" in result.content[0].text
+        assert "working directory" in result.content[0].text
+        assert fake_gemini.prompts == []
+
+    async def test_prometheus_endpoint(self, bridge):
+        _, url, _ = bridge
+        await _call(url, "gemini_analyze_text", {"prompt": "scrape me"})
+
+        metrics_url = url.removesuffix("/mcp") + "/metrics"
+        with await asyncio.to_thread(urllib.request.urlopen, metrics_url, timeout=5) as response:
+            content_type = response.headers["Content-Type"]
+            text = response.read().decode()
+        assert content_type.startswith("text/plain; version=0.0.4")
+        assert 'gemini_bridge_tool_calls_total{tool="gemini_analyze_text"} 1' in text
+        assert "gemini_bridge_tool_upstream_latency_seconds_count" in text
+
+    async def test_graceful_shutdown(self, bridge, fake_gemini):
+        proc, url, log_path = bridge
+        assert "operational" in (await _call(url, "gemini_status", {})).lower()
+
+        proc.send_signal(signal.SIGTERM)
+        # uvicorn re-raises the signal after shutting down cleanly.
+        assert await asyncio.to_thread(proc.wait, 15) in (0, -signal.SIGTERM)
+        log = log_path.read_text()
+        assert "Gemini Bridge shut down" in log
+        assert "Application shutdown complete" in log
+
+
+class TestFakeGemini:
+    def test_injected_errors_and_response_size(self):
+        import httpx
+
+        url = "/v1beta/models/fake:generateContent"
+        body = {"contents": [{"parts": [{"text": "hi"}]}]}
+        with FakeGemini(error_rate=1.0) as fake:
+            assert httpx.post(fake.base_url + url, json=body).status_code == 503
+            assert fake.errors == 1
+        with FakeGemini(response_chars=500) as fake:
+            response = httpx.post(fake.base_url + url, json=body).json()
+            text = response["candidates"][0]["content"]["parts"][0]["text"]
+            assert text.startswith("echo: hi") and len(text) == 500
+
+
+class TestLoadBenchmark:
+    async def test_reports_throughput_and_percentiles(self, bridge):
+        import importlib.util
+
+        spec = importlib.util.spec_from_file_location(
+            "load_benchmark", PLUGIN_DIR / "benchmarks" / "load_benchmark.py"
+        )
+        load_benchmark = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(load_benchmark)
+
+        proc, url, _ = bridge
+        result = await load_benchmark.bench_tool(
+            url, proc.pid, "gemini_analyze_text", clients=3, requests=9, repeat=0.3, seed=1
+        )
+        assert result["calls"] == 9
+        assert result["errors"] == 0
+        assert result["throughput_rps"] > 0
+        assert result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"]
+        assert load_benchmark.percentile([1, 2, 3, 4], 50) == 2
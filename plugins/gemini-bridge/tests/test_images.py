@@ -0,0 +1,70 @@
+"""
+Tests for image pre-processing
+Run with: pytest tests/test_images.py -v
+"""
+
+import io
+
+import pytest
+
+from gemini_bridge.images import prepare_image
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def _png(size, mode="RGB", noise=True) -> bytes:
+    image = Image.new(mode, size, (200, 30, 30, 128) if mode == "RGBA" else (200, 30, 30))
+    if noise:
+        # A gradient keeps the encoder from compressing the image to nothing.
+        for x in range(0, size[0], 7):
+            for y in range(0, size[1], 7):
+                image.putpixel((x, y), (x % 256, y % 256, 90) + ((255,) if mode == "RGBA" else ()))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class TestPrepareImage:
+    def test_large_image_is_downscaled(self):
+        data = _png((3000, 1500))
+        prepared, mime_type = prepare_image(data, "image/png", max_edge=1000)
+
+        assert mime_type == "image/png"
+        assert len(prepared) < len(data)
+        with Image.open(io.BytesIO(prepared)) as image:
+            assert image.format == "PNG"
+            assert image.size == (1000, 500)
+
+    def test_jpeg_stays_jpeg(self):
+        buffer = io.BytesIO()
+        Image.new("RGB", (2000, 1000), (10, 120, 200)).save(buffer, format="JPEG")
+        prepared, mime_type = prepare_image(buffer.getvalue(), "image/jpeg", max_edge=500)
+
+        assert mime_type == "image/jpeg"
+        with Image.open(io.BytesIO(prepared)) as image:
+            assert (image.format, image.size) == ("JPEG", (500, 250))
+
+    def test_transparency_is_kept_as_png(self):
+        data = _png((2000, 1000), mode="RGBA")
+        prepared, mime_type = prepare_image(data, "image/png", max_edge=500)
+
+        assert mime_type == "image/png"
+        with Image.open(io.BytesIO(prepared)) as image:
+            assert image.mode == "RGBA"
+            assert image.size == (500, 250)
+
+    def test_image_within_limit_is_not_reencoded(self):
+        data = _png((800, 600))
+        assert prepare_image(data, "image/png", max_edge=1000) == (data, "image/png")
+
+    def test_disabled_with_zero_max_edge(self):
+        data = _png((3000, 1500))
+        assert prepare_image(data, "image/png", max_edge=0) == (data, "image/png")
+
+    def test_non_raster_types_unchanged(self):
+        assert prepare_image(b"%PDF-1.7", "application/pdf") == (b"%PDF-1.7", "application/pdf")
+        assert prepare_image(b"GIF89a", "image/gif") == (b"GIF89a", "image/gif")
+
+    def test_undecodable_image_unchanged(self):
+        data = b"\x89PNG\r\n\x1a\n" + b"\x00" * 100
+        assert prepare_image(data, "image/png") == (data, "image/png")
@@ -0,0 +1,77 @@
+"""
+Tests for incremental codebase analysis state
+Run with: pytest tests/test_incremental.py -v
+"""
+
+from pathlib import Path
+
+import pytest
+
+from gemini_bridge.incremental import AnalysisStore, digest_text, format_plan, plan_analysis
+from gemini_bridge.ingest import SourceFile
+
+ROOT = Path("/project")
+
+
+def _files(**contents: str) -> list[SourceFile]:
+    return [SourceFile(path.replace("__", "/"), text) for path, text in contents.items()]
+
+
+@pytest.fixture(params=["memory", "disk"])
+def store(request, tmp_path):
+    return AnalysisStore(None if request.param == "memory" else tmp_path / "analyses")
+
+
+class TestAnalysisStore:
+    def test_round_trip(self, store):
+        files = _files(a="x = 1\n", b="y = 2\n")
+        assert store.load(ROOT, ["."]) is None
+        assert store.save(ROOT, ["."], files, {"a": "Defines x.", "b": "Defines y."}) == 2
+        state = store.load(ROOT, ["."])
+        assert state["a"] == {"sha256": digest_text("x = 1\n"), "summary": "Defines x."}
+
+    def test_files_without_summary_are_not_recorded(self, store):
+        files = _files(a="x = 1\n", b="y = 2\n")
+        assert store.save(ROOT, ["."], files, {"a": "Defines x.", "b": ""}) == 1
+        assert list(store.load(ROOT, ["."])) == ["a"]
+
+    def test_keyed_by_root_and_patterns(self, store):
+        store.save(ROOT, ["src", "tests"], _files(a="x"), {"a": "A."})
+        assert store.load(ROOT, ["tests", "src"]) is not None
+        assert store.load(ROOT, ["src"]) is None
+        assert store.load(Path("/other"), ["src", "tests"]) is None
+
+    def test_corrupt_file_is_ignored(self, tmp_path):
+        store = AnalysisStore(tmp_path)
+        store.save(ROOT, ["."], _files(a="x"), {"a": "A."})
+        next(tmp_path.glob("*.json")).write_text("{not json")
+        assert store.load(ROOT, ["."]) is None
+
+
+class TestPlan:
+    def test_splits_changed_unchanged_and_removed(self):
+        previous = {
+            "same.py": {"sha256": digest_text("same"), "summary": "Unchanged."},
+            "edited.py": {"sha256": digest_text("old"), "summary": "Old."},
+            "gone.py": {"sha256": digest_text("gone"), "summary": "Gone."},
+        }
+        files = _files(**{"same.py": "same", "edited.py": "new", "added.py": "added"})
+        plan = plan_analysis(files, previous)
+        assert [f.path for f in plan.changed] == ["edited.py", "added.py"]
+        assert plan.unchanged == [("same.py", "Unchanged.")]
+        assert plan.removed == ["gone.py"]
+
+    def test_no_previous_state_changes_everything(self):
+        plan = plan_analysis(_files(a="1", b="2"), {})
+        assert [f.path for f in plan.changed] == ["a", "b"]
+        assert plan.unchanged == [] and plan.removed == []
+
+    def test_format_plan(self):
+        previous = {"old.py": {"sha256": digest_text("old"), "summary": "Old module."}}
+        plan = plan_analysis(_files(**{"old.py": "old", "new.py": "print()"}), previous)
+        plan.removed = ["gone.py"]
+        text = format_plan(plan)
+        assert '<file path="new.py">\nprint()\n</file>' in text
+        assert '<file_summary path="old.py">\nOld module.\n</file_summary>' in text
+        assert "<removed_files>\ngone.py\n</removed_files>" in text
+        assert '<file path="old.py">' not in text
@@ -0,0 +1,213 @@
+"""
+Tests for the repository embedding index
+Run with: pytest tests/test_index.py -v
+"""
+
+import hashlib
+import os
+
+import pytest
+
+from gemini_bridge.index import Chunk, RepoIndex, chunk_text, read_lines
+
+np = pytest.importorskip("numpy")
+
+DIM = 64
+
+
+def _vector(text: str) -> list[float]:
+    """Deterministic bag-of-words embedding: similar texts share dimensions."""
+    vector = [0.0] * DIM
+    for word in text.lower().split():
+        vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % DIM] += 1.0
+    return vector
+
+
+class FakeEmbedder:
+    def __init__(self):
+        self.texts: list[str] = []
+
+    async def __call__(self, texts: list[str]) -> list[list[float]]:
+        self.texts += texts
+        return [_vector(text) for text in texts]
+
+
+@pytest.fixture
+def repo(tmp_path):
+    root = tmp_path / "repo"
+    (root / "src").mkdir(parents=True)
+    (root / "src" / "retry.py").write_text("def backoff delay jitter retry\n" * 3)
+    (root / "src" / "cache.py").write_text("class cache sqlite eviction ttl\n" * 3)
+    (root / "README.md").write_text("project documentation overview\n")
+    return root
+
+
+def _index(tmp_path, root, model="embed-model"):
+    return RepoIndex(tmp_path / "index", root, model=model, dim=DIM)
+
+
+class TestChunkText:
+    def test_splits_on_line_count(self):
+        text = "".join(f"line {i}\n" for i in range(1, 131))
+        chunks = chunk_text(text, max_lines=60)
+        assert [(first, last) for first, last, _ in chunks] == [(1, 60), (61, 120), (121, 130)]
+        assert chunks[1][2].startswith("line 61\n")
+
+    def test_splits_on_characters(self):
+        chunks = chunk_text("a" * 40 + "\n" + "b" * 40 + "\n", max_chars=50)
+        assert [(first, last) for first, last, _ in chunks] == [(1, 1), (2, 2)]
+
+    def test_long_line_is_its_own_chunk(self):
+        chunks = chunk_text("x" * 500 + "\nshort\n", max_chars=100)
+        assert [(first, last) for first, last, _ in chunks] == [(1, 1), (2, 2)]
+
+    def test_blank_chunks_dropped(self):
+        assert chunk_text("\n\n   \n") == []
+        assert chunk_text("") == []
+
+    def test_read_lines(self, tmp_path):
+        path = tmp_path / "f.txt"
+        path.write_text("one\ntwo\nthree\n")
+        assert read_lines(path, 2, 3) == "two\nthree\n"
+
+
+class TestRepoIndex:
+    async def test_build_and_search(self, tmp_path, repo):
+        index = _index(tmp_path, repo)
+        stats = await index.update(FakeEmbedder())
+
+        assert stats["files"] == 3
+        assert stats["embedded_chunks"] == 3
+        ((score, chunk),) = index.search(_vector("retry backoff delay"), 1)
+        assert chunk == Chunk("src/retry.py", 1, 3)
+        assert score > 0.5
+
+    async def test_symlink_escaping_root_not_indexed(self, tmp_path, repo):
+        outside = tmp_path / "outside"
+        outside.mkdir()
+        (outside / "secret.py").write_text("def secret retry token\n")
+        (repo / "src" / "secret.py").symlink_to(outside / "secret.py")
+        embedder = FakeEmbedder()
+        stats = await _index(tmp_path, repo).update(embedder)
+        assert stats["files"] == 3
+        assert not any("secret" in text for text in embedder.texts)
+
+    async def test_search_orders_best_first(self, tmp_path, repo):
+        index = _index(tmp_path, repo)
+        await index.update(FakeEmbedder())
+        hits = index.search(_vector("cache eviction"), 10)
+        assert len(hits) == 3
+        assert hits[0][1].path == "src/cache.py"
+        assert [s for s, _ in hits] == sorted((s for s, _ in hits), reverse=True)
+
+    async def test_unchanged_tree_embeds_nothing(self, tmp_path, repo):
+        index = _index(tmp_path, repo)
+        await index.update(FakeEmbedder())
+        written = index.vectors_path.stat().st_mtime_ns
+        embedder = FakeEmbedder()
+        stats = await index.update(embedder)
+        assert embedder.texts == []
+        assert stats["reused_files"] == 3
+        assert index.vectors_path.stat().st_mtime_ns == written
+
+    async def test_touched_file_with_same_content_is_not_reembedded(self, tmp_path, repo):
+        index = _index(tmp_path, repo)
+        await index.update(FakeEmbedder())
+        path = repo / "src" / "retry.py"
+        os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 10**9))
+        embedder = FakeEmbedder()
+        await index.update(embedder)
+        assert embedder.texts == []
+
+    async def test_only_changed_files_are_reembedded(self, tmp_path, repo):
+        index = _index(tmp_path, repo)
+        await index.update(FakeEmbedder())
+        (repo / "src" / "cache.py").write_text("class lru memory cache\n")
+        (repo / "README.md").unlink()
+        (repo / "src" / "new.py").write_text("def tokens estimate\n")
+
+        embedder = FakeEmbedder()
+        stats = await index.update(embedder)
+        assert sorted(t.split(":")[0] for t in embedder.texts) == ["src/cache.py", "src/new.py"]
+        assert (stats["changed_files"], stats["removed_files"], stats["reused_files"]) == (2, 1, 1)
+        # Reused vectors were copied to their new rows.
+        assert index.search(_vector("retry backoff delay"), 1)[0][1].path == "src/retry.py"
+        assert index.search(_vector("lru memory"), 1)[0][1] == Chunk("src/cache.py", 1, 1)
+
+    async def test_refresh_drops_pattern_that_matches_nothing(self, tmp_path, repo):
+        index = _index(tmp_path, repo)
+        await index.update(FakeEmbedder(), ["src", "README.md"])
+        for path in (repo / "src").iterdir():
+            path.unlink()
+        (repo / "src").rmdir()
+
+        stats = await index.update(FakeEmbedder())
+        assert (stats["files"], stats["removed_files"]) == (1, 2)
+        assert [chunk.path for _, chunk in index.search(_vector("cache"), 5)] == ["README.md"]
+        with pytest.raises(FileNotFoundError):
+            await index.update(FakeEmbedder(), ["src"])
+
+    async def test_persisted_and_reloaded(self, tmp_path, repo):
+        await _index(tmp_path, repo).update(FakeEmbedder(), ["src"])
+        reloaded = _index(tmp_path, repo)
+        assert reloaded.exists()
+        assert reloaded.patterns == ["src"]
+        assert reloaded.stats()["files"] == 2
+        embedder = FakeEmbedder()
+        await reloaded.update(embedder)
+        assert embedder.texts == []
+        assert not list((tmp_path / "index").glob("*.tmp*"))
+
+    async def test_vectors_are_memory_mapped(self, tmp_path, repo):
+        index = _index(tmp_path, repo)
+        await index.update(FakeEmbedder())
+        assert isinstance(index._snapshot.vectors, np.memmap)
+
+    async def test_search_during_update_sees_the_old_index(self, tmp_path, repo, monkeypatch):
+        index = _index(tmp_path, repo)
+        await index.update(FakeEmbedder())
+        during = []
+        load = np.load
+
+        def load_while_searching(*args, **kwargs):
+            # The files are already replaced; the new snapshot is not swapped in yet.
+            during.append(index.search(_vector("retry backoff delay"), 10))
+            return load(*args, **kwargs)
+
+        monkeypatch.setattr(np, "load", load_while_searching)
+        (repo / "src" / "extra.py").write_text("unrelated words here\n")
+        await index.update(FakeEmbedder())
+        assert [chunk.path for _, chunk in during[0]][0] == "src/retry.py"
+        assert len(during[0]) == 3
+        assert len(index.search(_vector("retry backoff delay"), 10)) == 4
+
+    async def test_different_model_rebuilds(self, tmp_path, repo):
+        await _index(tmp_path, repo).update(FakeEmbedder())
+        other = _index(tmp_path, repo, model="other-model")
+        assert not other.exists()
+        embedder = FakeEmbedder()
+        await other.update(embedder)
+        assert len(embedder.texts) == 3
+
+    async def test_embedding_count_mismatch_raises(self, tmp_path, repo):
+        async def broken(texts):
+            return [[1.0] * DIM]
+
+        with pytest.raises(RuntimeError, match="1 vectors for 3 chunks"):
+            await _index(tmp_path, repo).update(broken)
+
+    async def test_wrong_dimension_raises(self, tmp_path, repo):
+        async def short(texts):
+            return [[1.0, 0.0] for _ in texts]
+
+        with pytest.raises(RuntimeError, match="not 64-dimensional"):
+            await _index(tmp_path, repo).update(short)
+
+    async def test_empty_tree(self, tmp_path):
+        root = tmp_path / "empty"
+        root.mkdir()
+        (root / "blank.txt").write_text("\n")
+        index = _index(tmp_path, root)
+        stats = await index.update(FakeEmbedder())
+        assert stats["chunks"] == 0
+        assert index.search(_vector("anything"), 5) == []
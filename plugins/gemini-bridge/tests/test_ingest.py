@@ -0,0 +1,147 @@
+"""
+Tests for Gemini Bridge server-side codebase ingestion
+Run with: pytest tests/ -v
+"""
+
+import pytest
+
+from gemini_bridge.ingest import GitIgnore, collect_files, format_files, read_files
+
+
+@pytest.fixture
+def repo(tmp_path):
+    """A small project tree with a .gitignore, nested ignores and a binary file."""
+    (tmp_path / ".gitignore").write_text("*.log\nbuild/\n/secret.env\n!keep.log\n")
+    (tmp_path / "src" / "pkg").mkdir(parents=True)
+    (tmp_path / "src" / "main.py").write_text("print('main')\n")
+    (tmp_path / "src" / "pkg" / "util.py").write_text("def util(): ...\n")
+    (tmp_path / "src" / "pkg" / ".gitignore").write_text("generated_*.py\n")
+    (tmp_path / "src" / "pkg" / "generated_api.py").write_text("# generated\n")
+    (tmp_path / "src" / "logo.png").write_bytes(b"\x89PNG\r\n\x1a\n\x00\x00")
+    (tmp_path / "build").mkdir()
+    (tmp_path / "build" / "out.py").write_text("compiled\n")
+    (tmp_path / "debug.log").write_text("noise\n")
+    (tmp_path / "keep.log").write_text("important\n")
+    (tmp_path / "secret.env").write_text("KEY=1\n")
+    (tmp_path / ".git").mkdir()
+    (tmp_path / ".git" / "config").write_text("[core]\n")
+    return tmp_path
+
+
+def _rel(paths, root):
+    return [p.relative_to(root).as_posix() for p in paths]
+
+
+class TestGitIgnore:
+    def test_unanchored_matches_any_depth(self):
+        ignore = GitIgnore()
+        ignore.add_rule("*.pyc")
+        assert ignore.is_ignored("a.pyc", is_dir=False)
+        assert ignore.is_ignored("deep/dir/a.pyc", is_dir=False)
+
+    def test_anchored_matches_root_only(self):
+        ignore = GitIgnore()
+        ignore.add_rule("/dist")
+        assert ignore.is_ignored("dist", is_dir=True)
+        assert not ignore.is_ignored("src/dist", is_dir=True)
+
+    def test_dir_only_rule(self):
+        ignore = GitIgnore()
+        ignore.add_rule("cache/")
+        assert ignore.is_ignored("cache", is_dir=True)
+        assert not ignore.is_ignored("cache", is_dir=False)
+
+    def test_negation_last_match_wins(self):
+        ignore = GitIgnore()
+        ignore.add_rule("*.md")
+        ignore.add_rule("!README.md")
+        assert ignore.is_ignored("NOTES.md", is_dir=False)
+        assert not ignore.is_ignored("README.md", is_dir=False)
+
+    def test_double_star(self):
+        ignore = GitIgnore()
+        ignore.add_rule("docs/**/*.html")
+        assert ignore.is_ignored("docs/a/b/index.html", is_dir=False)
+        assert ignore.is_ignored("docs/index.html", is_dir=False)
+        assert not ignore.is_ignored("src/index.html", is_dir=False)
+
+    def test_nested_rules_are_relative_to_base(self):
+        ignore = GitIgnore()
+        ignore.add_rule("/local.py", base="pkg")
+        assert ignore.is_ignored("pkg/local.py", is_dir=False)
+        assert not ignore.is_ignored("local.py", is_dir=False)
+
+
+class TestCollectFiles:
+    def test_directory_walk_honours_gitignore(self, repo):
+        files = _rel(collect_files(["."], repo), repo)
+        assert "src/main.py" in files
+        assert "src/pkg/util.py" in files
+        assert "keep.log" in files
+        assert "debug.log" not in files
+        assert "build/out.py" not in files
+        assert "secret.env" not in files
+        assert "src/pkg/generated_api.py" not in files
+        assert not any(f.startswith(".git/") for f in files)
+
+    def test_glob_pattern(self, repo):
+        files = _rel(collect_files(["src/**/*.py"], repo), repo)
+        assert files == ["src/main.py", "src/pkg/util.py"]
+
+    def test_explicit_ignored_file_is_skipped(self, repo):
+        assert collect_files(["secret.env", "src/main.py"], repo) == [repo / "src" / "main.py"]
+
+    def test_path_outside_root_denied(self, repo):
+        with pytest.raises(PermissionError, match="Access denied"):
+            collect_files(["../elsewhere"], repo)
+        with pytest.raises(PermissionError, match="Access denied"):
+            collect_files(["/etc/passwd"], repo)
+
+    def test_symlink_escaping_root_denied(self, repo, tmp_path_factory):
+        outside = tmp_path_factory.mktemp("outside")
+        (outside / "x.py").write_text("x = 1\n")
+        (repo / "link.py").symlink_to(outside / "x.py")
+        with pytest.raises(PermissionError, match="outside the working directory"):
+            collect_files(["link.py"], repo)
+
+    def test_walk_skips_symlink_escaping_root(self, repo, tmp_path_factory):
+        outside = tmp_path_factory.mktemp("outside")
+        (outside / "secret.py").write_text("TOKEN = 'x'\n")
+        (outside / "dir").mkdir()
+        (outside / "dir" / "y.py").write_text("y = 1\n")
+        (repo / "src" / "leak.py").symlink_to(outside / "secret.py")
+        (repo / "src" / "leakdir").symlink_to(outside / "dir")
+        (repo / "src" / "alias.py").symlink_to(repo / "src" / "main.py")
+
+        paths = collect_files(["src"], repo)
+        assert "src/leak.py" not in _rel(paths, repo)
+        assert "src/alias.py" in _rel(paths, repo)
+        files, _ = read_files(paths, repo)
+        assert not any("TOKEN" in f.content or "y = 1" in f.content for f in files)
+
+    def test_no_match_raises(self, repo):
+        with pytest.raises(FileNotFoundError, match="No files match"):
+            collect_files(["*.rs"], repo)
+
+
+class TestReadFiles:
+    def test_refuses_paths_outside_root(self, repo, tmp_path_factory):
+        outside = tmp_path_factory.mktemp("outside")
+        (outside / "x.py").write_text("x = 1\n")
+        (repo / "src" / "main.py").unlink()
+        (repo / "src" / "main.py").symlink_to(outside / "x.py")
+        files, skipped = read_files([repo / "src" / "main.py"], repo)
+        assert files == []
+        assert skipped == ["src/main.py"]
+
+    def test_skips_binary_and_oversized(self, repo):
+        (repo / "src" / "big.py").write_text("x" * 200)
+        paths = collect_files(["src"], repo)
+        files, skipped = read_files(paths, repo, max_workers=2, max_file_bytes=100)
+        assert [f.path for f in files] == ["src/main.py", "src/pkg/.gitignore", "src/pkg/util.py"]
+        assert sorted(skipped) == ["src/big.py", "src/logo.png"]
+
+    def test_format_files_marks_paths(self, repo):
+        files, _ = read_files([repo / "src" / "main.py"], repo)
+        blob = format_files(files)
+        assert blob == "<file path=\"src/main.py\">\nprint('main')\n\n</file>"
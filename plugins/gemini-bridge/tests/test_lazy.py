@@ -0,0 +1,33 @@
+"""
+Tests for lazy imports
+Run with: pytest tests/test_lazy.py -v
+"""
+
+import sys
+
+import pytest
+
+from gemini_bridge.lazy import LazyModule, is_installed
+
+
+class TestLazyModule:
+    def test_import_deferred_until_attribute_access(self, monkeypatch):
+        monkeypatch.delitem(sys.modules, "colorsys", raising=False)
+        colorsys = LazyModule("colorsys")
+        assert "colorsys" not in sys.modules
+        assert colorsys.rgb_to_hsv(1.0, 0.0, 0.0)[0] == 0.0
+        assert "colorsys" in sys.modules
+
+    def test_missing_module_raises_on_use(self):
+        missing = LazyModule("gemini_bridge_no_such_module")
+        with pytest.raises(ModuleNotFoundError):
+            missing.anything
+
+
+class TestIsInstalled:
+    def test_installed(self):
+        assert is_installed("json")
+
+    def test_not_installed(self):
+        assert not is_installed("gemini_bridge_no_such_module")
+        assert not is_installed("gemini_bridge_no_such_package.sub")
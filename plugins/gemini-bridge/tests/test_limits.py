@@ -0,0 +1,93 @@
+"""
+Tests for per-tool generation limits
+Run with: pytest tests/test_limits.py -v
+"""
+
+import json
+
+import pytest
+
+from gemini_bridge.limits import DEFAULT_TOOL_LIMITS, GenerationLimits, LimitsTable, load_limits
+
+
+def _table(tools=None):
+    return LimitsTable(tools, max_output_tokens=8192, thinking_budget=None)
+
+
+class TestLimitsTable:
+    def test_tool_defaults(self):
+        limits = _table().resolve("gemini_compare_approaches")
+        assert limits == GenerationLimits(8192, 4096)
+
+    def test_unknown_tool_uses_global_defaults(self):
+        assert _table().resolve("gemini_analyze_codebase") == GenerationLimits(8192, None)
+        assert _table().resolve(None) == GenerationLimits(8192, None)
+
+    def test_call_overrides_win(self):
+        limits = _table().resolve(
+            "gemini_compare_approaches", thinking_budget=0, max_output_tokens=1024
+        )
+        assert limits == GenerationLimits(1024, 0)
+
+    def test_global_thinking_budget(self):
+        table = LimitsTable({}, max_output_tokens=4096, thinking_budget=512)
+        assert table.resolve("gemini_analyze_text") == GenerationLimits(4096, 512)
+
+    @pytest.mark.parametrize(
+        "overrides", [{"max_output_tokens": 0}, {"thinking_budget": -2}]
+    )
+    def test_invalid_overrides_raise(self, overrides):
+        with pytest.raises(ValueError, match="must be"):
+            _table().resolve("gemini_analyze_text", **overrides)
+
+
+class TestExpanded:
+    def test_at_least_doubles(self):
+        assert GenerationLimits(8192, 4096).expanded(100, 65536) == GenerationLimits(16384, 4096)
+
+    def test_makes_room_for_observed_thinking(self):
+        grown = GenerationLimits(8192).expanded(20000, 65536)
+        assert grown.max_output_tokens == 28192
+
+    def test_capped(self):
+        assert GenerationLimits(8192).expanded(100000, 20000).max_output_tokens == 20000
+
+    def test_none_when_already_at_cap(self):
+        assert GenerationLimits(65536).expanded(1000, 65536) is None
+
+
+class TestLoadLimits:
+    def test_inline_json_merges_over_defaults(self):
+        tools = load_limits('{"gemini_compare_approaches": {"max_output_tokens": 2048}}')
+        assert tools["gemini_compare_approaches"] == {
+            "thinking_budget": 4096,
+            "max_output_tokens": 2048,
+        }
+        assert tools["gemini_analyze_text"] == DEFAULT_TOOL_LIMITS["gemini_analyze_text"]
+
+    def test_null_restores_model_default_thinking(self):
+        tools = load_limits('{"gemini_analyze_text": {"thinking_budget": null}}')
+        assert _table(tools).resolve("gemini_analyze_text").thinking_budget is None
+
+    def test_file_path(self, tmp_path):
+        path = tmp_path / "limits.json"
+        path.write_text(json.dumps({"gemini_analyze_codebase": {"thinking_budget": 8192}}))
+        assert load_limits(str(path))["gemini_analyze_codebase"] == {"thinking_budget": 8192}
+
+    def test_invalid_json_raises(self):
+        with pytest.raises(ValueError, match="not valid JSON"):
+            load_limits("{")
+
+    def test_non_object_raises(self, tmp_path):
+        path = tmp_path / "limits.json"
+        path.write_text("[]")
+        with pytest.raises(ValueError, match="JSON object"):
+            load_limits(str(path))
+
+    def test_unknown_keys_raise(self):
+        with pytest.raises(ValueError, match="unknown keys: temperature"):
+            load_limits('{"gemini_analyze_text": {"temperature": 1}}')
+
+    def test_invalid_values_raise(self):
+        with pytest.raises(ValueError, match="max_output_tokens must be a positive integer"):
+            load_limits('{"gemini_analyze_text": {"max_output_tokens": null}}')
@@ -0,0 +1,133 @@
+"""
+Tests for Prometheus export and structured logging
+Run with: pytest tests/test_observability.py -v
+"""
+
+import json
+import logging
+from pathlib import Path
+
+from gemini_bridge.metrics import CallUsage, Histogram, Metrics, current_tool
+from gemini_bridge.observability import (
+    JsonFormatter,
+    RequestContextFilter,
+    current_request_id,
+    process_textfile,
+    render_prometheus,
+    write_textfile,
+)
+
+
+class TestHistogram:
+    def test_cumulative_buckets(self):
+        histogram = Histogram(bounds=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.7, 5.0):
+            histogram.observe(value)
+        assert histogram.cumulative() == [("0.1", 1), ("1.0", 3), ("+Inf", 4)]
+        assert histogram.count == 4
+        assert histogram.total == 6.25
+
+    def test_quantile_uses_bucket_bounds(self):
+        histogram = Histogram(bounds=(0.1, 1.0, 10.0))
+        for value in [0.05] * 50 + [0.5] * 45 + [5.0] * 5:
+            histogram.observe(value)
+        assert histogram.quantile(0.5) == 0.1
+        assert histogram.quantile(0.95) == 1.0
+        assert histogram.quantile(0.99) == 10.0
+
+    def test_record_observes_tool_latency(self):
+        metrics = Metrics()
+        metrics.record("tool", CallUsage(requests=1), 0.3)
+        metrics.observe("tool", "queue_wait_seconds", 0.02)
+        histograms = metrics.snapshot()["tools"]["tool"]["histograms"]
+        assert histograms["latency_seconds"]["count"] == 1
+        assert histograms["queue_wait_seconds"]["sum"] == 0.02
+
+
+class TestRenderPrometheus:
+    def _metrics(self) -> Metrics:
+        metrics = Metrics()
+        metrics.record("gemini_analyze_text", CallUsage(requests=2, prompt_tokens=100), 0.3)
+        metrics.increment("gemini_analyze_text", "retries", 1)
+        return metrics
+
+    def test_counters_and_histograms(self):
+        text = render_prometheus(self._metrics())
+        assert "# TYPE gemini_bridge_tool_calls_total counter" in text
+        assert 'gemini_bridge_tool_calls_total{tool="gemini_analyze_text"} 1' in text
+        assert (
+            'gemini_bridge_tool_tokens_total{tool="gemini_analyze_text",kind="prompt"} 100'
+            in text
+        )
+        assert (
+            'gemini_bridge_tool_events_total{tool="gemini_analyze_text",event="retries"} 1'
+            in text
+        )
+        assert "# TYPE gemini_bridge_tool_latency_seconds histogram" in text
+        assert (
+            'gemini_bridge_tool_latency_seconds_bucket{tool="gemini_analyze_text",le="+Inf"} 1'
+            in text
+        )
+        assert 'gemini_bridge_tool_latency_seconds_count{tool="gemini_analyze_text"} 1' in text
+
+    def test_gauges_and_label_escaping(self):
+        metrics = Metrics()
+        metrics.record('odd"tool', CallUsage(), 0.1)
+        text = render_prometheus(metrics, {"response_cache_hits": 3})
+        assert "gemini_bridge_response_cache_hits 3" in text
+        assert 'tool="odd\\"tool"' in text
+
+    def test_every_sample_follows_its_type_line(self):
+        typed = set()
+        for line in render_prometheus(self._metrics(), {"uploads_active": 0}).splitlines():
+            if line.startswith("# TYPE"):
+                typed.add(line.split()[2])
+            elif not line.startswith("#"):
+                name = line.split("{")[0].split()[0]
+                assert any(name == t or name.startswith(t + "_") for t in typed), line
+
+    def test_constant_labels_on_every_sample(self):
+        text = render_prometheus(self._metrics(), {"uploads_active": 0}, {"pid": "42"})
+        samples = [line for line in text.splitlines() if not line.startswith("#")]
+        assert samples
+        assert all('{pid="42"' in line for line in samples)
+
+    def test_process_textfile(self):
+        path = process_textfile(Path("/var/lib/textfile/gemini_bridge.prom"), 42)
+        assert path == Path("/var/lib/textfile/gemini_bridge.42.prom")
+        assert process_textfile(Path("metrics"), 7).name == "metrics.7.prom"
+
+    def test_write_textfile_is_atomic(self, tmp_path):
+        path = tmp_path / "textfile" / "gemini_bridge.prom"
+        write_textfile(path, "a 1\n")
+        write_textfile(path, "a 2\n")
+        assert path.read_text() == "a 2\n"
+        assert [p.name for p in path.parent.iterdir()] == ["gemini_bridge.prom"]
+
+
+class TestJsonLogs:
+    def _format(self, message: str, **extra) -> dict:
+        record = logging.makeLogRecord({"name": "gemini_bridge", "levelname": "INFO"})
+        record.msg = message
+        for key, value in extra.items():
+            setattr(record, key, value)
+        RequestContextFilter(current_tool).filter(record)
+        return json.loads(JsonFormatter().format(record))
+
+    def test_carries_request_id_and_tool(self):
+        request_token = current_request_id.set("abc123")
+        tool_token = current_tool.set("gemini_analyze_text")
+        try:
+            entry = self._format("done", status="ok", latency_s=0.5)
+        finally:
+            current_tool.reset(tool_token)
+            current_request_id.reset(request_token)
+        assert entry["message"] == "done"
+        assert entry["level"] == "INFO"
+        assert entry["request_id"] == "abc123"
+        assert entry["tool"] == "gemini_analyze_text"
+        assert (entry["status"], entry["latency_s"]) == ("ok", 0.5)
+
+    def test_outside_a_call_omits_context(self):
+        entry = self._format("startup")
+        assert "request_id" not in entry and "tool" not in entry
@@ -0,0 +1,65 @@
+"""
+Tests for pairwise ranking aggregation
+Run with: pytest tests/test_ranking.py -v
+"""
+
+import pytest
+
+from gemini_bridge.ranking import Outcome, all_pairs, bradley_terry, pair_order, rank
+
+
+class TestPairs:
+    def test_every_pair_once(self):
+        pairs = all_pairs(["a", "b", "c", "d"])
+        assert len(pairs) == 6
+        assert {frozenset(p) for p in pairs} == {
+            frozenset((i, j)) for i in range(4) for j in range(i + 1, 4)
+        }
+
+    def test_order_depends_on_content_not_position(self):
+        approaches = ["use a lock", "use a queue"]
+        i, j = pair_order(approaches, 0, 1)
+        assert pair_order(approaches, 1, 0) == (i, j)
+        swapped = pair_order(list(reversed(approaches)), 0, 1)
+        assert [approaches[k] for k in (i, j)] == [approaches[::-1][k] for k in swapped]
+
+
+class TestBradleyTerry:
+    def test_scores_sum_to_one_and_follow_results(self):
+        outcomes = [Outcome(0, 1, 0), Outcome(0, 2, 0), Outcome(1, 2, 1)]
+        scores = bradley_terry(3, outcomes)
+        assert sum(scores) == pytest.approx(1.0)
+        assert scores[0] > scores[1] > scores[2] > 0
+
+    def test_cycle_is_a_draw(self):
+        outcomes = [Outcome(0, 1, 0), Outcome(1, 2, 1), Outcome(2, 0, 2)]
+        assert bradley_terry(3, outcomes) == pytest.approx([1 / 3] * 3)
+
+    def test_opponent_strength_counts(self):
+        # 0 and 3 both won their only game, but 0 beat the strong 1 and 3 the weak 2.
+        outcomes = [Outcome(0, 1, 0), Outcome(1, 2, 1), Outcome(1, 4, 1), Outcome(2, 3, 3)]
+        scores = bradley_terry(5, outcomes)
+        assert scores[0] > scores[3]
+
+
+class TestRank:
+    OUTCOMES = [Outcome(0, 1, 1), Outcome(0, 2, None), Outcome(1, 2, 1)]
+
+    def test_standings(self):
+        first, second, third = rank(3, self.OUTCOMES)
+        assert (first.index, first.wins, first.losses) == (1, 2, 0)
+        assert {second.index, third.index} == {0, 2}
+        assert second.ties == third.ties == 1
+
+    def test_wins_method_counts_ties_as_half(self):
+        standings = rank(3, self.OUTCOMES, "wins")
+        assert [(s.index, s.score) for s in standings] == [(1, 2.0), (0, 0.5), (2, 0.5)]
+
+    def test_missing_comparisons_are_tolerated(self):
+        standings = rank(3, [Outcome(0, 1, 0)])
+        assert standings[0].index == 0
+        assert standings[-1].index == 1
+
+    def test_unknown_method(self):
+        with pytest.raises(ValueError, match="Unknown ranking method"):
+            rank(2, [], "elo")
@@ -0,0 +1,240 @@
+"""
+Tests for rate limiting, retries and hedging
+Run with: pytest tests/test_resilience.py -v
+"""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from gemini_bridge.resilience import (
+    RateLimiter,
+    TokenBucket,
+    backoff_delay,
+    call_with_retries,
+    hedged,
+    is_retryable,
+    retry_after,
+)
+
+
+class FakeAPIError(Exception):
+    def __init__(self, code, details=None, headers=None):
+        super().__init__(f"{code} error")
+        self.code = code
+        self.details = details
+        if headers is not None:
+            self.response = httpx.Response(code, headers=headers)
+
+
+class TestTokenBucket:
+    async def test_burst_up_to_capacity_is_free(self):
+        bucket = TokenBucket(60)
+        waited = await bucket.acquire(60)
+        assert waited == 0
+
+    async def test_waits_for_refill(self):
+        bucket = TokenBucket(600)  # 10 per second
+        await bucket.acquire(600)
+        start = time.perf_counter()
+        waited = await bucket.acquire(1)
+        elapsed = time.perf_counter() - start
+        assert waited == pytest.approx(0.1, abs=0.05)
+        assert elapsed >= 0.08
+
+    async def test_oversized_request_is_clamped(self):
+        bucket = TokenBucket(60)
+        assert await bucket.acquire(1000) == 0
+
+
+class TestRateLimiter:
+    async def test_disabled_by_default(self):
+        limiter = RateLimiter()
+        for _ in range(100):
+            assert await limiter.acquire(10_000) == 0
+
+    async def test_token_limit(self):
+        limiter = RateLimiter(tokens_per_minute=6000)  # 100 tokens/s
+        await limiter.acquire(6000)
+        waited = await limiter.acquire(10)
+        assert waited == pytest.approx(0.1, abs=0.05)
+        assert limiter.waited_s == pytest.approx(waited)
+
+
+class TestClassification:
+    @pytest.mark.parametrize("code", [408, 429, 500, 502, 503, 504])
+    def test_retryable_codes(self, code):
+        assert is_retryable(FakeAPIError(code))
+
+    @pytest.mark.parametrize("code", [400, 401, 403, 404])
+    def test_client_errors_not_retryable(self, code):
+        assert not is_retryable(FakeAPIError(code))
+
+    def test_connection_errors_retryable(self):
+        assert is_retryable(httpx.ConnectError("boom"))
+        assert is_retryable(ConnectionResetError())
+
+    def test_plain_errors_not_retryable(self):
+        assert not is_retryable(RuntimeError("bug"))
+
+    def test_retry_after_header(self):
+        assert retry_after(FakeAPIError(429, headers={"Retry-After": "7"})) == 7.0
+
+    def test_retry_info_detail(self):
+        details = {
+            "error": {
+                "details": [
+                    {"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "12s"}
+                ]
+            }
+        }
+        assert retry_after(FakeAPIError(429, details=details)) == 12.0
+
+    def test_no_hint(self):
+        assert retry_after(FakeAPIError(429)) is None
+
+    def test_backoff_is_capped(self):
+        for attempt in range(1, 20):
+            assert 0 <= backoff_delay(attempt, base_delay=1, max_delay=5) <= 5
+
+    def test_backoff_uses_hint(self):
+        assert backoff_delay(1, base_delay=0.1, max_delay=60, hint=3) >= 3
+
+
+class TestCallWithRetries:
+    async def test_retries_until_success(self):
+        attempts = []
+
+        async def fn():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise FakeAPIError(429)
+            return "ok"
+
+        retries = []
+        result = await call_with_retries(
+            fn,
+            max_attempts=5,
+            base_delay=0.01,
+            max_delay=0.1,
+            on_retry=lambda attempt, delay, e: retries.append(attempt),
+        )
+        assert result == "ok"
+        assert retries == [1, 2]
+
+    async def test_non_retryable_raises_immediately(self):
+        attempts = []
+
+        async def fn():
+            attempts.append(1)
+            raise ValueError("bad request")
+
+        with pytest.raises(ValueError):
+            await call_with_retries(fn, max_attempts=5, base_delay=0.01, max_delay=0.1)
+        assert len(attempts) == 1
+
+    async def test_gives_up_after_max_attempts(self):
+        attempts = []
+
+        async def fn():
+            attempts.append(1)
+            raise FakeAPIError(503)
+
+        with pytest.raises(FakeAPIError):
+            await call_with_retries(fn, max_attempts=3, base_delay=0.01, max_delay=0.1)
+        assert len(attempts) == 3
+
+    async def test_hint_beyond_max_delay_raises(self):
+        async def fn():
+            raise FakeAPIError(429, headers={"Retry-After": "3600"})
+
+        with pytest.raises(FakeAPIError):
+            await call_with_retries(fn, max_attempts=5, base_delay=0.01, max_delay=1)
+
+    async def test_retry_if_vetoes_retry(self):
+        attempts = []
+
+        async def fn():
+            attempts.append(1)
+            raise FakeAPIError(503)
+
+        with pytest.raises(FakeAPIError):
+            await call_with_retries(
+                fn, max_attempts=5, base_delay=0.01, max_delay=0.1, retry_if=lambda e: False
+            )
+        assert len(attempts) == 1
+
+
+class TestHedged:
+    async def test_fast_call_is_not_hedged(self):
+        hedges = []
+
+        async def fn():
+            return "fast"
+
+        assert await hedged(fn, 0.5, on_hedge=lambda: hedges.append(1)) == "fast"
+        assert hedges == []
+
+    async def test_hedge_wins_over_slow_call(self):
+        calls = []
+        cancelled = []
+
+        async def fn():
+            calls.append(1)
+            n = len(calls)
+            try:
+                await asyncio.sleep(5 if n == 1 else 0.01)
+            except asyncio.CancelledError:
+                cancelled.append(n)
+                raise
+            return n
+
+        start = time.perf_counter()
+        result = await hedged(fn, 0.05)
+        assert result == 2
+        assert time.perf_counter() - start < 1
+        await asyncio.sleep(0)
+        assert cancelled == [1]
+
+    async def test_one_failure_falls_back_to_other(self):
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            if len(calls) == 1:
+                await asyncio.sleep(0.1)
+                raise FakeAPIError(503)
+            await asyncio.sleep(0.2)
+            return "second"
+
+        assert await hedged(fn, 0.05) == "second"
+
+    async def test_both_failures_raise(self):
+        async def fn():
+            await asyncio.sleep(0.1)
+            raise FakeAPIError(503)
+
+        with pytest.raises(FakeAPIError):
+            await hedged(fn, 0.01)
+
+    async def test_cancelling_caller_cancels_both_calls(self):
+        started = []
+        cancelled = []
+
+        async def fn():
+            started.append(1)
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(len(started))
+                raise
+
+        task = asyncio.ensure_future(hedged(fn, 0.01))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert len(started) == 2
+        assert len(cancelled) == 2
@@ -0,0 +1,107 @@
+"""
+Tests for model routing
+Run with: pytest tests/test_routing.py -v
+"""
+
+import json
+
+import pytest
+
+from gemini_bridge.routing import DEFAULT_RULES, Decision, Router, RouteRequest, Rule, load_rules
+
+
+def _router(rules=DEFAULT_RULES):
+    return Router(rules, pro_model="pro-model", fast_model="fast-model")
+
+
+class TestDefaultRules:
+    def test_short_text_goes_to_fast_model(self):
+        decision = _router().route(RouteRequest("gemini_analyze_text", 300))
+        assert decision == Decision("fast-model", "short-text")
+
+    def test_long_text_goes_to_pro_model(self):
+        decision = _router().route(RouteRequest("gemini_analyze_text", 50_000))
+        assert decision == Decision("pro-model", "default")
+
+    def test_codebase_analysis_goes_to_pro_model(self):
+        decision = _router().route(RouteRequest("gemini_analyze_codebase", 100))
+        assert decision == Decision("pro-model", "deep-analysis")
+
+    def test_ranking_goes_to_pro_model(self):
+        decision = _router().route(RouteRequest("gemini_rank_approaches", 100))
+        assert decision == Decision("pro-model", "deep-analysis")
+
+    def test_quality_hint_overrides_tool_rules(self):
+        router = _router()
+        assert router.route(RouteRequest("gemini_analyze_text", 100, "best")).model == "pro-model"
+        fast = router.route(RouteRequest("gemini_compare_approaches", 100, "fast"))
+        assert fast == Decision("fast-model", "quality-fast")
+
+    def test_large_thinking_budget_goes_to_pro_model(self):
+        request = RouteRequest("gemini_analyze_text", 100, thinking_budget=16_384)
+        assert _router().route(request) == Decision("pro-model", "heavy-thinking")
+
+    def test_unknown_tool_defaults_to_pro_model(self):
+        assert _router().route(RouteRequest(None, 10)) == Decision("pro-model", "default")
+
+    def test_invalid_quality_raises(self):
+        with pytest.raises(ValueError, match="quality must be one of"):
+            _router().route(RouteRequest("gemini_analyze_text", 10, "cheap"))
+
+    def test_no_rules_always_routes_to_pro_model(self):
+        decision = _router(()).route(RouteRequest("gemini_analyze_text", 10, "fast"))
+        assert decision == Decision("pro-model", "default")
+
+
+class TestRule:
+    def test_tool_patterns_use_fnmatch(self):
+        rule = Rule("vision", "fast", tools=("gemini_analyze_image*",))
+        assert rule.matches(RouteRequest("gemini_analyze_images", 0))
+        assert not rule.matches(RouteRequest("gemini_analyze_text", 0))
+
+    def test_token_bounds_are_inclusive(self):
+        rule = Rule("mid", "fast", min_prompt_tokens=100, max_prompt_tokens=200)
+        assert rule.matches(RouteRequest("t", 100))
+        assert rule.matches(RouteRequest("t", 200))
+        assert not rule.matches(RouteRequest("t", 99))
+        assert not rule.matches(RouteRequest("t", 201))
+
+    def test_max_thinking_budget_ignores_requests_without_budget(self):
+        rule = Rule("light", "fast", max_thinking_budget=1024)
+        assert rule.matches(RouteRequest("t", 0))
+        assert rule.matches(RouteRequest("t", 0, thinking_budget=512))
+        assert not rule.matches(RouteRequest("t", 0, thinking_budget=4096))
+
+    def test_literal_model_name_is_used_as_is(self):
+        router = _router((Rule("lite", "gemini-2.5-flash-lite"),))
+        assert router.route(RouteRequest("t", 0)).model == "gemini-2.5-flash-lite"
+
+
+class TestLoadRules:
+    def test_inline_json(self):
+        rules = load_rules('[{"name": "tiny", "model": "fast", "max_prompt_tokens": 500}]')
+        assert rules == (Rule("tiny", "fast", max_prompt_tokens=500),)
+
+    def test_file_path(self, tmp_path):
+        path = tmp_path / "rules.json"
+        path.write_text(json.dumps([{"model": "pro", "tools": ["gemini_analyze_image"]}]))
+        rules = load_rules(str(path))
+        assert rules == (Rule("rule-0", "pro", tools=("gemini_analyze_image",)),)
+
+    def test_invalid_json_raises(self):
+        with pytest.raises(ValueError, match="not valid JSON"):
+            load_rules("[{")
+
+    def test_non_list_raises(self, tmp_path):
+        path = tmp_path / "rules.json"
+        path.write_text('{"model": "fast"}')
+        with pytest.raises(ValueError, match="JSON list"):
+            load_rules(str(path))
+
+    def test_missing_model_raises(self):
+        with pytest.raises(ValueError, match='"model"'):
+            load_rules('[{"name": "x"}]')
+
+    def test_unknown_keys_raise(self):
+        with pytest.raises(ValueError, match="unknown keys: max_tokens"):
+            load_rules('[{"model": "fast", "max_tokens": 5}]')
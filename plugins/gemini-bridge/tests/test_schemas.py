@@ -0,0 +1,107 @@
+"""
+Tests for structured output schemas
+Run with: pytest tests/test_schemas.py -v
+"""
+
+import json
+
+import pytest
+
+from gemini_bridge.schemas import (
+    BUILTIN_SCHEMAS,
+    COMPARISON_SCHEMA,
+    FINDINGS_SCHEMA,
+    parse_response,
+    resolve_schema,
+    validate,
+)
+
+COMPARISON = {
+    "approach_a": {"strengths": ["fast"], "weaknesses": []},
+    "approach_b": {"strengths": [], "weaknesses": ["slow"]},
+    "recommendation": "approach_a",
+    "rationale": "A is faster.",
+    "hybrid": None,
+}
+
+
+class TestResolveSchema:
+    def test_free_text_by_default(self):
+        assert resolve_schema(None, False, "comparison") is None
+
+    def test_json_mode_uses_tool_default(self):
+        assert resolve_schema(None, True, "findings") is FINDINGS_SCHEMA
+
+    def test_builtin_name(self):
+        assert resolve_schema("comparison", False, "findings") is COMPARISON_SCHEMA
+
+    def test_schema_object_and_json_text(self):
+        schema = {"type": "object", "properties": {"ok": {"type": "boolean"}}}
+        assert resolve_schema(schema, False, "findings") == schema
+        assert resolve_schema(json.dumps(schema), False, "findings") == schema
+
+    def test_unknown_name_raises(self):
+        with pytest.raises(ValueError, match="built-in schemas: comparison, findings"):
+            resolve_schema("summary", False, "findings")
+
+    def test_invalid_json_raises(self):
+        with pytest.raises(ValueError, match="not valid JSON"):
+            resolve_schema("{type:", False, "findings")
+
+    def test_schema_without_type_raises(self):
+        with pytest.raises(ValueError, match='"type"'):
+            resolve_schema({"properties": {}}, False, "findings")
+
+
+class TestValidate:
+    def test_builtin_schemas_accept_conforming_values(self):
+        findings = {
+            "summary": "One issue.",
+            "findings": [
+                {"title": "SQL injection", "severity": "high", "description": "...",
+                 "file": "app.py", "line": 12},
+            ],
+        }
+        assert validate(COMPARISON, COMPARISON_SCHEMA) == []
+        assert validate(findings, FINDINGS_SCHEMA) == []
+
+    def test_reports_missing_required_property(self):
+        value = {k: v for k, v in COMPARISON.items() if k != "rationale"}
+        assert validate(value, COMPARISON_SCHEMA) == ["$: missing required property 'rationale'"]
+
+    def test_reports_nested_type_errors_with_path(self):
+        value = {"summary": "s", "findings": [{"title": "t", "severity": "high",
+                                               "description": "d", "line": "12"}]}
+        assert validate(value, FINDINGS_SCHEMA) == ["$.findings[0].line: expected integer, got str"]
+
+    def test_enum(self):
+        value = {**COMPARISON, "recommendation": "neither"}
+        (error,) = validate(value, COMPARISON_SCHEMA)
+        assert error.startswith("$.recommendation: 'neither' is not one of")
+
+    def test_null_only_when_nullable(self):
+        assert validate({**COMPARISON, "rationale": None}, COMPARISON_SCHEMA) == [
+            "$.rationale: must not be null"
+        ]
+
+    def test_bool_is_not_an_integer(self):
+        assert validate(True, {"type": "integer"}) == ["$: expected integer, got bool"]
+
+    def test_uppercase_types(self):
+        assert validate(["a"], {"type": "ARRAY", "items": {"type": "STRING"}}) == []
+
+    def test_all_builtins_are_objects(self):
+        assert all(schema["type"] == "object" for schema in BUILTIN_SCHEMAS.values())
+
+
+class TestParseResponse:
+    def test_returns_parsed_value(self):
+        assert parse_response(json.dumps(COMPARISON), COMPARISON_SCHEMA) == COMPARISON
+
+    def test_invalid_json_raises(self):
+        with pytest.raises(ValueError, match="invalid JSON"):
+            parse_response("Approach A is better.", COMPARISON_SCHEMA)
+
+    def test_schema_mismatch_raises(self):
+        with pytest.raises(ValueError, match="does not match the schema"):
+            parse_response("{}", COMPARISON_SCHEMA)
@@ -3,92 +3,210 @@ Tests for Gemini Bridge MCP Server
 Run with: pytest tests/ -v
 """
 
+import asyncio
+import json
+import logging
 import os
-from unittest.mock import MagicMock, patch
+import re
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
 import gemini_bridge.server as server_module
+from gemini_bridge.cache import ResponseCache
+from gemini_bridge.incremental import AnalysisStore
+from gemini_bridge.metrics import Metrics
+from gemini_bridge.singleflight import SingleFlight
+from gemini_bridge.tokens import TokenEstimator
 
 
 @pytest.fixture(autouse=True)
-def reset_client():
-    """Reset the cached client between tests to prevent state leakage."""
+def reset_client(monkeypatch):
+    """Reset the cached client between tests to prevent state leakage.
+
+    Incremental analysis is off by default so gemini_analyze_paths makes a
+    single request; TestIncrementalAnalysis turns it on.
+    """
     server_module._client = None
+    server_module._request_semaphore = None
+    server_module._response_cache = ResponseCache(None)
+    server_module._context_caches = None
+    server_module._metrics = Metrics()
+    server_module._token_estimator = TokenEstimator()
+    server_module._rate_limiter = None
+    server_module._flights = SingleFlight()
+    server_module._status_check = None
+    server_module._uploads = None
+    server_module._router = None
+    server_module._limits = None
+    server_module._indexes = {}
+    server_module._analysis_store = AnalysisStore(None)
+    monkeypatch.setattr(server_module, "INCREMENTAL", False)
     yield
     server_module._client = None
+    server_module._request_semaphore = None
+    server_module._rate_limiter = None
+    server_module._response_cache = None
+    server_module._context_caches = None
 
 
 # -- Unit Tests (no API key required) ----------------------------------------
 
 
 class TestGeminiStatus:
-    def test_status_no_api_key(self):
+    @staticmethod
+    def _status_client(text="GEMINI_BRIDGE_OK"):
+        model = MagicMock()
+        model.display_name = "Gemini 2.5 Pro"
+        model.input_token_limit = 1048576
+        model.output_token_limit = 65536
+        mock_response = MagicMock()
+        mock_response.text = text
+        mock_client = MagicMock()
+        mock_client.aio.models.get = AsyncMock(return_value=model)
+        mock_client.aio.models.generate_content = AsyncMock(return_value=mock_response)
+        return mock_client
+
+    async def test_status_no_api_key(self):
         """Should return error message when API key is missing."""
         with patch.dict(os.environ, {}, clear=True):
-            result = server_module.gemini_status()
+            result = await server_module.gemini_status()
         assert "GEMINI_API_KEY not set" in result
 
-    def test_status_with_mock(self):
+    async def test_status_with_mock(self):
         """Should return OK status with valid mock response."""
-        mock_response = MagicMock()
-        mock_response.text = "GEMINI_BRIDGE_OK"
-        mock_client = MagicMock()
-        mock_client.models.generate_content.return_value = mock_response
+        mock_client = self._status_client()
 
         with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
             with patch("google.genai.Client", return_value=mock_client):
-                result = server_module.gemini_status()
+                result = await server_module.gemini_status()
         assert "operational" in result.lower()
+        assert "1,048,576 input" in result
+
+    async def test_default_check_uses_metadata_only(self):
+        """The default check must not spend tokens on a generation request."""
+        mock_client = self._status_client()
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                result = await server_module.gemini_status()
+        assert "model metadata" in result
+        mock_client.aio.models.get.assert_awaited_once()
+        mock_client.aio.models.generate_content.assert_not_awaited()
+
+    async def test_deep_check_runs_generation_probe(self):
+        mock_client = self._status_client()
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                result = await server_module.gemini_status(deep=True)
+        assert "generation probe" in result
+        mock_client.aio.models.generate_content.assert_awaited_once()
+
+    async def test_successful_check_is_cached(self):
+        mock_client = self._status_client()
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_status()
+                result = await server_module.gemini_status()
+        assert "(cached)" in result
+        assert mock_client.aio.models.get.await_count == 1
+
+    async def test_cache_expires_after_ttl(self):
+        mock_client = self._status_client()
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with patch.object(server_module, "STATUS_TTL", 0):
+                    await server_module.gemini_status()
+                    result = await server_module.gemini_status()
+        assert "(cached)" not in result
+        assert mock_client.aio.models.get.await_count == 2
+
+    async def test_deep_check_not_served_from_metadata_cache(self):
+        mock_client = self._status_client()
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_status()
+                await server_module.gemini_status(deep=True)
+                result = await server_module.gemini_status()
+        assert mock_client.aio.models.generate_content.await_count == 1
+        assert "generation probe" in result and "(cached)" in result
+
+    async def test_failures_are_not_cached(self):
+        mock_client = self._status_client()
+        mock_client.aio.models.get = AsyncMock(side_effect=ConnectionError("down"))
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_status()
+                await server_module.gemini_status()
+        assert mock_client.aio.models.get.await_count == 2
+
+    async def test_status_reports_rolling_latency_and_errors(self):
+        from gemini_bridge.metrics import CallUsage
 
-    def test_status_unexpected_response(self):
+        server_module._metrics.record("gemini_analyze_text", CallUsage(requests=1), 1.0)
+        server_module._metrics.record(
+            "gemini_analyze_text", CallUsage(requests=1), 3.0, error=True
+        )
+        mock_client = self._status_client()
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                result = await server_module.gemini_status()
+        assert "p50 1.00s" in result
+        assert "p95 3.00s" in result
+        assert "error rate 50.0%" in result
+
+    async def test_status_unexpected_response(self):
         """Should return warning when Gemini responds without expected token."""
-        mock_response = MagicMock()
-        mock_response.text = "Hello, how can I help?"
-        mock_client = MagicMock()
-        mock_client.models.generate_content.return_value = mock_response
+        mock_client = self._status_client("Hello, how can I help?")
 
         with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
             with patch("google.genai.Client", return_value=mock_client):
-                result = server_module.gemini_status()
+                result = await server_module.gemini_status(deep=True)
         assert "Unexpected response" in result
 
-    def test_status_none_response_text(self):
+    async def test_status_none_response_text(self):
         """Should handle None response.text gracefully."""
-        mock_response = MagicMock()
-        mock_response.text = None
-        mock_client = MagicMock()
-        mock_client.models.generate_content.return_value = mock_response
+        mock_client = self._status_client(None)
 
         with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
             with patch("google.genai.Client", return_value=mock_client):
-                result = server_module.gemini_status()
+                result = await server_module.gemini_status(deep=True)
         assert "Unexpected response" in result
 
-    def test_status_connection_failure(self):
+    async def test_status_connection_failure(self):
         """Should return error when API call fails."""
         mock_client = MagicMock()
-        mock_client.models.generate_content.side_effect = ConnectionError("Network unreachable")
+        mock_client.aio.models.get = AsyncMock(side_effect=ConnectionError("Network unreachable"))
 
         with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
             with patch("google.genai.Client", return_value=mock_client):
-                result = server_module.gemini_status()
-        assert "Connection failed" in result
+                result = await server_module.gemini_status()
+        assert "Connection to Gemini service failed" in result
 
-    def test_status_shows_full_tool_names(self):
+    async def test_status_shows_full_tool_names(self):
         """Tool names in status output must use the full gemini_ prefix."""
-        mock_response = MagicMock()
-        mock_response.text = "GEMINI_BRIDGE_OK"
-        mock_client = MagicMock()
-        mock_client.models.generate_content.return_value = mock_response
+        mock_client = self._status_client()
 
         with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
             with patch("google.genai.Client", return_value=mock_client):
-                result = server_module.gemini_status()
+                result = await server_module.gemini_status()
         assert "gemini_analyze_text" in result
+        assert "gemini_batch_analyze" in result
         assert "gemini_analyze_codebase" in result
+        assert "gemini_analyze_paths" in result
         assert "gemini_analyze_image" in result
+        assert "gemini_analyze_images" in result
         assert "gemini_compare_approaches" in result
+        assert "gemini_rank_approaches" in result
+        for tool in await server_module.mcp.list_tools():
+            assert tool.name == "gemini_status" or tool.name in result
 
 
 class TestToolSignatures:
@@ -113,6 +231,13 @@ class TestToolSignatures:
         assert "image_path" in sig.parameters
         assert "question" in sig.parameters
 
+    def test_analyze_images_exists(self):
+        import inspect
+        sig = inspect.signature(server_module.gemini_analyze_images)
+        assert "paths" in sig.parameters
+        assert "question" in sig.parameters
+        assert "mode" in sig.parameters
+
     def test_compare_approaches_exists(self):
         import inspect
         sig = inspect.signature(server_module.gemini_compare_approaches)
@@ -120,15 +245,22 @@ class TestToolSignatures:
         assert "approach_a" in sig.parameters
         assert "approach_b" in sig.parameters
 
+    def test_rank_approaches_exists(self):
+        import inspect
+        sig = inspect.signature(server_module.gemini_rank_approaches)
+        assert "problem" in sig.parameters
+        assert "approaches" in sig.parameters
+        assert "mode" in sig.parameters
+
 
 class TestGetClient:
-    def test_missing_api_key_raises_valueerror(self):
+    async def test_missing_api_key_raises_valueerror(self):
         """Should raise ValueError when GEMINI_API_KEY is not set."""
         with patch.dict(os.environ, {}, clear=True):
             with pytest.raises(ValueError, match="GEMINI_API_KEY"):
                 server_module._get_client()
 
-    def test_client_cached(self):
+    async def test_client_cached(self):
         """Client should be created once and reused on subsequent calls."""
         with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
             with patch("google.genai.Client") as mock_cls:
@@ -137,204 +269,2459 @@ class TestGetClient:
                 assert mock_cls.call_count == 1
 
 
+class TestEntryPoint:
+    def test_rejects_unknown_transport(self):
+        with pytest.raises(SystemExit):
+            server_module.main(["--transport", "carrier-pigeon"])
+
+    def test_stdio_is_default(self):
+        with patch.object(server_module.mcp, "run_stdio_async", AsyncMock()) as run:
+            server_module.main([])
+        run.assert_awaited_once()
+
+    def test_stdio_exports_from_startup(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(server_module, "PROMETHEUS_FILE", str(tmp_path / "gemini_bridge.prom"))
+        path = tmp_path / f"gemini_bridge.{os.getpid()}.prom"
+        seen = []
+
+        async def session():
+            for _ in range(100):
+                if path.exists():
+                    break
+                await asyncio.sleep(0.01)
+            seen.append(path.read_text())
+
+        with patch.object(server_module.mcp, "run_stdio_async", session):
+            server_module.main([])
+        assert f'gemini_bridge_uptime_seconds{{pid="{os.getpid()}"}}' in seen[0]
+        assert server_module._exporter is None
+        assert not path.exists()
+
+    def test_base_url_override(self):
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch.object(server_module, "GEMINI_BASE_URL", "http://127.0.0.1:9999"):
+                with patch("google.genai.Client") as mock_cls:
+                    server_module._get_client()
+        http_options = mock_cls.call_args.kwargs["http_options"]
+        assert http_options.base_url == "http://127.0.0.1:9999"
+
+    async def test_shutdown_releases_shared_state(self):
+        mock_client = MagicMock()
+        mock_client.aio.aclose = AsyncMock()
+        server_module._client = mock_client
+
+        await server_module._shutdown()
+
+        mock_client.aio.aclose.assert_awaited_once()
+        assert server_module._client is None
+        assert server_module._response_cache is None
+
+
 class TestGenerate:
-    def test_none_response_raises_runtime_error(self):
+    async def test_none_response_raises_runtime_error(self):
         """_generate must raise RuntimeError when Gemini returns no text."""
         mock_response = MagicMock()
         mock_response.text = None
         mock_client = MagicMock()
-        mock_client.models.generate_content.return_value = mock_response
+        mock_client.aio.models.generate_content = AsyncMock(return_value=mock_response)
 
         with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
             with patch("google.genai.Client", return_value=mock_client):
                 with pytest.raises(RuntimeError, match="returned no text"):
-                    server_module._generate("test prompt")
+                    await server_module._generate("test prompt")
 
-    def test_returns_text_on_success(self):
+    async def test_returns_text_on_success(self):
         """_generate should return response text when available."""
         mock_response = MagicMock()
         mock_response.text = "Hello"
         mock_client = MagicMock()
-        mock_client.models.generate_content.return_value = mock_response
+        mock_client.aio.models.generate_content = AsyncMock(return_value=mock_response)
 
         with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
             with patch("google.genai.Client", return_value=mock_client):
-                result = server_module._generate("test prompt")
+                result = await server_module._generate("test prompt")
         assert result == "Hello"
 
 
-class TestAnalyzeText:
-    def _mock_client(self, response_text="Analysis result"):
+class TestRouting:
+    @staticmethod
+    def _mock_client(text="ok"):
         mock_response = MagicMock()
-        mock_response.text = response_text
+        mock_response.text = text
         mock_client = MagicMock()
-        mock_client.models.generate_content.return_value = mock_response
+        mock_client.aio.models.generate_content = AsyncMock(return_value=mock_response)
         return mock_client
 
-    def test_returns_response_text(self):
-        """Should return Gemini's response text on success."""
+    @staticmethod
+    def _models(mock_client):
+        return [c.kwargs["model"] for c in mock_client.aio.models.generate_content.call_args_list]
+
+    async def test_short_text_uses_fast_model(self):
         mock_client = self._mock_client()
         with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
             with patch("google.genai.Client", return_value=mock_client):
-                result = server_module.gemini_analyze_text("Analyze this")
-        assert result == "Analysis result"
+                await server_module.gemini_analyze_text("What is 2 + 2?")
+        assert self._models(mock_client) == [server_module.GEMINI_FAST_MODEL]
 
-    def test_prepends_context(self):
-        """Should prepend context to prompt when provided."""
-        mock_client = self._mock_client("ok")
+    async def test_quality_best_uses_pro_model(self):
+        mock_client = self._mock_client()
         with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
             with patch("google.genai.Client", return_value=mock_client):
-                server_module.gemini_analyze_text("question", context="background")
-                call_args = mock_client.models.generate_content.call_args
-                contents = call_args.kwargs.get("contents", call_args[1].get("contents", ""))
-                assert "background" in contents
-                assert "question" in contents
+                await server_module.gemini_analyze_text("What is 2 + 2?", quality="best")
+        assert self._models(mock_client) == [server_module.GEMINI_MODEL]
 
-    def test_api_error_propagates(self):
-        """API errors should propagate as exceptions, not be swallowed."""
+    async def test_comparison_uses_pro_model(self):
+        mock_client = self._mock_client()
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_compare_approaches("p", "a", "b")
+        assert self._models(mock_client) == [server_module.GEMINI_MODEL]
+
+    async def test_routing_off_always_uses_pro_model(self):
+        mock_client = self._mock_client()
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with patch.object(server_module, "ROUTING", "off"):
+                    await server_module.gemini_analyze_text("What is 2 + 2?", quality="fast")
+        assert self._models(mock_client) == [server_module.GEMINI_MODEL]
+
+    async def test_custom_rules(self):
+        rules = '[{"name": "all-lite", "model": "gemini-2.5-flash-lite"}]'
+        mock_client = self._mock_client()
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with patch.object(server_module, "ROUTING_RULES", rules):
+                    await server_module.gemini_compare_approaches("p", "a", "b")
+        assert self._models(mock_client) == ["gemini-2.5-flash-lite"]
+
+    async def test_invalid_quality_raises(self):
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=self._mock_client()):
+                with pytest.raises(ValueError, match="quality must be one of"):
+                    await server_module.gemini_analyze_text("hi", quality="cheap")
+
+    async def test_cache_key_includes_routed_model(self):
+        mock_client = self._mock_client()
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_analyze_text("same prompt")
+                await server_module.gemini_analyze_text("same prompt", quality="best")
+                await server_module.gemini_analyze_text("same prompt")
+        assert self._models(mock_client) == [
+            server_module.GEMINI_FAST_MODEL,
+            server_module.GEMINI_MODEL,
+        ]
+
+    async def test_metrics_report_per_model_routes(self):
+        mock_client = self._mock_client()
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_analyze_text("short one")
+                await server_module.gemini_analyze_text("short two")
+                await server_module.gemini_compare_approaches("p", "a", "b")
+        metrics = json.loads(await server_module.gemini_metrics())
+        fast = metrics["models"][server_module.GEMINI_FAST_MODEL]
+        pro = metrics["models"][server_module.GEMINI_MODEL]
+        assert fast["requests"] == 2
+        assert fast["routes"] == {"short-text": 2}
+        assert pro["routes"] == {"deep-analysis": 1}
+        assert metrics["tools"]["gemini_analyze_text"]["routed:short-text"] == 2
+
+
+class TestGenerationLimits:
+    @staticmethod
+    def _response(text, finish_reason="STOP", thoughts=0):
+        response = MagicMock()
+        response.text = text
+        response.candidates = [MagicMock(finish_reason=finish_reason)]
+        response.usage_metadata = MagicMock(
+            prompt_token_count=10, candidates_token_count=0, thoughts_token_count=thoughts
+        )
+        return response
+
+    def _mock_client(self, *responses):
         mock_client = MagicMock()
-        mock_client.models.generate_content.side_effect = RuntimeError("Quota exceeded")
+        mock_client.aio.models.generate_content = AsyncMock(side_effect=list(responses))
+        return mock_client
+
+    @staticmethod
+    def _configs(mock_client):
+        return [c.kwargs["config"] for c in mock_client.aio.models.generate_content.call_args_list]
+
+    async def test_tool_defaults_applied(self):
+        mock_client = self._mock_client(self._response("ok"))
         with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
             with patch("google.genai.Client", return_value=mock_client):
-                with pytest.raises(RuntimeError, match="Quota exceeded"):
-                    server_module.gemini_analyze_text("test")
+                await server_module.gemini_analyze_text("question")
+        (config,) = self._configs(mock_client)
+        assert config.max_output_tokens == server_module.MAX_OUTPUT_TOKENS
+        assert config.thinking_config.thinking_budget == 2048
 
-    def test_missing_api_key_raises(self):
-        """Missing API key should raise ValueError, not return error string."""
-        with patch.dict(os.environ, {}, clear=True):
-            with pytest.raises(ValueError, match="GEMINI_API_KEY"):
-                server_module.gemini_analyze_text("test")
+    async def test_call_overrides(self):
+        mock_client = self._mock_client(self._response("ok"))
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_compare_approaches(
+                    "p", "a", "b", thinking_budget=0, max_output_tokens=1024
+                )
+        (config,) = self._configs(mock_client)
+        assert config.max_output_tokens == 1024
+        assert config.thinking_config.thinking_budget == 0
+
+    async def test_tool_limits_config(self):
+        limits = '{"gemini_analyze_codebase": {"thinking_budget": 512}}'
+        mock_client = self._mock_client(self._response("ok"))
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with patch.object(server_module, "TOOL_LIMITS", limits):
+                    await server_module.gemini_analyze_codebase("code", "review")
+        (config,) = self._configs(mock_client)
+        assert config.thinking_config.thinking_budget == 512
 
+    async def test_model_default_thinking_when_unset(self):
+        mock_client = self._mock_client(self._response("ok"))
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_analyze_codebase("code", "review")
+        (config,) = self._configs(mock_client)
+        assert config.thinking_config is None
 
-class TestAnalyzeCodebase:
-    def test_returns_response_text(self):
-        """Should return Gemini's analysis on success."""
+    async def test_large_thinking_budget_routes_to_pro(self):
+        mock_client = self._mock_client(self._response("ok"))
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_analyze_text("short", thinking_budget=16384)
+        call = mock_client.aio.models.generate_content.call_args
+        assert call.kwargs["model"] == server_module.GEMINI_MODEL
+
+    async def test_limits_are_part_of_cache_key(self):
+        mock_client = self._mock_client(self._response("a"), self._response("b"))
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                first = await server_module.gemini_analyze_text("same")
+                second = await server_module.gemini_analyze_text("same", thinking_budget=0)
+        assert (first, second) == ("a", "b")
+
+    async def test_exhausted_output_retried_with_larger_allowance(self):
+        mock_client = self._mock_client(
+            self._response(None, "MAX_TOKENS", thoughts=8000),
+            self._response("answer"),
+        )
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                result = await server_module.gemini_analyze_text("question")
+        assert result == "answer"
+        first, second = self._configs(mock_client)
+        assert first.max_output_tokens == 8192
+        assert second.max_output_tokens == 16384
+        assert second.thinking_config.thinking_budget == 2048
+        tool = server_module._metrics.snapshot()["tools"]["gemini_analyze_text"]
+        assert tool["output_token_retries"] == 1
+        assert tool["prompt_tokens"] == 20  # both attempts are accounted
+
+    async def test_exhausted_output_retried_only_once(self):
+        mock_client = self._mock_client(
+            self._response(None, "MAX_TOKENS"),
+            self._response(None, "MAX_TOKENS"),
+            self._response("unused"),
+        )
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with pytest.raises(RuntimeError, match="returned no text"):
+                    await server_module.gemini_analyze_text("question")
+        assert mock_client.aio.models.generate_content.await_count == 2
+
+    async def test_no_retry_for_other_empty_responses(self):
+        mock_client = self._mock_client(self._response(None, "SAFETY"))
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with pytest.raises(RuntimeError, match="returned no text"):
+                    await server_module.gemini_analyze_text("question")
+        assert mock_client.aio.models.generate_content.await_count == 1
+
+    async def test_exhausted_stream_retried(self):
+        finishes = iter(["MAX_TOKENS", "STOP"])
+        texts = iter([None, "streamed"])
+
+        async def stream(**kwargs):
+            async def gen():
+                chunk = MagicMock()
+                chunk.text = next(texts)
+                chunk.candidates = [MagicMock(finish_reason=next(finishes))]
+                chunk.usage_metadata = None
+                yield chunk
+
+            return gen()
+
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content_stream = AsyncMock(side_effect=stream)
+        ctx = MagicMock()
+        ctx.report_progress = AsyncMock()
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                result = await server_module.gemini_compare_approaches("p", "a", "b", ctx=ctx)
+        assert result == "streamed"
+        calls = mock_client.aio.models.generate_content_stream.call_args_list
+        assert [c.kwargs["config"].max_output_tokens for c in calls] == [8192, 16384]
+
+
+class TestStructuredOutput:
+    COMPARISON = {
+        "approach_a": {"strengths": ["simple"], "weaknesses": ["slow"]},
+        "approach_b": {"strengths": ["fast"], "weaknesses": ["complex"]},
+        "recommendation": "approach_b",
+        "rationale": "Throughput matters most.",
+    }
+
+    @staticmethod
+    def _mock_client(text):
         mock_response = MagicMock()
-        mock_response.text = "Codebase analysis result"
+        mock_response.text = text
         mock_client = MagicMock()
-        mock_client.models.generate_content.return_value = mock_response
+        mock_client.aio.models.generate_content = AsyncMock(return_value=mock_response)
+        return mock_client
 
+    async def test_compare_json_mode_uses_comparison_schema(self):
+        mock_client = self._mock_client(json.dumps(self.COMPARISON))
         with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
             with patch("google.genai.Client", return_value=mock_client):
-                result = server_module.gemini_analyze_codebase("code", "review")
-        assert result == "Codebase analysis result"
+                result = await server_module.gemini_compare_approaches(
+                    "p", "a", "b", json_mode=True
+                )
+        assert json.loads(result) == self.COMPARISON
+        config = mock_client.aio.models.generate_content.call_args.kwargs["config"]
+        assert config.response_mime_type == "application/json"
+        assert config.response_schema == server_module.resolve_schema("comparison", False, "")
 
-    def test_includes_language_hint(self):
-        """Should include language hint in prompt when provided."""
+    async def test_codebase_json_mode_uses_findings_schema(self):
+        findings = {"summary": "Clean.", "findings": []}
+        mock_client = self._mock_client(json.dumps(findings))
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                result = await server_module.gemini_analyze_codebase(
+                    "code", "review", json_mode=True
+                )
+        assert json.loads(result) == findings
+        config = mock_client.aio.models.generate_content.call_args.kwargs["config"]
+        assert config.response_schema["required"] == ["summary", "findings"]
+
+    async def test_custom_schema(self):
+        schema = {"type": "object", "properties": {"secure": {"type": "boolean"}},
+                  "required": ["secure"]}
+        mock_client = self._mock_client('{"secure": false}')
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                result = await server_module.gemini_analyze_codebase(
+                    "code", "Is it secure?", response_schema=schema
+                )
+        assert json.loads(result) == {"secure": False}
+
+    async def test_invalid_json_raises_and_is_not_cached(self):
+        mock_client = self._mock_client('{"approach_a": {}}')
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                for _ in range(2):
+                    with pytest.raises(ValueError, match="does not match the schema"):
+                        await server_module.gemini_compare_approaches(
+                            "p", "a", "b", json_mode=True
+                        )
+        assert mock_client.aio.models.generate_content.await_count == 2
+
+    async def test_text_and_json_responses_cached_separately(self):
+        mock_client = self._mock_client(json.dumps(self.COMPARISON))
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_compare_approaches("p", "a", "b")
+                await server_module.gemini_compare_approaches("p", "a", "b", json_mode=True)
+                await server_module.gemini_compare_approaches("p", "a", "b", json_mode=True)
+        assert mock_client.aio.models.generate_content.await_count == 2
+
+    async def test_chunked_only_synthesis_is_structured(self):
+        findings = json.dumps({"summary": "s", "findings": []})
         mock_response = MagicMock()
-        mock_response.text = "ok"
+        mock_response.text = findings
         mock_client = MagicMock()
-        mock_client.models.generate_content.return_value = mock_response
-
+        mock_client.aio.models.generate_content = AsyncMock(return_value=mock_response)
+        code = "\n".join(f"# File: f{i}.py\n" + "x = 1\n" * 2000 for i in range(3))
         with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
             with patch("google.genai.Client", return_value=mock_client):
-                server_module.gemini_analyze_codebase("code", "review", language="Python")
-                call_args = mock_client.models.generate_content.call_args
-                contents = call_args.kwargs.get("contents", call_args[1].get("contents", ""))
-                assert "Language: Python" in contents
+                with patch.object(server_module, "SHARD_TOKENS", 3000):
+                    await server_module.gemini_analyze_codebase(
+                        code, "review", chunked=True, json_mode=True
+                    )
+        configs = [
+            c.kwargs["config"] for c in mock_client.aio.models.generate_content.call_args_list
+        ]
+        assert len(configs) > 2
+        assert [c.response_schema is not None for c in configs] == [False] * (
+            len(configs) - 1
+        ) + [True]
+
+
+class TestConcurrency:
+    """Tool handlers must not block each other while waiting on Gemini."""
+
+    @staticmethod
+    def _slow_client(delay):
+        async def slow_generate(**kwargs):
+            await asyncio.sleep(delay)
+            response = MagicMock()
+            response.text = "done"
+            return response
 
-    def test_api_error_propagates(self):
-        """API errors should propagate."""
         mock_client = MagicMock()
-        mock_client.models.generate_content.side_effect = RuntimeError("Server error")
+        mock_client.aio.models.generate_content = AsyncMock(side_effect=slow_generate)
+        return mock_client
+
+    async def test_concurrent_calls_overlap(self):
+        """N concurrent calls should finish in about the time of one."""
+        delay, n = 0.2, 6
+        mock_client = self._slow_client(delay)
+
         with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
             with patch("google.genai.Client", return_value=mock_client):
-                with pytest.raises(RuntimeError):
-                    server_module.gemini_analyze_codebase("code", "review")
+                start = time.perf_counter()
+                results = await asyncio.gather(
+                    *(server_module.gemini_analyze_text(f"q{i}") for i in range(n))
+                )
+                elapsed = time.perf_counter() - start
 
+        assert results == ["done"] * n
+        assert mock_client.aio.models.generate_content.await_count == n
+        assert elapsed < delay * 2
+
+    async def test_concurrency_cap_limits_in_flight_requests(self):
+        """Calls beyond GEMINI_MAX_CONCURRENCY should wait for a free slot."""
+        delay = 0.1
+        mock_client = self._slow_client(delay)
 
-class TestImageAnalysis:
-    def test_missing_image_raises_error(self):
-        """Should raise FileNotFoundError for non-existent image."""
         with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
-            with pytest.raises(FileNotFoundError):
-                server_module.gemini_analyze_image("/nonexistent/path.png", "Describe this")
+            with patch("google.genai.Client", return_value=mock_client):
+                with patch.object(server_module, "MAX_CONCURRENT_REQUESTS", 2):
+                    start = time.perf_counter()
+                    await asyncio.gather(
+                        *(server_module.gemini_analyze_text(f"q{i}") for i in range(4))
+                    )
+                    elapsed = time.perf_counter() - start
 
-    def test_unsupported_mime_type_raises(self):
-        """Should raise ValueError for unsupported file types."""
-        import tempfile
-        with tempfile.NamedTemporaryFile(suffix=".xyz", delete=False) as f:
-            f.write(b"dummy")
-            tmp_path = f.name
-        try:
-            with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
-                with pytest.raises(ValueError, match="Unsupported file type"):
-                    server_module.gemini_analyze_image(tmp_path, "Describe this")
-        finally:
-            os.unlink(tmp_path)
+        assert elapsed >= delay * 2
 
-    def test_oversized_file_raises(self):
-        """Should raise ValueError for files exceeding MAX_IMAGE_SIZE."""
-        mock_path = MagicMock()
-        mock_path.exists.return_value = True
-        mock_stat = MagicMock()
-        mock_stat.st_size = 25 * 1024 * 1024  # 25 MB
-        mock_path.stat.return_value = mock_stat
+
+class TestCoalescing:
+    """Concurrent identical requests should share one upstream call."""
+
+    async def test_context_without_progress_token_still_coalesces(self):
+        mock_client = TestConcurrency._slow_client(0.05)
+        mock_client.aio.models.generate_content_stream = AsyncMock()
+        ctx = MagicMock()
+        ctx.request_context.meta.progressToken = None
 
         with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
-            with patch("gemini_bridge.server.Path", return_value=mock_path):
-                with pytest.raises(ValueError, match="File too large"):
-                    server_module.gemini_analyze_image("/fake/large.png", "Describe")
+            with patch("google.genai.Client", return_value=mock_client):
+                results = await asyncio.gather(
+                    *(
+                        server_module.gemini_compare_approaches("p", "a", "b", cache=False, ctx=ctx)
+                        for _ in range(3)
+                    )
+                )
+
+        assert results == ["done"] * 3
+        assert mock_client.aio.models.generate_content.await_count == 1
+        mock_client.aio.models.generate_content_stream.assert_not_awaited()
+        ctx.report_progress.assert_not_called()
+
+    async def test_identical_concurrent_calls_coalesce(self):
+        mock_client = TestConcurrency._slow_client(0.05)
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                results = await asyncio.gather(
+                    *(server_module.gemini_analyze_text("same", cache=False) for _ in range(5))
+                )
+
+        assert results == ["done"] * 5
+        assert mock_client.aio.models.generate_content.await_count == 1
+        stats = server_module._metrics.snapshot()["tools"]["gemini_analyze_text"]
+        assert stats["calls"] == 5
+        assert stats["coalesced"] == 4
+        assert stats["requests"] == 1
+
+    async def test_different_config_is_not_coalesced(self):
+        mock_client = TestConcurrency._slow_client(0.05)
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await asyncio.gather(
+                    server_module.gemini_analyze_text("same", temperature=0.2, cache=False),
+                    server_module.gemini_analyze_text("same", temperature=0.9, cache=False),
+                )
+
+        assert mock_client.aio.models.generate_content.await_count == 2
+
+    async def test_concurrent_status_checks_share_probe(self):
+        async def get(**kwargs):
+            await asyncio.sleep(0.05)
+            return MagicMock()
 
-    def test_successful_image_analysis(self):
-        """Should return analysis for valid image files."""
-        import tempfile
-        mock_response = MagicMock()
-        mock_response.text = "Image shows a dashboard"
         mock_client = MagicMock()
-        mock_client.models.generate_content.return_value = mock_response
+        mock_client.aio.models.get = AsyncMock(side_effect=get)
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                results = await asyncio.gather(*(server_module.gemini_status() for _ in range(3)))
+
+        assert all("operational" in r.lower() for r in results)
+        assert mock_client.aio.models.get.await_count == 1
+        metrics = json.loads(await server_module.gemini_metrics())
+        assert metrics["coalescing"]["coalesced"] == 2
+
 
-        with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as f:
-            f.write(b"\x89PNG\r\n\x1a\n" + b"\x00" * 100)
-            tmp_path = f.name
+class SlowUpstream:
+    """Fake upstream that never answers and records when it is cancelled."""
+
+    def __init__(self):
+        self.started = asyncio.Event()
+        self.calls = 0
+        self.cancelled_at: list[float] = []
+
+    async def hang(self):
+        self.calls += 1
+        self.started.set()
         try:
-            with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
-                with patch("google.genai.Client", return_value=mock_client):
-                    result = server_module.gemini_analyze_image(tmp_path, "Describe")
-            assert result == "Image shows a dashboard"
-        finally:
-            os.unlink(tmp_path)
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            self.cancelled_at.append(time.perf_counter())
+            raise
 
+    def client(self):
+        async def generate(**kwargs):
+            await self.hang()
 
-class TestCompareApproaches:
-    def test_returns_comparison(self):
-        """Should return Gemini's comparison on success."""
-        mock_response = MagicMock()
-        mock_response.text = "Approach A is better"
         mock_client = MagicMock()
-        mock_client.models.generate_content.return_value = mock_response
+        mock_client.aio.models.generate_content = AsyncMock(side_effect=generate)
+        return mock_client
+
+
+class TestCancellation:
+    """Cancelling a tool call should abort the upstream request promptly."""
 
+    async def _cancel_after_start(self, upstream, coro):
+        task = asyncio.ensure_future(coro)
+        await asyncio.wait_for(upstream.started.wait(), 1)
+        cancelled = time.perf_counter()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return cancelled
+
+    async def test_cancel_aborts_upstream_request(self):
+        upstream = SlowUpstream()
         with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
-            with patch("google.genai.Client", return_value=mock_client):
-                result = server_module.gemini_compare_approaches(
-                    "scaling", "Redis", "PostgreSQL"
+            with patch("google.genai.Client", return_value=upstream.client()):
+                cancelled = await self._cancel_after_start(
+                    upstream, server_module.gemini_analyze_text("slow", cache=False)
                 )
-        assert result == "Approach A is better"
 
-    def test_includes_criteria(self):
-        """Should include criteria in prompt when provided."""
-        mock_response = MagicMock()
-        mock_response.text = "ok"
+        assert len(upstream.cancelled_at) == 1
+        assert upstream.cancelled_at[0] - cancelled < 0.05
+        stats = server_module._metrics.snapshot()["tools"]["gemini_analyze_text"]
+        assert stats["cancelled"] == 1
+        assert stats["upstream_cancelled"] == 1
+        assert stats["errors"] == 0
+        assert server_module._flights.in_flight() == 0
+
+    async def test_cancel_closes_stream(self):
+        """A stream is closed even if the call is cancelled between chunks."""
+        closed = []
+        progress_started = asyncio.Event()
+
+        async def stream(**kwargs):
+            async def gen():
+                try:
+                    chunk = MagicMock()
+                    chunk.text = "partial"
+                    chunk.usage_metadata = None
+                    yield chunk
+                    await asyncio.sleep(60)
+                finally:
+                    closed.append(time.perf_counter())
+
+            return gen()
+
+        async def report_progress(*args, **kwargs):
+            progress_started.set()
+            await asyncio.sleep(60)
+
         mock_client = MagicMock()
-        mock_client.models.generate_content.return_value = mock_response
+        mock_client.aio.models.generate_content_stream = AsyncMock(side_effect=stream)
+        ctx = MagicMock()
+        ctx.report_progress = AsyncMock(side_effect=report_progress)
 
         with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
             with patch("google.genai.Client", return_value=mock_client):
-                server_module.gemini_compare_approaches(
-                    "scaling", "A", "B", criteria="performance, cost"
+                task = asyncio.ensure_future(
+                    server_module.gemini_compare_approaches("p", "a", "b", ctx=ctx)
                 )
-                call_args = mock_client.models.generate_content.call_args
-                contents = call_args.kwargs.get("contents", call_args[1].get("contents", ""))
-                assert "performance, cost" in contents
+                await asyncio.wait_for(progress_started.wait(), 1)
+                cancelled = time.perf_counter()
+                task.cancel()
+                with pytest.raises(asyncio.CancelledError):
+                    await task
+
+        assert len(closed) == 1
+        assert closed[0] - cancelled < 0.05
+
+    async def test_shared_request_outlives_one_caller(self):
+        """A coalesced request is aborted only when its last caller is cancelled."""
+        upstream = SlowUpstream()
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=upstream.client()):
+                first = asyncio.ensure_future(server_module.gemini_analyze_text("same"))
+                second = asyncio.ensure_future(server_module.gemini_analyze_text("same"))
+                await asyncio.wait_for(upstream.started.wait(), 1)
+                await asyncio.sleep(0.01)
+                first.cancel()
+                with pytest.raises(asyncio.CancelledError):
+                    await first
+                await asyncio.sleep(0.01)
+                assert upstream.cancelled_at == []
+                second.cancel()
+                with pytest.raises(asyncio.CancelledError):
+                    await second
+
+        assert upstream.calls == 1
+        assert len(upstream.cancelled_at) == 1
+
+    async def test_cancel_during_backoff(self):
+        """A call waiting to retry does not send another request once cancelled."""
+        calls = []
+
+        async def generate(**kwargs):
+            calls.append(1)
+            raise FakeAPIError(503)
 
-    def test_api_error_propagates(self):
-        """API errors should propagate."""
         mock_client = MagicMock()
-        mock_client.models.generate_content.side_effect = RuntimeError("Rate limited")
+        mock_client.aio.models.generate_content = AsyncMock(side_effect=generate)
         with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
             with patch("google.genai.Client", return_value=mock_client):
-                with pytest.raises(RuntimeError):
-                    server_module.gemini_compare_approaches("p", "a", "b")
+                with patch.object(server_module, "RETRY_BASE_DELAY", 30):
+                    task = asyncio.ensure_future(server_module.gemini_analyze_text("x"))
+                    await asyncio.sleep(0.05)
+                    task.cancel()
+                    with pytest.raises(asyncio.CancelledError):
+                        await task
+                    await asyncio.sleep(0.05)
+
+        assert calls == [1]
+
+    async def test_failed_shard_cancels_the_others(self):
+        upstream = SlowUpstream()
+
+        async def generate(**kwargs):
+            if "src/m00.py" in kwargs["contents"]:
+                await upstream.started.wait()
+                raise ValueError("bad shard")
+            await upstream.hang()
+
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(side_effect=generate)
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with patch.object(server_module, "SHARD_TOKENS", 2_000):
+                    with pytest.raises(ValueError, match="bad shard"):
+                        await server_module.gemini_analyze_codebase(
+                            TestChunkedAnalysis._blob(), "review", chunked=True
+                        )
+
+        assert upstream.calls >= 1
+        assert len(upstream.cancelled_at) == upstream.calls
+
+    async def test_mcp_cancel_notification(self):
+        """End to end: notifications/cancelled from an MCP client aborts the upstream call."""
+        from mcp.shared.memory import create_connected_server_and_client_session
+        from mcp.types import CancelledNotification, CancelledNotificationParams, ClientNotification
+
+        upstream = SlowUpstream()
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=upstream.client()):
+                async with create_connected_server_and_client_session(
+                    server_module.mcp._mcp_server
+                ) as session:
+                    call = asyncio.ensure_future(
+                        session.call_tool("gemini_analyze_text", {"prompt": "slow"})
+                    )
+                    await asyncio.wait_for(upstream.started.wait(), 1)
+                    cancelled = time.perf_counter()
+                    await session.send_notification(
+                        ClientNotification(
+                            CancelledNotification(
+                                params=CancelledNotificationParams(
+                                    requestId=session._request_id - 1
+                                )
+                            )
+                        )
+                    )
+                    with pytest.raises(Exception, match="cancelled"):
+                        await asyncio.wait_for(call, 1)
+
+        assert len(upstream.cancelled_at) == 1
+        assert upstream.cancelled_at[0] - cancelled < 0.05
+
+
+class FakeAPIError(Exception):
+    """Stand-in for an SDK APIError carrying an HTTP status code."""
+
+    def __init__(self, code):
+        super().__init__(f"{code} error")
+        self.code = code
+
+
+class TestResilience:
+    """Rate limiting, retries and hedging around upstream calls."""
+
+    @staticmethod
+    def _flaky_client(failures, code=429):
+        """Client whose first `failures` calls raise an HTTP error, then succeed."""
+        calls = {"n": 0}
+
+        async def generate(**kwargs):
+            calls["n"] += 1
+            if calls["n"] <= failures:
+                raise FakeAPIError(code)
+            response = MagicMock()
+            response.text = "recovered"
+            response.usage_metadata = None
+            return response
+
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(side_effect=generate)
+        return mock_client
+
+    async def test_retries_transient_429(self):
+        mock_client = self._flaky_client(2)
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with patch.object(server_module, "RETRY_BASE_DELAY", 0.01):
+                    result = await server_module.gemini_analyze_text("q", cache=False)
+
+        assert result == "recovered"
+        assert mock_client.aio.models.generate_content.await_count == 3
+        stats = server_module._metrics.snapshot()["tools"]["gemini_analyze_text"]
+        assert stats["retries"] == 2
+        assert stats["errors"] == 0
+
+    async def test_gives_up_after_max_retries(self):
+        mock_client = self._flaky_client(10, code=503)
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with patch.object(server_module, "RETRY_BASE_DELAY", 0.01):
+                    with patch.object(server_module, "MAX_RETRIES", 2):
+                        with pytest.raises(FakeAPIError):
+                            await server_module.gemini_analyze_text("q", cache=False)
+
+        assert mock_client.aio.models.generate_content.await_count == 3
+
+    async def test_client_errors_are_not_retried(self):
+        mock_client = self._flaky_client(1, code=400)
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with patch.object(server_module, "RETRY_BASE_DELAY", 0.01):
+                    with pytest.raises(FakeAPIError):
+                        await server_module.gemini_analyze_text("q", cache=False)
+
+        assert mock_client.aio.models.generate_content.await_count == 1
+
+    async def test_hedged_request_beats_latency_spike(self):
+        """A short prompt stuck behind a slow response is answered by the hedge."""
+        calls = {"n": 0}
+
+        async def generate(**kwargs):
+            calls["n"] += 1
+            await asyncio.sleep(2.0 if calls["n"] == 1 else 0.01)
+            response = MagicMock()
+            response.text = f"answer {calls['n']}"
+            response.usage_metadata = None
+            return response
+
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(side_effect=generate)
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with patch.object(server_module, "HEDGE_DELAY", 0.05):
+                    start = time.perf_counter()
+                    result = await server_module.gemini_analyze_text("q", cache=False)
+                    elapsed = time.perf_counter() - start
+
+        assert result == "answer 2"
+        assert elapsed < 1.0
+        stats = server_module._metrics.snapshot()["tools"]["gemini_analyze_text"]
+        assert stats["hedged"] == 1
+
+    async def test_stream_not_retried_after_partial_output(self):
+        """Retrying a stream that already emitted text would duplicate output."""
+
+        async def stream():
+            chunk = MagicMock()
+            chunk.text = "partial"
+            chunk.usage_metadata = None
+            yield chunk
+            raise FakeAPIError(503)
+
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content_stream = AsyncMock(
+            side_effect=lambda **kwargs: stream()
+        )
+        received = []
+
+        async def on_text(text):
+            received.append(text)
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with patch.object(server_module, "RETRY_BASE_DELAY", 0.01):
+                    with pytest.raises(FakeAPIError):
+                        await server_module._generate("q", on_text=on_text)
+
+        assert received == ["partial"]
+        assert mock_client.aio.models.generate_content_stream.await_count == 1
+
+    async def test_rate_limiter_spaces_requests(self):
+        mock_client = self._flaky_client(0)
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with patch.object(server_module, "REQUESTS_PER_MINUTE", 600):
+                    server_module._rate_limiter = None
+                    # Drain the initial burst so the next calls must wait.
+                    await server_module._get_rate_limiter()._requests.acquire(600)
+                    start = time.perf_counter()
+                    await asyncio.gather(
+                        *(server_module.gemini_analyze_text(f"q{i}", cache=False) for i in range(3))
+                    )
+                    elapsed = time.perf_counter() - start
+
+        # 600 rpm = one request every 0.1s
+        assert elapsed >= 0.25
+        stats = server_module._metrics.snapshot()["tools"]["gemini_analyze_text"]
+        assert stats["rate_limit_wait_s"] > 0
+
+
+class TestResponseCaching:
+    async def test_identical_calls_hit_cache(self):
+        """A repeated identical call should be served without a second upstream request."""
+        mock_response = MagicMock()
+        mock_response.text = "cached answer"
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(return_value=mock_response)
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                first = await server_module.gemini_compare_approaches("p", "a", "b")
+                second = await server_module.gemini_compare_approaches("p", "a", "b")
+
+        assert first == second == "cached answer"
+        assert mock_client.aio.models.generate_content.await_count == 1
+        stats = server_module._response_cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+
+    async def test_different_temperature_misses_cache(self):
+        """Temperature is part of the cache key."""
+        mock_response = MagicMock()
+        mock_response.text = "ok"
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(return_value=mock_response)
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_analyze_text("q", temperature=0.2)
+                await server_module.gemini_analyze_text("q", temperature=0.9)
+
+        assert mock_client.aio.models.generate_content.await_count == 2
+
+    async def test_cache_opt_out(self):
+        """cache=False must always go upstream and never store the result."""
+        mock_response = MagicMock()
+        mock_response.text = "fresh"
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(return_value=mock_response)
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_analyze_codebase("code", "review", cache=False)
+                await server_module.gemini_analyze_codebase("code", "review", cache=False)
+
+        assert mock_client.aio.models.generate_content.await_count == 2
+        assert server_module._response_cache.stats()["memory_entries"] == 0
+
+
+class TestTokenAccounting:
+    @staticmethod
+    def _client_with_usage(prompt=100, cached=40, output=20, thoughts=5):
+        mock_response = MagicMock()
+        mock_response.text = "ok"
+        mock_response.usage_metadata = MagicMock(
+            prompt_token_count=prompt,
+            cached_content_token_count=cached,
+            candidates_token_count=output,
+            thoughts_token_count=thoughts,
+        )
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(return_value=mock_response)
+        mock_client.aio.models.count_tokens = AsyncMock(
+            return_value=MagicMock(total_tokens=1_000)
+        )
+        return mock_client
+
+    async def test_usage_recorded_per_tool(self):
+        mock_client = self._client_with_usage()
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_analyze_text("q1")
+                await server_module.gemini_analyze_text("q2")
+
+        stats = server_module._metrics.snapshot()["tools"]["gemini_analyze_text"]
+        assert stats["calls"] == 2
+        assert stats["requests"] == 2
+        assert stats["prompt_tokens"] == 200
+        assert stats["cached_tokens"] == 80
+        assert stats["output_tokens"] == 40
+        assert stats["thinking_tokens"] == 10
+        assert stats["latency_max_s"] >= 0
+
+    async def test_errors_counted(self):
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(side_effect=RuntimeError("boom"))
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with pytest.raises(RuntimeError):
+                    await server_module.gemini_compare_approaches("p", "a", "b")
+
+        stats = server_module._metrics.snapshot()["tools"]["gemini_compare_approaches"]
+        assert stats["calls"] == 1
+        assert stats["errors"] == 1
+
+    async def test_nested_tool_accounted_once(self, tmp_path, monkeypatch):
+        """gemini_analyze_paths delegates to the codebase tool but is recorded once."""
+        (tmp_path / "a.py").write_text("x = 1\n")
+        monkeypatch.chdir(tmp_path)
+        mock_client = self._client_with_usage()
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_analyze_paths(["a.py"], "review")
+
+        tools = server_module._metrics.snapshot()["tools"]
+        assert list(tools) == ["gemini_analyze_paths"]
+        assert tools["gemini_analyze_paths"]["prompt_tokens"] == 100
+
+    async def test_calibration_is_memoized(self):
+        """count_tokens is called once per model, then the local estimate is used."""
+        mock_client = self._client_with_usage()
+        big = "word " * 2_000
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_analyze_text(big)
+                await server_module.gemini_analyze_text(big + "again")
+
+        assert mock_client.aio.models.count_tokens.await_count == 1
+        assert server_module._token_estimator.is_calibrated(server_module.GEMINI_MODEL)
+
+    async def test_cache_hit_does_not_calibrate(self):
+        mock_client = self._client_with_usage()
+        big = "word " * 2_000
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_analyze_text(big)
+                server_module._token_estimator = TokenEstimator()
+                await server_module.gemini_analyze_text(big)
+
+        assert mock_client.aio.models.count_tokens.await_count == 1
+        assert mock_client.aio.models.generate_content.await_count == 1
+        assert not server_module._token_estimator.is_calibrated(server_module.GEMINI_MODEL)
+
+    async def test_calibration_respects_concurrency_cap(self):
+        in_flight = peak = 0
+
+        async def upstream(**kwargs):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.02)
+            in_flight -= 1
+            return MagicMock(text="ok", total_tokens=1_000)
+
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(side_effect=upstream)
+        mock_client.aio.models.count_tokens = AsyncMock(side_effect=upstream)
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with patch.object(server_module, "MAX_CONCURRENT_REQUESTS", 1):
+                    await asyncio.gather(
+                        *(server_module.gemini_analyze_text(f"{i} " * 3_000) for i in range(3))
+                    )
+
+        assert mock_client.aio.models.count_tokens.await_count == 1
+        assert peak == 1
+
+    async def test_oversized_text_rejected_before_request(self):
+        mock_client = self._client_with_usage()
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with patch.object(server_module, "CONTEXT_WINDOW_TOKENS", 9_000):
+                    with pytest.raises(ValueError, match="too large"):
+                        await server_module.gemini_analyze_text("x" * 10_000)
+        mock_client.aio.models.generate_content.assert_not_awaited()
+
+    async def test_metrics_tool_reports_json(self):
+        mock_client = self._client_with_usage()
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_analyze_text("q")
+        result = json.loads(await server_module.gemini_metrics())
+        assert result["totals"]["prompt_tokens"] == 100
+        assert result["tools"]["gemini_analyze_text"]["calls"] == 1
+        assert "response_cache" in result
+        assert "gemini_metrics" not in result["tools"]
+
+
+class TestObservability:
+    @staticmethod
+    def _mock_client(text="answer"):
+        mock_response = MagicMock()
+        mock_response.text = text
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(return_value=mock_response)
+        return mock_client
+
+    async def test_metrics_include_histograms_bytes_and_cache_hits(self):
+        mock_client = self._mock_client("résumé")
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_analyze_text("héllo")
+                await server_module.gemini_analyze_text("héllo")
+        tool = json.loads(await server_module.gemini_metrics())["tools"]["gemini_analyze_text"]
+        assert tool["cache_misses"] == 1
+        assert tool["cache_hits"] == 1
+        assert tool["bytes_in"] > len("héllo")
+        assert tool["bytes_out"] == len("résumé".encode())
+        histograms = tool["histograms"]
+        assert histograms["latency_seconds"]["count"] == 2
+        assert histograms["upstream_latency_seconds"]["count"] == 1
+        assert histograms["queue_wait_seconds"]["count"] == 1
+
+    async def test_failed_upstream_request_is_timed(self):
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(side_effect=ValueError("bad"))
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with pytest.raises(ValueError):
+                    await server_module.gemini_analyze_text("q")
+        tool = server_module._metrics.snapshot()["tools"]["gemini_analyze_text"]
+        assert tool["histograms"]["upstream_latency_seconds"]["count"] == 1
+        assert "bytes_out" not in tool
+
+    async def test_tool_call_log_line_has_request_id(self, caplog):
+        mock_client = self._mock_client()
+        caplog.handler.addFilter(server_module.RequestContextFilter(server_module.current_tool))
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with caplog.at_level(logging.INFO, logger="gemini_bridge.server"):
+                    await server_module.gemini_analyze_text("q1")
+                    await server_module.gemini_analyze_text("q2")
+        records = [r for r in caplog.records if getattr(r, "event", None) == "tool_call"]
+        entries = [json.loads(server_module.JsonFormatter().format(r)) for r in records]
+        assert [e["status"] for e in entries] == ["ok", "ok"]
+        assert all(e["tool"] == "gemini_analyze_text" for e in entries)
+        assert entries[0]["requests"] == 1
+        assert entries[0]["request_id"] != entries[1]["request_id"]
+        assert server_module.current_request_id.get() is None
+
+    async def test_prometheus_text_includes_gauges(self):
+        mock_client = self._mock_client()
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_analyze_text("q")
+        text = server_module._prometheus_text()
+        assert 'gemini_bridge_tool_calls_total{tool="gemini_analyze_text"} 1' in text
+        assert "gemini_bridge_response_cache_misses 1" in text
+        assert "gemini_bridge_coalescing_in_flight 0" in text
+
+    async def test_textfile_exporter(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(server_module, "PROMETHEUS_FILE", str(tmp_path / "gemini_bridge.prom"))
+        monkeypatch.setattr(server_module, "PROMETHEUS_INTERVAL", 0.01)
+        path = tmp_path / f"gemini_bridge.{os.getpid()}.prom"
+        pid = os.getpid()
+        expected = f'gemini_bridge_tool_calls_total{{pid="{pid}",tool="gemini_analyze_text"}} 1'
+        mock_client = self._mock_client()
+        server_module._start_exporter()
+        try:
+            await asyncio.sleep(0.02)
+            assert path.exists()
+            with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+                with patch("google.genai.Client", return_value=mock_client):
+                    await server_module.gemini_analyze_text("q")
+            for _ in range(100):
+                if expected in path.read_text():
+                    break
+                await asyncio.sleep(0.01)
+            assert expected in path.read_text()
+        finally:
+            await server_module._shutdown()
+        assert server_module._exporter is None
+        assert not path.exists()
+
+    async def test_tool_calls_do_not_start_exporter(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(server_module, "PROMETHEUS_FILE", str(tmp_path / "gemini_bridge.prom"))
+        mock_client = self._mock_client()
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_analyze_text("q")
+        assert server_module._exporter is None
+
+
+class TestStreaming:
+    @staticmethod
+    def _streaming_client(chunks, delay=0.0):
+        async def stream(**kwargs):
+            async def gen():
+                for i, text in enumerate(chunks):
+                    await asyncio.sleep(delay)
+                    chunk = MagicMock()
+                    chunk.text = text
+                    chunk.usage_metadata = (
+                        MagicMock(prompt_token_count=50, candidates_token_count=len(chunks))
+                        if i == len(chunks) - 1
+                        else None
+                    )
+                    yield chunk
+
+            return gen()
+
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content_stream = AsyncMock(side_effect=stream)
+        mock_client.aio.models.generate_content = AsyncMock()
+        return mock_client
+
+    async def test_partial_text_forwarded_as_progress(self):
+        """Each streamed chunk becomes a progress notification; full text is returned."""
+        mock_client = self._streaming_client(["Approach A ", "is ", "better."])
+        ctx = MagicMock()
+        ctx.report_progress = AsyncMock()
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                result = await server_module.gemini_compare_approaches("p", "a", "b", ctx=ctx)
+
+        assert result == "Approach A is better."
+        mock_client.aio.models.generate_content.assert_not_awaited()
+        progress = [c.args for c in ctx.report_progress.await_args_list]
+        assert progress == [(11, None, "Approach A "), (14, None, "is "), (21, None, "better.")]
+
+    async def test_streamed_usage_and_ttft_recorded(self):
+        mock_client = self._streaming_client(["a", "b"], delay=0.05)
+        ctx = MagicMock()
+        ctx.report_progress = AsyncMock()
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_analyze_codebase("code", "review", ctx=ctx)
+
+        stats = server_module._metrics.snapshot()["tools"]["gemini_analyze_codebase"]
+        assert stats["streamed_calls"] == 1
+        assert stats["prompt_tokens"] == 50
+        assert 0.04 <= stats["ttft_avg_s"] < stats["latency_max_s"]
+
+    async def test_progress_failure_does_not_abort_generation(self):
+        mock_client = self._streaming_client(["x", "y"])
+        ctx = MagicMock()
+        ctx.report_progress = AsyncMock(side_effect=RuntimeError("client gone"))
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                result = await server_module.gemini_compare_approaches("p", "a", "b", ctx=ctx)
+        assert result == "xy"
+
+    async def test_progress_notifications_over_mcp(self):
+        """End to end: an MCP client with a progress callback receives partial text."""
+        from mcp.shared.memory import create_connected_server_and_client_session
+
+        mock_client = self._streaming_client(["first ", "second"])
+        received = []
+
+        async def on_progress(progress, total, message):
+            received.append(message)
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                async with create_connected_server_and_client_session(
+                    server_module.mcp._mcp_server
+                ) as session:
+                    result = await session.call_tool(
+                        "gemini_compare_approaches",
+                        {"problem": "p", "approach_a": "a", "approach_b": "b"},
+                        progress_callback=on_progress,
+                    )
+
+        assert not result.isError
+        assert result.content[0].text == "first second"
+        assert received == ["first ", "second"]
+
+    async def test_no_streaming_over_mcp_without_progress_callback(self):
+        from mcp.shared.memory import create_connected_server_and_client_session
+
+        mock_client = self._streaming_client(["first ", "second"])
+        mock_client.aio.models.generate_content.return_value = MagicMock(text="whole")
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                async with create_connected_server_and_client_session(
+                    server_module.mcp._mcp_server
+                ) as session:
+                    result = await session.call_tool(
+                        "gemini_compare_approaches",
+                        {"problem": "p", "approach_a": "a", "approach_b": "b"},
+                    )
+
+        assert result.content[0].text == "whole"
+        mock_client.aio.models.generate_content_stream.assert_not_awaited()
+
+
+class TestAnalyzeText:
+    def _mock_client(self, response_text="Analysis result"):
+        mock_response = MagicMock()
+        mock_response.text = response_text
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(return_value=mock_response)
+        return mock_client
+
+    async def test_returns_response_text(self):
+        """Should return Gemini's response text on success."""
+        mock_client = self._mock_client()
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                result = await server_module.gemini_analyze_text("Analyze this")
+        assert result == "Analysis result"
+
+    async def test_prepends_context(self):
+        """Should prepend context to prompt when provided."""
+        mock_client = self._mock_client("ok")
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_analyze_text("question", context="background")
+                call_args = mock_client.aio.models.generate_content.call_args
+                contents = call_args.kwargs.get("contents", call_args[1].get("contents", ""))
+                assert "background" in contents
+                assert "question" in contents
+
+    async def test_api_error_propagates(self):
+        """API errors should propagate as exceptions, not be swallowed."""
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(
+            side_effect=RuntimeError("Quota exceeded")
+        )
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with pytest.raises(RuntimeError, match="Quota exceeded"):
+                    await server_module.gemini_analyze_text("test")
+
+    async def test_missing_api_key_raises(self):
+        """Missing API key should raise ValueError, not return error string."""
+        with patch.dict(os.environ, {}, clear=True):
+            with pytest.raises(ValueError, match="GEMINI_API_KEY"):
+                await server_module.gemini_analyze_text("test")
+
+
+class TestBatchAnalyze:
+    @staticmethod
+    def _echo_client(delay=0.0, fail_on=None):
+        async def generate(**kwargs):
+            await asyncio.sleep(delay)
+            if fail_on and fail_on in kwargs["contents"]:
+                raise RuntimeError("upstream error")
+            response = MagicMock()
+            response.text = f"answer: {kwargs['contents']}"
+            return response
+
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(side_effect=generate)
+        return mock_client
+
+    async def test_prompts_returned_in_order(self):
+        mock_client = self._echo_client()
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                result = json.loads(
+                    await server_module.gemini_batch_analyze(prompts=["q0", "q1", "q2"])
+                )
+        assert result["succeeded"] == 3
+        assert [r["result"] for r in result["results"]] == [
+            "answer: q0",
+            "answer: q1",
+            "answer: q2",
+        ]
+
+    async def test_template_with_inputs(self):
+        mock_client = self._echo_client()
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                result = json.loads(
+                    await server_module.gemini_batch_analyze(
+                        template="Summarize {input}", inputs=["a.py", "b.py"]
+                    )
+                )
+        assert [r["result"] for r in result["results"]] == [
+            "answer: Summarize a.py",
+            "answer: Summarize b.py",
+        ]
+
+    async def test_item_errors_do_not_fail_batch(self):
+        mock_client = self._echo_client(fail_on="bad")
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                result = json.loads(
+                    await server_module.gemini_batch_analyze(prompts=["ok", "bad", "ok2"])
+                )
+        assert result["succeeded"] == 2
+        assert result["failed"] == 1
+        assert result["results"][1] == {
+            "index": 1,
+            "ok": False,
+            "error": "RuntimeError: upstream error",
+        }
+
+    async def test_runs_concurrently_with_parallelism_limit(self):
+        delay = 0.1
+        mock_client = self._echo_client(delay=delay)
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                start = time.perf_counter()
+                await server_module.gemini_batch_analyze(
+                    prompts=[f"q{i}" for i in range(8)], max_parallel=4
+                )
+                elapsed = time.perf_counter() - start
+        assert delay * 2 <= elapsed < delay * 4
+
+    async def test_invalid_arguments(self):
+        with pytest.raises(ValueError, match="either prompts"):
+            await server_module.gemini_batch_analyze()
+        with pytest.raises(ValueError, match="not both"):
+            await server_module.gemini_batch_analyze(prompts=["a"], template="{input}")
+        with pytest.raises(ValueError, match="placeholder"):
+            await server_module.gemini_batch_analyze(template="no slot", inputs=["a"])
+        with pytest.raises(ValueError, match="maximum"):
+            await server_module.gemini_batch_analyze(prompts=["q"] * 101)
+
+    async def test_missing_api_key_fails_whole_batch(self):
+        with patch.dict(os.environ, {}, clear=True):
+            with pytest.raises(ValueError, match="GEMINI_API_KEY"):
+                await server_module.gemini_batch_analyze(prompts=["a"])
+
+
+class TestAnalyzeCodebase:
+    async def test_returns_response_text(self):
+        """Should return Gemini's analysis on success."""
+        mock_response = MagicMock()
+        mock_response.text = "Codebase analysis result"
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(return_value=mock_response)
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                result = await server_module.gemini_analyze_codebase("code", "review")
+        assert result == "Codebase analysis result"
+
+    async def test_includes_language_hint(self):
+        """Should include language hint in prompt when provided."""
+        mock_response = MagicMock()
+        mock_response.text = "ok"
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(return_value=mock_response)
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_analyze_codebase("code", "review", language="Python")
+                call_args = mock_client.aio.models.generate_content.call_args
+                contents = call_args.kwargs.get("contents", call_args[1].get("contents", ""))
+                assert "Language: Python" in contents
+
+    async def test_api_error_propagates(self):
+        """API errors should propagate."""
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(
+            side_effect=RuntimeError("Server error")
+        )
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with pytest.raises(RuntimeError):
+                    await server_module.gemini_analyze_codebase("code", "review")
+
+    async def test_compaction(self):
+        """compact=True sends the compacted blob and records the savings."""
+        mock_response = MagicMock()
+        mock_response.text = "ok"
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(return_value=mock_response)
+        module = "# Copyright Example\n# License: MIT\n\n\n\ndef f():\n    return 1\n"
+        blob = (
+            f'<file path="a.py">\n{module}\n</file>\n\n'
+            f'<file path="vendor/a.py">\n{module}\n</file>\n\n'
+            '<file path="yarn.lock">\n' + "dep@1:\n  version 1\n" * 200 + "</file>"
+        )
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_analyze_codebase(blob, "review", compact=True)
+
+        contents = mock_client.aio.models.generate_content.call_args.kwargs["contents"]
+        assert '<file path="a.py">\ndef f():\n    return 1\n</file>' in contents
+        assert '<file path="vendor/a.py" duplicate_of="a.py" />' in contents
+        assert "version 1" not in contents and "yarn.lock" in contents
+        stats = server_module._metrics.snapshot()["tools"]["gemini_analyze_codebase"]
+        assert stats["compaction_bytes_saved"] > 3000
+        assert stats["compaction_tokens_saved"] > 700
+
+    async def test_compaction_is_reported_to_client(self):
+        ctx = MagicMock()
+        ctx.info = AsyncMock()
+        await server_module._compact("<file path=\"a\">\nx  \n\n\n\ny\n</file>", False, None, ctx)
+        assert ctx.info.await_args.args[0].startswith("Compaction saved 4 bytes")
+
+    async def test_compaction_is_opt_in(self):
+        mock_response = MagicMock()
+        mock_response.text = "ok"
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(return_value=mock_response)
+        blob = '<file path="a.py">\n# Copyright\nx = 1\n\n\n\n</file>'
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_analyze_codebase(blob, "review")
+
+        assert blob in mock_client.aio.models.generate_content.call_args.kwargs["contents"]
+
+
+class TestCodebaseSession:
+    LARGE_CODE = "def f():\n    return 1\n" * 2000
+
+    @staticmethod
+    def _mock_client(response_text="ok"):
+        mock_response = MagicMock()
+        mock_response.text = response_text
+        cached = MagicMock()
+        cached.name = "cachedContents/abc123"
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(return_value=mock_response)
+        mock_client.aio.caches.create = AsyncMock(return_value=cached)
+        mock_client.aio.caches.delete = AsyncMock()
+        return mock_client
+
+    async def test_session_reuses_cached_content(self):
+        """Repeated tasks on the same code should upload it once and reference the cache."""
+        mock_client = self._mock_client()
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                for task in ("security review", "explain architecture", "find dead code"):
+                    await server_module.gemini_analyze_codebase(
+                        self.LARGE_CODE, task, session=True
+                    )
+
+        assert mock_client.aio.caches.create.await_count == 1
+        assert mock_client.aio.models.generate_content.await_count == 3
+        for call in mock_client.aio.models.generate_content.call_args_list:
+            assert call.kwargs["config"].cached_content == "cachedContents/abc123"
+            assert self.LARGE_CODE not in call.kwargs["contents"]
+
+    async def test_small_content_is_sent_inline(self):
+        """Content below the cacheable minimum should skip context caching."""
+        mock_client = self._mock_client()
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_analyze_codebase("x = 1", "review", session=True)
+
+        mock_client.aio.caches.create.assert_not_awaited()
+        call_args = mock_client.aio.models.generate_content.call_args
+        assert "x = 1" in call_args.kwargs["contents"]
+
+    async def test_cache_creation_failure_falls_back_inline(self):
+        """A failed cache creation must not fail the tool call."""
+        mock_client = self._mock_client("inline result")
+        mock_client.aio.caches.create = AsyncMock(side_effect=RuntimeError("too small"))
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                result = await server_module.gemini_analyze_codebase(
+                    self.LARGE_CODE, "review", session=True
+                )
+
+        assert result == "inline result"
+        call_args = mock_client.aio.models.generate_content.call_args
+        assert self.LARGE_CODE in call_args.kwargs["contents"]
+
+    async def test_rejected_cache_is_recreated_and_retried(self):
+        """A 404 on the cache reference should drop the cache, recreate it and retry once."""
+        mock_client = self._mock_client()
+        mock_response = MagicMock()
+        mock_response.text = "recovered"
+        mock_client.aio.models.generate_content = AsyncMock(
+            side_effect=[FakeAPIError(404), mock_response]
+        )
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                result = await server_module.gemini_analyze_codebase(
+                    self.LARGE_CODE, "review", session=True
+                )
+
+        assert result == "recovered"
+        mock_client.aio.caches.delete.assert_awaited_once_with(name="cachedContents/abc123")
+        assert mock_client.aio.caches.create.await_count == 2
+        assert server_module._context_caches.stats()["active"] == 1
+
+    async def test_repeated_rejection_raises(self):
+        mock_client = self._mock_client()
+        mock_client.aio.models.generate_content = AsyncMock(side_effect=FakeAPIError(403))
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with pytest.raises(FakeAPIError):
+                    await server_module.gemini_analyze_codebase(
+                        self.LARGE_CODE, "review", session=True
+                    )
+        assert mock_client.aio.models.generate_content.await_count == 2
+
+    @pytest.mark.parametrize(
+        "error", [RuntimeError("response blocked"), ValueError("bad JSON"), FakeAPIError(503)]
+    )
+    async def test_other_failures_keep_the_cache(self, error, monkeypatch):
+        monkeypatch.setattr(server_module, "MAX_RETRIES", 0)
+        mock_client = self._mock_client()
+        mock_client.aio.models.generate_content = AsyncMock(side_effect=error)
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with pytest.raises(type(error)):
+                    await server_module.gemini_analyze_codebase(
+                        self.LARGE_CODE, "review", session=True
+                    )
+
+        mock_client.aio.caches.delete.assert_not_awaited()
+        assert server_module._context_caches.stats()["active"] == 1
+
+
+class TestChunkedAnalysis:
+    @staticmethod
+    def _blob(edit=None):
+        files = []
+        for i in range(30):
+            body = "".join(f"def f{i}_{j}(): return {j}\n" for j in range(40))
+            if edit == i:
+                body += "# edited\n"
+            files.append(f'<file path="src/m{i:02d}.py">\n{body}\n</file>')
+        return "\n\n".join(files)
+
+    @staticmethod
+    def _echo_client():
+        async def generate(**kwargs):
+            response = MagicMock()
+            prompt = kwargs["contents"]
+            response.text = "SYNTHESIS" if "<partial_analysis" in prompt else "partial"
+            return response
+
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(side_effect=generate)
+        return mock_client
+
+    async def test_map_reduce_calls(self):
+        """Each shard is analyzed separately, followed by one synthesis call."""
+        mock_client = self._echo_client()
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with patch.object(server_module, "SHARD_TOKENS", 2_000):
+                    result = await server_module.gemini_analyze_codebase(
+                        self._blob(), "review", chunked=True
+                    )
+
+        assert result == "SYNTHESIS"
+        prompts = [
+            c.kwargs["contents"] for c in mock_client.aio.models.generate_content.call_args_list
+        ]
+        shard_prompts = [p for p in prompts if "<partial_analysis" not in p]
+        assert len(shard_prompts) > 1
+        assert len(prompts) == len(shard_prompts) + 1
+        assert prompts[-1].count("<partial_analysis") == len(shard_prompts)
+
+    async def test_rerun_after_one_file_change_redoes_one_shard(self):
+        """Unchanged shards are served from the response cache."""
+        mock_client = self._echo_client()
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with patch.object(server_module, "SHARD_TOKENS", 2_000):
+                    await server_module.gemini_analyze_codebase(
+                        self._blob(), "review", chunked=True
+                    )
+                    first_run = mock_client.aio.models.generate_content.await_count
+                    await server_module.gemini_analyze_codebase(
+                        self._blob(edit=7), "review", chunked=True
+                    )
+
+        second_run = mock_client.aio.models.generate_content.await_count - first_run
+        assert first_run > 3
+        # One changed shard; the synthesis prompt is unchanged because the
+        # mocked partial answers are identical, so it is a cache hit as well.
+        assert second_run == 1
+
+    async def test_small_content_chunked_is_single_call(self):
+        mock_client = self._echo_client()
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_analyze_codebase("x = 1", "review", chunked=True)
+        assert mock_client.aio.models.generate_content.await_count == 1
+
+    async def test_oversized_content_rejected_before_request(self):
+        """With the reject policy, oversized content fails fast unless chunked=True."""
+        mock_client = self._echo_client()
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with patch.object(server_module, "CONTEXT_WINDOW_TOKENS", 1_000):
+                    with patch.object(server_module, "OVERSIZE_POLICY", "reject"):
+                        with pytest.raises(ValueError, match="chunked=True"):
+                            await server_module.gemini_analyze_codebase(self._blob(), "review")
+        mock_client.aio.models.generate_content.assert_not_awaited()
+
+    async def test_oversized_content_auto_sharded(self):
+        """With the default shard policy, oversized content switches to map-reduce."""
+        mock_client = self._echo_client()
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with patch.object(server_module, "CONTEXT_WINDOW_TOKENS", 10_000):
+                    with patch.object(server_module, "SHARD_TOKENS", 2_000):
+                        result = await server_module.gemini_analyze_codebase(
+                            self._blob(), "review"
+                        )
+        assert result == "SYNTHESIS"
+        tools = server_module._metrics.snapshot()["tools"]
+        assert tools["gemini_analyze_codebase"]["auto_sharded"] == 1
+
+
+class TestAnalyzePaths:
+    @pytest.fixture(autouse=True)
+    def project(self, tmp_path, monkeypatch):
+        (tmp_path / "src").mkdir()
+        (tmp_path / "src" / "app.py").write_text("def main():\n    pass\n")
+        (tmp_path / "notes.log").write_text("ignore me\n")
+        (tmp_path / ".gitignore").write_text("*.log\n")
+        monkeypatch.chdir(tmp_path)
+        return tmp_path
+
+    async def test_reads_files_server_side(self):
+        """File contents should be assembled into the prompt by the bridge."""
+        mock_response = MagicMock()
+        mock_response.text = "analysis"
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(return_value=mock_response)
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                result = await server_module.gemini_analyze_paths(["."], "review")
+
+        assert result == "analysis"
+        contents = mock_client.aio.models.generate_content.call_args.kwargs["contents"]
+        assert '<file path="src/app.py">' in contents
+        assert "def main()" in contents
+        assert "ignore me" not in contents
+
+    async def test_path_outside_cwd_raises(self):
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with pytest.raises(PermissionError, match="Access denied"):
+                await server_module.gemini_analyze_paths(["/etc"], "review")
+
+    async def test_total_size_limit(self):
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch.object(server_module, "MAX_INGEST_BYTES", 10):
+                with pytest.raises(ValueError, match="too large"):
+                    await server_module.gemini_analyze_paths(["src"], "review")
+
+
+class TestSessionRoot:
+    @staticmethod
+    def _ctx(*uris):
+        """A context whose client declares the given MCP roots (none: no roots support)."""
+        ctx = MagicMock()
+        ctx.session.check_client_capability.return_value = bool(uris)
+        ctx.session.list_roots = AsyncMock(
+            return_value=MagicMock(roots=[MagicMock(uri=uri) for uri in uris])
+        )
+        return ctx
+
+    async def test_uses_first_file_root(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "app").mkdir()
+        ctx = self._ctx("https://example.com/", (tmp_path / "app").as_uri(), "file:///other")
+        assert await server_module._session_root(ctx) == (tmp_path / "app").resolve()
+
+    async def test_without_allow_list_roots_are_confined_to_working_directory(
+        self, tmp_path, monkeypatch
+    ):
+        monkeypatch.chdir(tmp_path)
+        for uri in ("file:///", tmp_path.parent.as_uri()):
+            with pytest.raises(PermissionError, match="working directory"):
+                await server_module._session_root(self._ctx(uri))
+
+    async def test_falls_back_to_working_directory(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        assert await server_module._session_root(None) == tmp_path.resolve()
+        assert await server_module._session_root(self._ctx()) == tmp_path.resolve()
+        failing = self._ctx("file:///x")
+        failing.session.list_roots.side_effect = RuntimeError("client went away")
+        assert await server_module._session_root(failing) == tmp_path.resolve()
+
+    async def test_root_outside_allow_list_is_refused(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(server_module, "ALLOWED_ROOTS", (tmp_path / "projects",))
+        (tmp_path / "projects" / "app").mkdir(parents=True)
+        allowed = self._ctx((tmp_path / "projects" / "app").as_uri())
+        assert await server_module._session_root(allowed) == tmp_path / "projects" / "app"
+        with pytest.raises(PermissionError, match="GEMINI_ALLOWED_ROOTS"):
+            await server_module._session_root(self._ctx(tmp_path.as_uri()))
+
+    async def test_tools_resolve_paths_against_client_root(self, tmp_path, monkeypatch):
+        project = tmp_path / "project"
+        (project / "screens").mkdir(parents=True)
+        (project / "screens" / "home.png").write_bytes(b"\x89PNG\r\n\x1a\n" + b"\0" * 50)
+        monkeypatch.chdir(tmp_path)
+        mock_response = MagicMock()
+        mock_response.text = "a home screen"
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(return_value=mock_response)
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                result = json.loads(
+                    await server_module.gemini_analyze_images(
+                        ["screens"], "Describe", ctx=self._ctx(project.as_uri())
+                    )
+                )
+                single = await server_module.gemini_analyze_image(
+                    "screens/home.png", "Describe", ctx=self._ctx(project.as_uri())
+                )
+                with pytest.raises(PermissionError, match="Access denied"):
+                    await server_module.gemini_analyze_image(
+                        str(tmp_path / "elsewhere.png"), "Describe",
+                        ctx=self._ctx(project.as_uri()),
+                    )
+
+        assert result["results"][0]["files"] == ["screens/home.png"]
+        assert single == "a home screen"
+
+
+class TestIncrementalAnalysis:
+    @pytest.fixture(autouse=True)
+    def project(self, tmp_path, monkeypatch):
+        (tmp_path / "a.py").write_text("def alpha():\n    return 1\n")
+        (tmp_path / "b.py").write_text("def beta():\n    return 2\n")
+        (tmp_path / "c.py").write_text("def gamma():\n    return 3\n")
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setattr(server_module, "INCREMENTAL", True)
+        return tmp_path
+
+    @staticmethod
+    def _client():
+        """Answer summary batches with JSON and record the analysis prompts."""
+        analyses = []
+
+        async def generate(*, model, contents, config):
+            response = MagicMock()
+            if "Summarize each file" in contents:
+                paths = re.findall(r'<file path="([^"]+)">', contents)
+                response.text = json.dumps(
+                    {"files": [{"path": p, "summary": f"Summary of {p}."} for p in paths]}
+                )
+            else:
+                analyses.append(contents)
+                response.text = f"analysis {len(analyses)}"
+            return response
+
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(side_effect=generate)
+        return mock_client, analyses
+
+    async def _analyze(self, mock_client, **kwargs):
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                return await server_module.gemini_analyze_paths(["."], "review", **kwargs)
+
+    async def test_follow_up_sends_changed_files_and_summaries(self, project):
+        mock_client, analyses = self._client()
+        await self._analyze(mock_client)
+        assert all(f'<file path="{name}">' in analyses[0] for name in ("a.py", "b.py", "c.py"))
+
+        (project / "b.py").write_text("def beta():\n    return 20\n")
+        result = await self._analyze(mock_client)
+        assert result == "analysis 2"
+        follow_up = analyses[1]
+        assert '<file path="b.py">' in follow_up and "return 20" in follow_up
+        assert '<file_summary path="a.py">\nSummary of a.py.\n</file_summary>' in follow_up
+        assert "def alpha" not in follow_up
+        stats = server_module._metrics.snapshot()["tools"]["gemini_analyze_paths"]
+        assert stats["incremental_runs"] == 1
+        assert stats["summarized_files"] == 4
+
+    async def test_unchanged_tree_sends_full_content(self):
+        mock_client, analyses = self._client()
+        await self._analyze(mock_client, cache=False)
+        await self._analyze(mock_client, cache=False)
+        assert analyses[0] == analyses[1]
+
+    async def test_removed_files_are_listed(self, project):
+        mock_client, analyses = self._client()
+        await self._analyze(mock_client)
+        (project / "c.py").unlink()
+        await self._analyze(mock_client)
+        assert "<removed_files>\nc.py\n</removed_files>" in analyses[1]
+        assert "<file path=" not in analyses[1]
+
+    async def test_full_sends_every_file(self, project):
+        mock_client, analyses = self._client()
+        await self._analyze(mock_client)
+        (project / "b.py").write_text("def beta():\n    return 20\n")
+        await self._analyze(mock_client, full=True)
+        assert "<file_summary" not in analyses[1]
+        assert "def alpha" in analyses[1] and "return 20" in analyses[1]
+
+    async def test_failed_summaries_fall_back_to_full_files(self, project):
+        mock_client, analyses = self._client()
+        generate = mock_client.aio.models.generate_content.side_effect
+
+        async def no_summaries(*, model, contents, config):
+            if "Summarize each file" in contents:
+                raise RuntimeError("boom")
+            return await generate(model=model, contents=contents, config=config)
+
+        mock_client.aio.models.generate_content.side_effect = no_summaries
+        with patch.object(server_module, "MAX_RETRIES", 0):
+            await self._analyze(mock_client)
+        (project / "b.py").write_text("def beta():\n    return 20\n")
+        mock_client.aio.models.generate_content.side_effect = generate
+        await self._analyze(mock_client)
+        assert "<file_summary" not in analyses[1]
+
+    async def test_disabled(self, project, monkeypatch):
+        monkeypatch.setattr(server_module, "INCREMENTAL", False)
+        mock_client, analyses = self._client()
+        await self._analyze(mock_client)
+        (project / "b.py").write_text("def beta():\n    return 20\n")
+        await self._analyze(mock_client)
+        assert mock_client.aio.models.generate_content.await_count == 2
+        assert "<file_summary" not in analyses[1]
+
+
+class TestRepoIndex:
+    @pytest.fixture(autouse=True)
+    def project(self, tmp_path, monkeypatch):
+        pytest.importorskip("numpy")
+        root = tmp_path / "project"
+        (root / "src").mkdir(parents=True)
+        (root / "src" / "retry.py").write_text("def backoff(attempt):\n    return 2 ** attempt\n")
+        (root / "src" / "cache.py").write_text("class Cache:\n    ttl = 60\n")
+        (root / "build.log").write_text("ignored\n")
+        (root / ".gitignore").write_text("*.log\n")
+        monkeypatch.chdir(root)
+        monkeypatch.setattr(server_module, "INDEX_DIR", str(tmp_path / "index"))
+        monkeypatch.setattr(server_module, "EMBEDDING_DIM", 3)
+        return root
+
+    @staticmethod
+    def _mock_client(answer="answer"):
+        def embed(model, contents, config):
+            # One dimension per topic keeps retrieval deterministic.
+            vectors = [
+                [float("backoff" in t), float("Cache" in t or "cache" in t), 0.1]
+                for t in contents
+            ]
+            return MagicMock(embeddings=[MagicMock(values=v) for v in vectors])
+
+        mock_response = MagicMock()
+        mock_response.text = answer
+        mock_client = MagicMock()
+        mock_client.aio.models.embed_content = AsyncMock(side_effect=embed)
+        mock_client.aio.models.generate_content = AsyncMock(return_value=mock_response)
+        return mock_client
+
+    @staticmethod
+    def _embedded(mock_client):
+        return [
+            (t, c.kwargs["config"].task_type)
+            for c in mock_client.aio.models.embed_content.call_args_list
+            for t in c.kwargs["contents"]
+        ]
+
+    async def test_index_then_ask_sends_only_top_chunks(self):
+        mock_client = self._mock_client("Backoff doubles per attempt.")
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                stats = json.loads(await server_module.gemini_index_repo())
+                result = await server_module.gemini_ask_repo("How is backoff computed?", top_k=1)
+
+        assert (stats["files"], stats["chunks"], stats["embedded_chunks"]) == (3, 3, 3)
+        assert result == "Backoff doubles per attempt."
+        prompt = mock_client.aio.models.generate_content.call_args.kwargs["contents"]
+        assert '<excerpt path="src/retry.py" lines="1-2"' in prompt
+        assert "return 2 ** attempt" in prompt
+        assert "class Cache" not in prompt
+        assert "ignored" not in prompt
+        config = mock_client.aio.models.embed_content.call_args.kwargs["config"]
+        assert config.task_type == "RETRIEVAL_QUERY"
+        assert config.output_dimensionality == server_module.EMBEDDING_DIM
+
+    async def test_ask_refreshes_changed_files_only(self, project):
+        mock_client = self._mock_client()
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_index_repo()
+                (project / "src" / "cache.py").write_text("class Cache:\n    ttl = 120\n")
+                mock_client.aio.models.embed_content.reset_mock()
+                await server_module.gemini_ask_repo("What is the cache TTL?")
+
+        embedded = self._embedded(mock_client)
+        assert [task for _, task in embedded] == ["RETRIEVAL_DOCUMENT", "RETRIEVAL_QUERY"]
+        assert embedded[0][0].startswith("src/cache.py:1-2")
+        prompt = mock_client.aio.models.generate_content.call_args.kwargs["contents"]
+        assert "ttl = 120" in prompt
+
+    async def test_ask_after_indexed_directory_was_deleted(self, project):
+        (project / "NOTES.md").write_text("Backoff notes.\n")
+        mock_client = self._mock_client()
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_index_repo(["src", "NOTES.md"])
+                for path in (project / "src").iterdir():
+                    path.unlink()
+                (project / "src").rmdir()
+                result = await server_module.gemini_ask_repo("How is backoff computed?")
+
+        assert result == "answer"
+        prompt = mock_client.aio.models.generate_content.call_args.kwargs["contents"]
+        assert '<excerpt path="NOTES.md"' in prompt
+        assert "src/" not in prompt
+
+    async def test_ask_skips_chunk_replaced_by_escaping_symlink(self, project, tmp_path):
+        (tmp_path / "secret.py").write_text("def backoff(): return 'TOKEN'\n")
+        mock_client = self._mock_client()
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_index_repo()
+                (project / "src" / "retry.py").unlink()
+                (project / "src" / "retry.py").symlink_to(tmp_path / "secret.py")
+                await server_module.gemini_ask_repo("How is backoff computed?", refresh=False)
+        prompt = mock_client.aio.models.generate_content.call_args.kwargs["contents"]
+        assert "TOKEN" not in prompt
+
+    async def test_ask_without_refresh_embeds_only_the_question(self, project):
+        mock_client = self._mock_client()
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_index_repo()
+                (project / "src" / "new.py").write_text("x = 1\n")
+                mock_client.aio.models.embed_content.reset_mock()
+                await server_module.gemini_ask_repo("q", refresh=False)
+        assert self._embedded(mock_client) == [("q", "RETRIEVAL_QUERY")]
+
+    async def test_ask_without_index_raises(self):
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=self._mock_client()):
+                with pytest.raises(ValueError, match="Run gemini_index_repo first"):
+                    await server_module.gemini_ask_repo("q")
+
+    async def test_top_k_bounds(self):
+        with pytest.raises(ValueError, match="top_k must be between"):
+            await server_module.gemini_ask_repo("q", top_k=500)
+
+    async def test_index_is_persisted_across_restarts(self):
+        mock_client = self._mock_client()
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_index_repo()
+                server_module._indexes = {}
+                mock_client.aio.models.embed_content.reset_mock()
+                stats = json.loads(await server_module.gemini_index_repo())
+        assert stats["embedded_chunks"] == 0
+        mock_client.aio.models.embed_content.assert_not_awaited()
+
+    async def test_missing_numpy_raises(self):
+        with patch.object(server_module, "numpy_available", return_value=False):
+            with pytest.raises(ImportError, match="gemini-bridge\\[index\\]"):
+                await server_module.gemini_index_repo()
+
+    async def test_embedding_counted_in_metrics(self):
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=self._mock_client()):
+                await server_module.gemini_index_repo()
+        metrics = json.loads(await server_module.gemini_metrics())
+        assert metrics["tools"]["gemini_index_repo"]["embedded_texts"] == 3
+        (index,) = metrics["indexes"].values()
+        assert index["chunks"] == 3
+
+
+class TestImageAnalysis:
+    @pytest.fixture(autouse=True)
+    def in_tmp_cwd(self, tmp_path, monkeypatch):
+        """Run inside a temp dir so image paths pass the working-directory guard."""
+        monkeypatch.chdir(tmp_path)
+
+    async def test_missing_image_raises_error(self, tmp_path):
+        """Should raise FileNotFoundError for non-existent image."""
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with pytest.raises(FileNotFoundError):
+                await server_module.gemini_analyze_image(
+                    str(tmp_path / "missing.png"), "Describe this"
+                )
+
+    async def test_path_outside_cwd_raises(self):
+        """Should raise PermissionError for paths outside the working directory."""
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with pytest.raises(PermissionError, match="Access denied"):
+                await server_module.gemini_analyze_image("/nonexistent/path.png", "Describe")
+
+    async def test_unsupported_mime_type_raises(self, tmp_path):
+        """Should raise ValueError for unsupported file types."""
+        tmp_file = tmp_path / "dummy.xyz"
+        tmp_file.write_bytes(b"dummy")
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with pytest.raises(ValueError, match="Unsupported file type"):
+                await server_module.gemini_analyze_image(str(tmp_file), "Describe this")
+
+    async def test_oversized_file_raises(self):
+        """Should raise ValueError for files exceeding MAX_IMAGE_SIZE."""
+        mock_path = MagicMock()
+        mock_path.resolve.return_value = mock_path
+        mock_path.exists.return_value = True
+        mock_stat = MagicMock()
+        mock_stat.st_size = 25 * 1024 * 1024  # 25 MB
+        mock_path.stat.return_value = mock_stat
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("gemini_bridge.server.Path", return_value=mock_path):
+                with pytest.raises(ValueError, match="File too large"):
+                    await server_module.gemini_analyze_image("/fake/large.png", "Describe")
+
+    async def test_successful_image_analysis(self, tmp_path):
+        """Should return analysis for valid image files."""
+        mock_response = MagicMock()
+        mock_response.text = "Image shows a dashboard"
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(return_value=mock_response)
+
+        tmp_file = tmp_path / "screenshot.png"
+        tmp_file.write_bytes(b"\x89PNG\r\n\x1a\n" + b"\x00" * 100)
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                result = await server_module.gemini_analyze_image(str(tmp_file), "Describe")
+        assert result == "Image shows a dashboard"
+
+    @staticmethod
+    def _upload_client():
+        mock_response = MagicMock()
+        mock_response.text = "A report"
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(return_value=mock_response)
+        uploaded = MagicMock()
+        uploaded.name = "files/abc"
+        uploaded.uri = "https://generativelanguage.googleapis.com/v1beta/files/abc"
+        uploaded.mime_type = "application/pdf"
+        uploaded.state = "ACTIVE"
+        mock_client.aio.files.upload = AsyncMock(return_value=uploaded)
+        return mock_client
+
+    async def test_large_pdf_uploaded_once(self, tmp_path):
+        """Repeated questions on a large PDF send a file reference, uploaded only once."""
+        pdf = tmp_path / "report.pdf"
+        pdf.write_bytes(b"%PDF-1.7\n" + b"x" * 5000)
+        mock_client = self._upload_client()
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with patch.object(server_module, "UPLOAD_MIN_BYTES", 1000):
+                    for question in ("Summarize", "List the tables"):
+                        assert await server_module.gemini_analyze_image(str(pdf), question)
+
+        mock_client.aio.files.upload.assert_awaited_once()
+        for call in mock_client.aio.models.generate_content.await_args_list:
+            part = call.kwargs["contents"][0]
+            assert part.file_data.file_uri.endswith("files/abc")
+            assert part.inline_data is None
+        stats = server_module._metrics.snapshot()["tools"]["gemini_analyze_image"]
+        assert stats["uploaded"] == 1
+        assert stats["upload_reused"] == 1
+
+    async def test_small_pdf_sent_inline(self, tmp_path):
+        pdf = tmp_path / "note.pdf"
+        pdf.write_bytes(b"%PDF-1.7\n" + b"x" * 100)
+        mock_client = self._upload_client()
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_analyze_image(str(pdf), "Summarize")
+
+        mock_client.aio.files.upload.assert_not_awaited()
+        part = mock_client.aio.models.generate_content.await_args.kwargs["contents"][0]
+        assert part.inline_data.data == pdf.read_bytes()
+
+    async def test_stale_upload_is_replaced(self, tmp_path):
+        """If Gemini no longer knows an uploaded file, upload it again and retry."""
+
+        class NotFound(Exception):
+            code = 404
+
+        pdf = tmp_path / "report.pdf"
+        pdf.write_bytes(b"%PDF-1.7\n" + b"x" * 5000)
+        mock_client = self._upload_client()
+        ok = MagicMock()
+        ok.text = "A report"
+        mock_client.aio.models.generate_content = AsyncMock(side_effect=[NotFound(), ok])
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with patch.object(server_module, "UPLOAD_MIN_BYTES", 1000):
+                    result = await server_module.gemini_analyze_image(str(pdf), "Summarize")
+
+        assert result == "A report"
+        assert mock_client.aio.files.upload.await_count == 2
+
+    async def test_large_screenshot_is_downscaled(self, tmp_path):
+        Image = pytest.importorskip("PIL.Image")
+        screenshot = tmp_path / "screen.png"
+        image = Image.new("RGB", (3000, 2000), (255, 255, 255))
+        for x in range(0, 3000, 5):
+            image.putpixel((x, x % 2000), (x % 256, 0, 0))
+        image.save(screenshot)
+        mock_client = self._upload_client()
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with patch.object(server_module, "IMAGE_MAX_EDGE", 1000):
+                    await server_module.gemini_analyze_image(str(screenshot), "Describe")
+
+        part = mock_client.aio.models.generate_content.await_args.kwargs["contents"][0]
+        assert part.inline_data.mime_type == "image/png"
+        assert len(part.inline_data.data) < screenshot.stat().st_size
+        stats = server_module._metrics.snapshot()["tools"]["gemini_analyze_image"]
+        assert stats["image_bytes_saved"] > 0
+
+
+class TestAnalyzeImages:
+    @pytest.fixture(autouse=True)
+    def screens(self, tmp_path, monkeypatch):
+        """Six fake screenshots plus a non-media file in a temp working directory."""
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "screens").mkdir()
+        for i in range(6):
+            (tmp_path / "screens" / f"step{i}.png").write_bytes(
+                b"\x89PNG\r\n\x1a\n" + bytes([i]) * 100
+            )
+        (tmp_path / "screens" / "notes.txt").write_text("not an image")
+
+    @staticmethod
+    def _client(delay=0.0, answer=lambda contents: "ok"):
+        async def generate(**kwargs):
+            await asyncio.sleep(delay)
+            response = MagicMock()
+            response.text = answer(kwargs["contents"])
+            return response
+
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(side_effect=generate)
+        return mock_client
+
+    async def test_per_image_runs_concurrently_in_order(self):
+        delay = 0.1
+        mock_client = self._client(delay, answer=lambda c: f"saw {c[0].inline_data.data[8]}")
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                start = time.perf_counter()
+                result = json.loads(
+                    await server_module.gemini_analyze_images(
+                        ["screens/*.png"], "List the fields", mode="per_image", max_parallel=6
+                    )
+                )
+                elapsed = time.perf_counter() - start
+
+        assert result["succeeded"] == 6
+        assert [r["path"] for r in result["results"]] == [
+            f"screens/step{i}.png" for i in range(6)
+        ]
+        assert [r["result"] for r in result["results"]] == [f"saw {i}" for i in range(6)]
+        assert elapsed < delay * 3
+
+    async def test_walk_skips_symlink_escaping_root(self, tmp_path, tmp_path_factory):
+        outside = tmp_path_factory.mktemp("outside")
+        (outside / "private.png").write_bytes(b"\x89PNG\r\n\x1a\n" + b"\xff" * 100)
+        (tmp_path / "screens" / "private.png").symlink_to(outside / "private.png")
+        mock_client = self._client()
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                result = json.loads(
+                    await server_module.gemini_analyze_images(
+                        ["screens"], "Describe", mode="per_image"
+                    )
+                )
+
+        assert "screens/private.png" not in [r["path"] for r in result["results"]]
+        assert result["succeeded"] == 6
+
+    async def test_per_image_reports_item_errors(self, tmp_path):
+        (tmp_path / "screens" / "huge.png").write_bytes(b"\x89PNG" + b"\x00" * 5000)
+        mock_client = self._client()
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with patch.object(server_module, "MAX_IMAGE_SIZE", 1000):
+                    result = json.loads(
+                        await server_module.gemini_analyze_images(
+                            ["screens"], "Describe", mode="per_image"
+                        )
+                    )
+
+        assert result["succeeded"] == 6
+        assert result["failed"] == 1
+        failed = [r for r in result["results"] if not r["ok"]]
+        assert failed[0]["path"] == "screens/huge.png"
+        assert "File too large" in failed[0]["error"]
+
+    async def test_joint_sends_one_labeled_request(self):
+        mock_client = self._client(answer=lambda c: "flow: login -> checkout")
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                result = json.loads(
+                    await server_module.gemini_analyze_images(["screens"], "Describe the flow")
+                )
+
+        assert mock_client.aio.models.generate_content.await_count == 1
+        contents = mock_client.aio.models.generate_content.await_args.kwargs["contents"]
+        assert contents[0] == "File: screens/step0.png"
+        assert sum(1 for c in contents if not isinstance(c, str)) == 6
+        assert contents[-1].startswith("Describe the flow")
+        assert result["results"] == [
+            {
+                "files": [f"screens/step{i}.png" for i in range(6)],
+                "ok": True,
+                "result": "flow: login -> checkout",
+            }
+        ]
+
+    async def test_joint_splits_at_budget(self):
+        mock_client = self._client()
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with patch.object(server_module, "JOINT_MAX_FILES", 4):
+                    with patch.object(server_module, "JOINT_MAX_BYTES", 250):
+                        result = json.loads(
+                            await server_module.gemini_analyze_images(["screens"], "Describe")
+                        )
+
+        # 108 bytes per file: two fit in 250 bytes.
+        assert [len(r["files"]) for r in result["results"]] == [2, 2, 2]
+        assert mock_client.aio.models.generate_content.await_count == 3
+
+    async def test_joint_results_follow_input_order(self, tmp_path):
+        (tmp_path / "screens" / "step3a.png").write_bytes(b"\x89PNG" + b"\x00" * 5000)
+        mock_client = self._client()
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with patch.object(server_module, "MAX_IMAGE_SIZE", 1000):
+                    with patch.object(server_module, "JOINT_MAX_FILES", 2):
+                        result = json.loads(
+                            await server_module.gemini_analyze_images(["screens"], "Describe")
+                        )
+
+        assert [(r["files"], r["ok"]) for r in result["results"]] == [
+            (["screens/step0.png", "screens/step1.png"], True),
+            (["screens/step2.png", "screens/step3.png"], True),
+            (["screens/step3a.png"], False),
+            (["screens/step4.png", "screens/step5.png"], True),
+        ]
+
+    async def test_no_media_files_raises(self):
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with pytest.raises(ValueError, match="No supported image"):
+                await server_module.gemini_analyze_images(["screens/*.txt"], "Describe")
+
+    async def test_invalid_mode_raises(self):
+        with pytest.raises(ValueError, match="mode"):
+            await server_module.gemini_analyze_images(["screens"], "Describe", mode="both")
+
+    async def test_paths_outside_cwd_rejected(self):
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with pytest.raises(PermissionError):
+                await server_module.gemini_analyze_images(["../*.png"], "Describe")
+
+
+class TestCompareApproaches:
+    async def test_returns_comparison(self):
+        """Should return Gemini's comparison on success."""
+        mock_response = MagicMock()
+        mock_response.text = "Approach A is better"
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(return_value=mock_response)
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                result = await server_module.gemini_compare_approaches(
+                    "scaling", "Redis", "PostgreSQL"
+                )
+        assert result == "Approach A is better"
+
+    async def test_includes_criteria(self):
+        """Should include criteria in prompt when provided."""
+        mock_response = MagicMock()
+        mock_response.text = "ok"
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(return_value=mock_response)
+
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                await server_module.gemini_compare_approaches(
+                    "scaling", "A", "B", criteria="performance, cost"
+                )
+                call_args = mock_client.aio.models.generate_content.call_args
+                contents = call_args.kwargs.get("contents", call_args[1].get("contents", ""))
+                assert "performance, cost" in contents
+
+    async def test_api_error_propagates(self):
+        """API errors should propagate."""
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(
+            side_effect=RuntimeError("Rate limited")
+        )
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                with pytest.raises(RuntimeError):
+                    await server_module.gemini_compare_approaches("p", "a", "b")
+
+
+
+class TestRankApproaches:
+    APPROACHES = ["option 2", "option 5", "option 1", "option 4", "option 3"]
+
+    @staticmethod
+    def _judge(fail=(), delay=0.0):
+        """A client whose verdicts prefer the approach with the higher option number."""
+        state = {"active": 0, "peak": 0}
+
+        async def generate(*, model, contents, config):
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+            await asyncio.sleep(delay)
+            state["active"] -= 1
+            a = int(re.search(r"<approach_a>\noption (\d+)", contents).group(1))
+            b = int(re.search(r"<approach_b>\noption (\d+)", contents).group(1))
+            if {a, b} & set(fail):
+                raise RuntimeError("upstream failed")
+            response = MagicMock()
+            winner = "tie" if a == b else ("approach_a" if a > b else "approach_b")
+            response.text = json.dumps({"rationale": f"{a} vs {b}", "winner": winner})
+            return response
+
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(side_effect=generate)
+        mock_client.state = state
+        return mock_client
+
+    async def _rank(self, mock_client, approaches=None, **kwargs) -> dict:
+        with patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            with patch("google.genai.Client", return_value=mock_client):
+                return json.loads(
+                    await server_module.gemini_rank_approaches(
+                        "Pick a design", approaches or self.APPROACHES, **kwargs
+                    )
+                )
+
+    async def test_pairwise_ranking(self):
+        mock_client = self._judge()
+        result = await self._rank(mock_client)
+        assert mock_client.aio.models.generate_content.await_count == 10
+        assert [r["summary"] for r in result["ranking"]] == [
+            "option 5", "option 4", "option 3", "option 2", "option 1"
+        ]
+        best = result["ranking"][0]
+        assert (best["rank"], best["approach"], best["wins"], best["losses"]) == (1, 2, 4, 0)
+        assert len(result["comparisons"]) == 10
+        assert result["failed"] == []
+        first = next(c for c in result["comparisons"] if c["approaches"] == [1, 2])
+        assert first["winner"] == 2
+
+    async def test_wins_method(self):
+        result = await self._rank(self._judge(), method="wins")
+        assert [r["score"] for r in result["ranking"]] == [4.0, 3.0, 2.0, 1.0, 0.0]
+
+    async def test_adding_an_approach_costs_only_new_pairs(self):
+        mock_client = self._judge()
+        await self._rank(mock_client, self.APPROACHES[:4])
+        assert mock_client.aio.models.generate_content.await_count == 6
+        # Reordered and extended: the six known pairs come from the cache.
+        result = await self._rank(mock_client, ["option 3", *reversed(self.APPROACHES[:4])])
+        assert mock_client.aio.models.generate_content.await_count == 6 + 4
+        assert result["ranking"][0]["summary"] == "option 5"
+        tool = server_module._metrics.snapshot()["tools"]["gemini_rank_approaches"]
+        assert tool["cache_hits"] == 6
+
+    async def test_parallelism_is_bounded(self):
+        mock_client = self._judge(delay=0.02)
+        await self._rank(mock_client, max_parallel=3)
+        assert mock_client.state["peak"] == 3
+
+    async def test_failed_comparisons_are_reported(self):
+        result = await self._rank(self._judge(fail=[1]))
+        assert len(result["failed"]) == 4
+        assert result["failed"][0]["error"] == "RuntimeError: upstream failed"
+        assert result["ranking"][0]["summary"] == "option 5"
+        assert len(result["comparisons"]) == 6
+
+    async def test_all_comparisons_failing_raises(self):
+        with pytest.raises(RuntimeError, match="upstream failed"):
+            await self._rank(self._judge(fail=[1]), ["option 1", "option 2"])
+
+    async def test_joint_mode_sends_one_request(self):
+        response = MagicMock()
+        response.text = json.dumps({
+            "ranking": [
+                {"approach": 2, "rationale": "fastest"},
+                {"approach": 9, "rationale": "does not exist"},
+                {"approach": 2, "rationale": "duplicate"},
+                {"approach": 3, "rationale": "simple"},
+            ],
+            "recommendation": "Use option 5.",
+        })
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(return_value=response)
+        result = await self._rank(mock_client, self.APPROACHES[:3], mode="joint")
+
+        assert mock_client.aio.models.generate_content.await_count == 1
+        contents = mock_client.aio.models.generate_content.await_args.kwargs["contents"]
+        assert '<approach id="3">\noption 1\n</approach>' in contents
+        assert [(r["approach"], r["rationale"]) for r in result["ranking"]] == [
+            (2, "fastest"),
+            (3, "simple"),
+            (1, "Not ranked by the model."),
+        ]
+        assert result["recommendation"] == "Use option 5."
+
+    @pytest.mark.parametrize(
+        ("approaches", "kwargs", "message"),
+        [
+            (["only one"], {}, "between 2 and"),
+            (["same", "same"], {}, "distinct"),
+            (["a", "  "], {}, "empty"),
+            (["a", "b"], {"mode": "swiss"}, "Unknown mode"),
+            (["a", "b"], {"method": "elo"}, "Unknown method"),
+        ],
+    )
+    async def test_rejects_invalid_input(self, approaches, kwargs, message):
+        with pytest.raises(ValueError, match=message):
+            await server_module.gemini_rank_approaches("p", approaches, **kwargs)
 
 
 # -- Integration Tests (require GEMINI_API_KEY) -------------------------------
@@ -344,22 +2731,22 @@ class TestCompareApproaches:
     reason="GEMINI_API_KEY not set -- skipping live API tests"
 )
 class TestLiveIntegration:
-    def test_live_status(self):
-        result = server_module.gemini_status()
+    async def test_live_status(self):
+        result = await server_module.gemini_status()
         assert "operational" in result.lower()
 
-    def test_live_analyze_text(self):
-        result = server_module.gemini_analyze_text("Reply with exactly: BRIDGE_TEST_OK")
+    async def test_live_analyze_text(self):
+        result = await server_module.gemini_analyze_text("Reply with exactly: BRIDGE_TEST_OK")
         assert "BRIDGE_TEST_OK" in result
 
-    def test_live_analyze_codebase(self):
+    async def test_live_analyze_codebase(self):
         sample_code = """
 def fibonacci(n: int) -> int:
     if n <= 1:
         return n
     return fibonacci(n - 1) + fibonacci(n - 2)
 """
-        result = server_module.gemini_analyze_codebase(
+        result = await server_module.gemini_analyze_codebase(
             code_content=sample_code,
             task="Identify performance issues and suggest improvements",
             language="Python"
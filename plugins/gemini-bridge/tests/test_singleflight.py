@@ -0,0 +1,143 @@
+"""
+Tests for request coalescing
+Run with: pytest tests/test_singleflight.py -v
+"""
+
+import asyncio
+
+import pytest
+
+from gemini_bridge.singleflight import KeyedLock, SingleFlight
+
+
+class TestSingleFlight:
+    async def test_concurrent_calls_share_one_result(self):
+        flights = SingleFlight()
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "result"
+
+        results = await asyncio.gather(*(flights.do("k", fn) for _ in range(5)))
+
+        assert len(calls) == 1
+        assert [r for r, _ in results] == ["result"] * 5
+        assert [shared for _, shared in results] == [False, True, True, True, True]
+        assert flights.stats() == {"calls": 5, "coalesced": 4, "in_flight": 0}
+
+    async def test_different_keys_run_separately(self):
+        flights = SingleFlight()
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return len(calls)
+
+        await asyncio.gather(flights.do("a", fn), flights.do("b", fn))
+        assert len(calls) == 2
+        assert flights.coalesced == 0
+
+    async def test_sequential_calls_are_not_coalesced(self):
+        flights = SingleFlight()
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            return len(calls)
+
+        assert await flights.do("k", fn) == (1, False)
+        assert await flights.do("k", fn) == (2, False)
+
+    async def test_error_propagates_to_all_callers(self):
+        flights = SingleFlight()
+
+        async def fn():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(
+            flights.do("k", fn), flights.do("k", fn), return_exceptions=True
+        )
+        assert all(isinstance(r, ValueError) for r in results)
+        assert flights.in_flight() == 0
+
+    async def test_cancelled_caller_does_not_cancel_others(self):
+        flights = SingleFlight()
+
+        async def fn():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        first = asyncio.create_task(flights.do("k", fn))
+        second = asyncio.create_task(flights.do("k", fn))
+        await asyncio.sleep(0.01)
+        first.cancel()
+
+        assert await second == ("done", True)
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    async def test_last_caller_cancelling_cancels_call(self):
+        flights = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def fn():
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        task = asyncio.create_task(flights.do("k", fn))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+        await asyncio.sleep(0)
+        assert flights.in_flight() == 0
+
+    async def test_last_cancellation_waits_for_call_to_unwind(self):
+        flights = SingleFlight()
+        unwound = []
+
+        async def fn():
+            try:
+                await asyncio.sleep(5)
+            finally:
+                unwound.append(1)
+
+        task = asyncio.create_task(flights.do("k", fn))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert unwound == [1]
+        assert flights.in_flight() == 0
+
+
+class TestKeyedLock:
+    async def test_serializes_per_key_and_forgets_idle_keys(self):
+        locks = KeyedLock()
+        order = []
+
+        async def work(key, n):
+            async with locks.hold(key):
+                order.append(("start", key, n))
+                await asyncio.sleep(0.01)
+                order.append(("end", key, n))
+
+        await asyncio.gather(work("a", 1), work("a", 2), work("b", 3))
+
+        starts = [entry for entry in order if entry[1] == "a"]
+        assert starts == [("start", "a", 1), ("end", "a", 1), ("start", "a", 2), ("end", "a", 2)]
+        assert order.index(("start", "b", 3)) < order.index(("end", "a", 1))
+        assert len(locks) == 0
+
+    async def test_lock_released_on_error(self):
+        locks = KeyedLock()
+        with pytest.raises(RuntimeError):
+            async with locks.hold("k"):
+                raise RuntimeError("boom")
+        assert len(locks) == 0
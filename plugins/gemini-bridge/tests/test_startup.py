@@ -0,0 +1,77 @@
+"""
+Startup-time regression tests
+Run with: pytest tests/test_startup.py -v
+
+The stdio transport starts one bridge process per Claude session, so time to
+a ready MCP handshake is paid on every session start. These tests keep the
+heavy Gemini SDK out of the startup path and hold the handshake to a budget
+(override with GEMINI_STARTUP_BUDGET_S on slow machines).
+"""
+
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+PLUGIN_DIR = Path(__file__).resolve().parent.parent
+STARTUP_BUDGET_S = float(os.environ.get("GEMINI_STARTUP_BUDGET_S", "1.2"))
+RUNS = 3
+
+
+def _env() -> dict:
+    env = {**os.environ, "PYTHONPATH": str(PLUGIN_DIR)}
+    env.pop("GEMINI_API_KEY", None)
+    return env
+
+
+def test_import_does_not_load_gemini_sdk():
+    """Importing the server (and answering without a key) must not import google.genai."""
+    script = (
+        "import asyncio, gemini_bridge.server as s\n"
+        "print(asyncio.run(s.gemini_status()))\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script],
+        cwd=PLUGIN_DIR,
+        env=_env(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert "GEMINI_API_KEY not set" in result.stdout
+    # -X importtime lines: "import time: self | cumulative | module"
+    sdk_imports = [
+        line for line in result.stderr.splitlines() if line.rstrip().endswith("google.genai")
+    ]
+    assert not sdk_imports, "\n".join(sdk_imports)
+
+
+async def _handshake_seconds() -> float:
+    params = StdioServerParameters(
+        command=sys.executable,
+        args=["-m", "gemini_bridge.server"],
+        env=_env(),
+        cwd=PLUGIN_DIR,
+    )
+    with open(os.devnull, "w") as errlog:
+        start = time.perf_counter()
+        async with stdio_client(params, errlog=errlog) as (read, write):
+            async with ClientSession(read, write) as session:
+                result = await session.initialize()
+                elapsed = time.perf_counter() - start
+    assert result.serverInfo.name == "gemini-bridge"
+    return elapsed
+
+
+async def test_cold_handshake_within_budget():
+    """A fresh stdio bridge must complete the MCP initialize handshake within budget."""
+    timings = [await _handshake_seconds() for _ in range(RUNS)]
+    best = min(timings)
+    assert best < STARTUP_BUDGET_S, (
+        f"cold handshake took {best:.2f}s (budget {STARTUP_BUDGET_S:.2f}s); "
+        f"runs: {', '.join(f'{t:.2f}s' for t in timings)}"
+    )
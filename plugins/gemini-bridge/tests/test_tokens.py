@@ -0,0 +1,54 @@
+"""
+Tests for Gemini Bridge token estimation
+Run with: pytest tests/ -v
+"""
+
+from unittest.mock import AsyncMock
+
+from gemini_bridge.tokens import CALIBRATION_MIN_CHARS, TokenEstimator, estimate_tokens
+
+
+class TestEstimateTokens:
+    def test_default_ratio(self):
+        assert estimate_tokens("") == 0
+        assert estimate_tokens("abcd") == 1
+        assert estimate_tokens("abcde") == 2
+
+    def test_custom_ratio(self):
+        assert estimate_tokens("abcdef", chars_per_token=2) == 3
+
+
+class TestTokenEstimator:
+    async def test_calibration_sets_ratio(self):
+        estimator = TokenEstimator()
+        text = "x" * CALIBRATION_MIN_CHARS
+        count = AsyncMock(return_value=CALIBRATION_MIN_CHARS // 2)
+        await estimator.calibrate("m", text, count)
+        assert estimator.is_calibrated("m")
+        assert estimator.ratio("m") == 2
+        assert estimator.estimate("m", "abcd") == 2
+        assert estimator.ratio("other") == 4
+
+    async def test_calibration_memoized_per_model(self):
+        estimator = TokenEstimator()
+        text = "x" * CALIBRATION_MIN_CHARS
+        count = AsyncMock(return_value=1_000)
+        await estimator.calibrate("m", text, count)
+        await estimator.calibrate("m", text, count)
+        assert count.await_count == 1
+
+    async def test_small_samples_skipped(self):
+        estimator = TokenEstimator()
+        count = AsyncMock(return_value=1)
+        await estimator.calibrate("m", "short", count)
+        count.assert_not_awaited()
+        assert not estimator.is_calibrated("m")
+
+    async def test_failure_falls_back_to_default_once(self):
+        estimator = TokenEstimator()
+        text = "x" * CALIBRATION_MIN_CHARS
+        count = AsyncMock(side_effect=RuntimeError("quota"))
+        await estimator.calibrate("m", text, count)
+        await estimator.calibrate("m", text, count)
+        assert count.await_count == 1
+        assert estimator.ratio("m") == 4
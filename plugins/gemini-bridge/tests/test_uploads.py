@@ -0,0 +1,92 @@
+"""
+Tests for the Files API upload cache
+Run with: pytest tests/test_uploads.py -v
+"""
+
+import asyncio
+
+from gemini_bridge.uploads import UploadCache, UploadedFile, digest_bytes, digest_file
+
+
+def _uploader():
+    calls = []
+
+    async def upload():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        n = len(calls)
+        return UploadedFile(name=f"files/{n}", uri=f"https://example/files/{n}", mime_type="x")
+
+    return upload, calls
+
+
+class TestUploadCache:
+    async def test_uploads_once_per_key(self):
+        cache = UploadCache()
+        upload, calls = _uploader()
+
+        first = await cache.get_or_upload("k", upload)
+        second = await cache.get_or_upload("k", upload)
+
+        assert first == second
+        assert len(calls) == 1
+        assert cache.stats() == {"active": 1, "uploaded": 1, "reused": 1}
+
+    async def test_concurrent_callers_share_upload(self):
+        cache = UploadCache()
+        upload, calls = _uploader()
+
+        results = await asyncio.gather(*(cache.get_or_upload("k", upload) for _ in range(5)))
+
+        assert len(calls) == 1
+        assert len(set(results)) == 1
+
+    async def test_expired_entry_is_uploaded_again(self):
+        cache = UploadCache(ttl_seconds=0)
+        upload, calls = _uploader()
+
+        await cache.get_or_upload("k", upload)
+        await cache.get_or_upload("k", upload)
+        assert len(calls) == 2
+
+    async def test_locks_do_not_accumulate(self):
+        cache = UploadCache()
+        upload, _ = _uploader()
+        await asyncio.gather(*(cache.get_or_upload(f"k{i}", upload) for i in range(5)))
+        assert len(cache._locks) == 0
+
+    async def test_invalidate(self):
+        cache = UploadCache()
+        upload, calls = _uploader()
+
+        await cache.get_or_upload("k", upload)
+        cache.invalidate("k")
+        second = await cache.get_or_upload("k", upload)
+        assert len(calls) == 2
+        assert second.name == "files/2"
+
+    async def test_clear_deletes_uploads_best_effort(self):
+        cache = UploadCache()
+        upload, _ = _uploader()
+        await cache.get_or_upload("a", upload)
+        await cache.get_or_upload("b", upload)
+        deleted = []
+
+        async def delete(name):
+            deleted.append(name)
+            raise ConnectionError("offline")
+
+        await cache.clear(delete)
+        assert sorted(deleted) == ["files/1", "files/2"]
+        assert cache.stats()["active"] == 0
+
+
+class TestDigest:
+    def test_file_digest_matches_bytes_digest(self, tmp_path):
+        data = b"%PDF" + bytes(range(256)) * 10_000
+        path = tmp_path / "doc.pdf"
+        path.write_bytes(data)
+        assert digest_file(path, "application/pdf") == digest_bytes(data, "application/pdf")
+
+    def test_mime_type_is_part_of_key(self):
+        assert digest_bytes(b"x", "image/png") != digest_bytes(b"x", "image/jpeg")